@@ -17,6 +17,12 @@ from timple.timedelta import strftimedelta
 from matplotlib import colormaps
 from matplotlib.collections import LineCollection
 import matplotlib.pyplot as plt
+from session_cache import load_dataframe
+from decimate import decimate
+from track_basemap import load_basemap
+
+# Pixels along the drawn track path, the coloured line is decimated to it
+MAP_WIDTH = 2000
 
 def load_car_data(json_file):
     with open(json_file, 'r') as f:
@@ -50,15 +56,11 @@ def get_driver_engineer(car_data, car_number):
             
     return "Unknown", "Unknown"
 
-from geopy.distance import geodesic  # Import geopy for distance calculation
+from geometry import distance_to_point  # Vectorised local-plane distances
 from matplotlib.colors import LinearSegmentedColormap
 
-def calculate_distance(point1, point2):
-    """Calculates distance between two GPS points."""
-    return geodesic(point1, point2).meters
-
 def process_file(file_path, driver, sector_data):
-    df = pd.read_csv(file_path, sep=';', decimal=',')
+    df = load_dataframe(file_path)
     print(df.columns)
 
     # Extract brake pressure and GPS coordinates
@@ -75,33 +77,34 @@ def process_file(file_path, driver, sector_data):
 
     brake_point = (latitudes[brake_idx], longitudes[brake_idx])
 
-    # Calculate distance from brake point to each sector's first coordinate
-    distances = []
-    for sector in sector_data:
-        sector_point = (float(sector["GPS_Lat1"]), float(sector["GPS_Long1"]))
-        distance = calculate_distance(brake_point, sector_point)
-        distances.append({
-            "sector": sector["Sector"],  # Correct key is "Sector" instead of "name"
-            "distance_to_brake_point": distance
-        })
+    # Calculate distance from brake point to every sector's first coordinate in one call
+    sector_lats = np.array([float(sector["GPS_Lat1"]) for sector in sector_data])
+    sector_longs = np.array([float(sector["GPS_Long1"]) for sector in sector_data])
+    sector_distances = distance_to_point(sector_lats, sector_longs, brake_point[0], brake_point[1])
+    distances = [
+        {"sector": sector["Sector"], "distance_to_brake_point": float(distance)}
+        for sector, distance in zip(sector_data, sector_distances)
+    ]
 
     # Select a sector to annotate on the plot (taking the first sector for simplicity)
     first_sector = sector_data[0]
-    first_sector_point = (float(first_sector["GPS_Lat1"]), float(first_sector["GPS_Long1"]))
-    distance_to_first_sector = calculate_distance(brake_point, first_sector_point)
+    distance_to_first_sector = distances[0]["distance_to_brake_point"]
 
     # Define a custom colormap from green to yellow to red
     green_yellow_red = LinearSegmentedColormap.from_list("GreenYellowRed", ["green", "yellow", "red"])
 
-    # Plotting logic
-    points = np.array([longitudes, latitudes]).T.reshape(-1, 1, 2)
+    # Plotting logic, min/max envelope of pBrakeF keeps every braking peak
+    keep = decimate(np.arange(len(pBrakeF)), pBrakeF, MAP_WIDTH, method='minmax')
+    points = np.array([longitudes[keep], latitudes[keep]]).T.reshape(-1, 1, 2)
     segments = np.concatenate([points[:-1], points[1:]], axis=1)
     
     # Apply the custom colormap
     lc_comp = LineCollection(segments, norm=plt.Normalize(pBrakeF.min(), pBrakeF.max()), cmap=green_yellow_red)
-    lc_comp.set_array(pBrakeF)
+    lc_comp.set_array(pBrakeF[keep])
     lc_comp.set_linewidth(2)
     
+    # Offline track outline underneath the coloured line
+    load_basemap(latitudes, longitudes).draw(plt.gca())
     plt.gca().add_collection(lc_comp)
     plt.axis('equal')
     plt.tick_params(labelleft=False, left=False, labelbottom=False, bottom=False)
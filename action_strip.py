@@ -0,0 +1,31 @@
+## Action strip
+#
+# Run-length encoding of the per-sample Action channel (Brake, Full
+# Throttle, Turning). The strip under the speed trace is drawn from the
+# runs, grouped per action class, so a lap becomes one bar trace per class
+# instead of one trace per run.
+
+import numpy as np
+
+
+def run_length_encode(values):
+    """Start index, stop index (exclusive) and value of every run of equal values."""
+    values = np.asarray(values)
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), values
+    starts = np.concatenate(([0], np.flatnonzero(values[1:] != values[:-1]) + 1))
+    stops = np.append(starts[1:], len(values))
+    return starts, stops, values[starts]
+
+
+def action_runs(actions, distance):
+    """Runs of each action class as {action: (base, length)} distance arrays.
+
+    base is the distance at the first sample of a run and length the
+    distance covered up to its last sample.
+    """
+    distance = np.asarray(distance, dtype=np.float64)
+    starts, stops, labels = run_length_encode(actions)
+    base = distance[starts]
+    length = distance[stops - 1] - base
+    return {str(action): (base[labels == action], length[labels == action]) for action in dict.fromkeys(labels)}
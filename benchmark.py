@@ -0,0 +1,206 @@
+## Benchmarks
+#
+# Times every processing stage on synthetic events (synthetic_telemetry.py)
+# of a given size, and appends the results to a JSON history so a run can
+# be compared with the previous one. Stages:
+#   parse        telemetry_loader.load_export, no cache
+#   cache        session_cache.load_export from a warm cache
+#   lap_index    LapIndex.from_export
+#   sectors      splitt.process_file
+#   reliability  reliab.process_file
+#   delta        fastest laps and time delta of each RS3 export against car 1
+#   plot         speed/action figure build (first MAX_PLOTS pairs)
+#   pdf          reliability and sector PDF layout from prepared fragments
+# Every stage is run --repeat times and the best time is kept. Scales are
+# presets below or CARSxLAPS. Exports are loaded one at a time inside the
+# stages, so memory stays at about one car whatever the scale; the files and
+# the cache still take disk space (about 130 MB each per 30-lap car, so
+# around 13 GB of each for 'event'; put --work on a disk with room).
+#
+#   python benchmark.py --scales lap session grid
+#   python benchmark.py --scales 4x8 --repeat 5 --label "after sector change"
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+SCALES = {
+    'lap': (1, 1),
+    'session': (2, 10),
+    'grid': (12, 15),
+    'event': (100, 30),
+}
+DEFAULT_SCALES = ('lap', 'session', 'grid')
+MAX_PLOTS = 3            # figure builds per scale, they dominate otherwise
+REGRESSION = 1.15        # flagged when slower than the previous run by this factor
+RESULTS_FILE = 'benchmark_results.json'
+
+
+def parse_scale(name):
+    """(cars, laps) of a preset name or a CARSxLAPS string."""
+    if name in SCALES:
+        return SCALES[name]
+    cars, laps = name.lower().split('x')
+    return int(cars), int(laps)
+
+
+# Helper function to time a stage: best of `repeat` runs of fn(item) over items,
+# with prepare(item) (loading, say) done before each call and left out of the time
+def time_stage(fn, items, repeat, prepare=None):
+    best = np.inf
+    for _ in range(repeat):
+        seconds = 0.0
+        for item in items:
+            if prepare is not None:
+                item = prepare(item)
+            start = time.perf_counter()
+            fn(item)
+            seconds += time.perf_counter() - start
+        best = min(best, seconds)
+    return best
+
+
+def run_scale(cars, laps, work_dir, repeat=3):
+    """{stage: {'seconds', 'rows'}} for one synthetic event."""
+    import synthetic_telemetry
+    import telemetry_loader
+    import session_cache
+    import reliab
+    import splitt
+    import speed_action_FL_2drivers_RS3export_plotly as speed_action
+    from lap_index import LapIndex
+
+    event_dir = os.path.join(work_dir, f"{cars}x{laps}")
+    start = time.perf_counter()
+    files = synthetic_telemetry.generate_event(event_dir, cars, laps)
+    generate_seconds = time.perf_counter() - start
+    wintax = [path for path in files if path.endswith('.txt')]
+    rs3 = [path for path in files if path.endswith('.csv')]
+
+    # Row counts only, the exports are not kept; loading them warms the cache for the cached stages
+    row_counts = {path: len(session_cache.load_export(path)) for path in files}
+    rows = sum(row_counts.values())
+    wintax_rows = sum(row_counts[path] for path in wintax)
+    pairs = [(rs3[0], other) for other in rs3[1:]] or [(rs3[0], rs3[0])]
+    pair_rows = sum(row_counts[a] + row_counts[b] for a, b in pairs)
+
+    def delta(pair):
+        laps_1 = speed_action.get_fastest_lap_data(*speed_action.load_data(pair[0]))
+        laps_2 = speed_action.get_fastest_lap_data(*speed_action.load_data(pair[1]))
+        speed_action.normalize_and_calculate_delta(laps_1, laps_2)
+
+    reliability_sections = [reliab.report_section(reliab.process_file(path), path, []) for path in wintax]
+    sector_pages = []
+    for path in wintax:
+        df = splitt.process_file(path)
+        df['File Name'] = os.path.basename(path)
+        sector_pages.append(splitt.sector_page(df))
+    pdf_dir = os.path.join(work_dir, 'pdf')
+    os.makedirs(pdf_dir, exist_ok=True)
+
+    def pdf(_):
+        reliab.build_pdf(reliability_sections, os.path.join(pdf_dir, 'reliability.pdf'))
+        splitt.build_pdf(sector_pages, os.path.join(pdf_dir, 'sectors.pdf'))
+
+    stages = {
+        'parse': (telemetry_loader.load_export, files, rows),
+        'cache': (session_cache.load_export, files, rows),
+        'lap_index': (LapIndex.from_export, files, rows),
+        'sectors': (splitt.process_file, wintax, wintax_rows),
+        'reliability': (reliab.process_file, wintax, wintax_rows),
+        'delta': (delta, pairs, pair_rows),
+        'plot': (lambda pair: speed_action.build_figure(*pair), pairs[:MAX_PLOTS],
+                 sum(row_counts[a] + row_counts[b] for a, b in pairs[:MAX_PLOTS])),
+        'pdf': (pdf, [None], wintax_rows),
+    }
+    # Stages fed an export instead of a path load it from the warm cache, untimed
+    prepare = {'lap_index': session_cache.load_export}
+    results = {'generate': {'seconds': generate_seconds, 'rows': rows}}
+    for name, (fn, items, stage_rows) in stages.items():
+        results[name] = {'seconds': time_stage(fn, items, repeat, prepare.get(name)), 'rows': stage_rows}
+    shutil.rmtree(event_dir, ignore_errors=True)
+    return results
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def previous_stages(history, scale):
+    """Stage results of the latest recorded run that has this scale."""
+    for run in reversed(history):
+        if scale in run['scales']:
+            return run['scales'][scale]['stages']
+    return {}
+
+
+def report_table(scale, stages, previous):
+    """Stage timings with the ratio to the previous run, '!' marks a regression."""
+    rows = []
+    for name, result in stages.items():
+        before = previous.get(name, {}).get('seconds')
+        ratio = result['seconds'] / before if before else np.nan
+        rows.append({
+            'scale': scale,
+            'stage': name,
+            'seconds': round(result['seconds'], 4),
+            'rows/s': int(result['rows'] / result['seconds']) if result['seconds'] > 0 else 0,
+            'vs previous': '' if np.isnan(ratio) else f"{ratio:.2f}x" + (' !' if ratio > REGRESSION else ''),
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the processing stages on synthetic events.")
+    parser.add_argument('--scales', nargs='+', default=list(DEFAULT_SCALES),
+                        help=f"presets {', '.join(SCALES)} or CARSxLAPS")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--results', default=RESULTS_FILE, help="JSON history the run is appended to")
+    parser.add_argument('--label', default='', help="note stored with the run")
+    parser.add_argument('--work', default=None, help="folder for the generated files (default: a temp folder)")
+    args = parser.parse_args()
+
+    work_dir = args.work or tempfile.mkdtemp(prefix='f4-benchmark-')
+    # Own cache so the benchmark neither reuses nor pollutes the real one
+    os.environ['F4_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+    history = load_history(args.results)
+    run = {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'label': args.label,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'scales': {},
+    }
+    tables = []
+    try:
+        for scale in args.scales:
+            cars, laps = parse_scale(scale)
+            print(f"{scale}: {cars} cars x {laps} laps")
+            stages = run_scale(cars, laps, work_dir, args.repeat)
+            run['scales'][scale] = {'cars': cars, 'laps': laps, 'stages': stages}
+            tables.append(report_table(scale, stages, previous_stages(history, scale)))
+    finally:
+        if args.work is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    history.append(run)
+    with open(args.results, 'w') as f:
+        json.dump(history, f, indent=2)
+    print(pd.concat(tables).to_string(index=False))
+    print(f"Results appended to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
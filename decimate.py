@@ -0,0 +1,105 @@
+## Decimation
+#
+# Level-of-detail downsampling for the plotting scripts. A lap at 200 Hz is
+# ~20k samples per channel, far more than the pixels a trace is drawn on,
+# so traces are cut down to a couple of points per pixel before they reach
+# Plotly or matplotlib (one LTTB point, or one min/max pair, per pixel):
+#
+#   lttb    largest-triangle-three-buckets, keeps the visual shape of smooth
+#           channels (speed, delta); the global max/min are always kept so
+#           Vmax and peak pressures survive
+#   minmax  min and max of every bucket, an envelope that keeps every peak
+#           (brake pressure, gear steps)
+
+import numpy as np
+
+POINTS_PER_PIXEL = 1
+
+
+def lttb_indices(x, y, n_out):
+    """Indices of the samples picked by largest-triangle-three-buckets."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # First and last samples are kept, the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[hi:next_hi].mean()
+        avg_y = y[hi:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        picked[i + 1] = a
+    return picked
+
+
+def minmax_indices(y, n_buckets):
+    """Indices of the min and max sample of every bucket, plus both ends."""
+    n = len(y)
+    if 2 * n_buckets >= n or n_buckets < 1:
+        return np.arange(n)
+    size = -(-n // n_buckets)
+    rows = -(-n // size)
+    pad = rows * size - n
+    finite = np.isfinite(y)
+    high = np.append(np.where(finite, y, -np.inf), np.full(pad, -np.inf)).reshape(rows, size)
+    low = np.append(np.where(finite, y, np.inf), np.full(pad, np.inf)).reshape(rows, size)
+    offsets = np.arange(rows) * size
+    picked = np.concatenate(([0, n - 1], offsets + high.argmax(axis=1), offsets + low.argmin(axis=1)))
+    return np.unique(picked[picked < n])
+
+
+def decimate(x, y, width, method='lttb', points_per_pixel=POINTS_PER_PIXEL):
+    """Sorted sample indices to draw x/y on a trace `width` pixels wide.
+
+    Non-finite samples are dropped. Use the indices for every channel that
+    shares the trace (e.g. colour arrays of a LineCollection).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    if len(valid) == 0:
+        return valid
+    xv, yv = x[valid], y[valid]
+    n_out = int(width * points_per_pixel)
+    if method == 'lttb':
+        picked = lttb_indices(xv, yv, n_out)
+        picked = np.union1d(picked, [np.argmax(yv), np.argmin(yv)])
+    elif method == 'minmax':
+        picked = minmax_indices(yv, n_out)
+    else:
+        raise ValueError(f"Unknown decimation method {method!r}")
+    return valid[picked]
+
+
+def downsample(x, y, width, method='lttb', points_per_pixel=POINTS_PER_PIXEL):
+    """Decimated copies of x and y (numpy arrays, pandas Series accepted)."""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    picked = decimate(x, y, width, method, points_per_pixel)
+    return x[picked], y[picked]
+
+
+def axes_pixel_width(ax):
+    """Drawn width of a matplotlib Axes in pixels."""
+    return int(np.ceil(ax.bbox.width))
+
+
+def distance_indices(distance, step):
+    """First sample of every `step` metres of distance, plus the last sample.
+
+    For traces drawn along the track (maps), where the spacing that matters
+    is metres of track rather than screen pixels.
+    """
+    distance = np.asarray(distance, dtype=np.float64)
+    valid = np.flatnonzero(np.isfinite(distance))
+    if len(valid) == 0:
+        return valid
+    bins = np.floor((distance[valid] - distance[valid[0]]) / step)
+    first = np.concatenate(([True], bins[1:] != bins[:-1]))
+    picked = valid[first]
+    return picked if picked[-1] == valid[-1] else np.append(picked, valid[-1])
@@ -1,28 +1,29 @@
 import pandas as pd
 import plotly.graph_objs as go
+from lap_delta import resample_laps, time_delta
+from decimate import downsample
+
+# Approximate plot width in pixels, the delta trace is decimated to it
+PLOT_WIDTH = 1600
 
 # Load the telemetry data for both drivers
 car1_data = pd.read_csv('car1_actions_plotly.csv')
 car2_data = pd.read_csv('car2_actions_plotly.csv')
 
-# Normalize time to start from zero for both drivers
-car1_data['Normalized Time'] = car1_data['Time'] - car1_data['Time'].iloc[0]
-car2_data['Normalized Time'] = car2_data['Time'] - car2_data['Time'].iloc[0]
-
-# Interpolate time over distance for alignment
-car1_interp = pd.Series(car1_data['Normalized Time'].values, index=car1_data['Distance']).reindex(car2_data['Distance'], method="nearest")
-car2_interp = pd.Series(car2_data['Normalized Time'].values, index=car2_data['Distance'])
+# Resample both laps onto a common 1 m distance grid (time normalized to start from zero)
+distance_grid, resampled = resample_laps([car1_data, car2_data])
 
 # Calculating the time delta (car2 - car1)
-lap_delta = car2_interp - car1_interp
+lap_delta = time_delta(resampled['Elapsed'])[1]
 
 # Create the plot
 fig = go.Figure()
 
 # Adding the Lap Delta line
+delta_x, delta_y = downsample(distance_grid, lap_delta, PLOT_WIDTH)
 fig.add_trace(go.Scatter(
-    x=car2_data['Distance'],
-    y=lap_delta,
+    x=delta_x,
+    y=delta_y,
     mode='lines',
     name='Lap Delta (Car 2 - Car 1)',
     line=dict(width=2)
@@ -30,8 +31,8 @@ fig.add_trace(go.Scatter(
 
 # Add a zero reference line
 fig.add_trace(go.Scatter(
-    x=car2_data['Distance'],
-    y=[0] * len(car2_data['Distance']),
+    x=[distance_grid[0], distance_grid[-1]],
+    y=[0, 0],
     mode='lines',
     name='Zero Reference',
     line=dict(color='gray', dash='dash')
@@ -0,0 +1,409 @@
+## Export streaming
+#
+# Reads WinTAX exports (Append_ files in particular, which hold every run
+# of a car appended into one file) in fixed-size row chunks instead of
+# loading them whole. Each chunk is a dict of typed column arrays; chunks
+# are split into runs where Time goes backwards or Logger_Lap goes back or
+# skips a lap, and every run is fed through incremental lap, sector and
+# reliability state:
+#   - laps are assembled from Logger_Lap and handed to lap_metrics as
+#     soon as the next lap starts (the first lap of each run is the out lap
+#     and is left out, like reliab.py),
+#   - sector boundaries are interpolated exactly as sector_times_by_lap
+#     does over a whole run; only the first and last sample of the current
+#     GPS fix are carried between chunks.
+# Memory is bounded by one lap of the channels read, whatever the file size.
+#
+#   python export_stream.py "Marelli WinTAX Exports/Qualifying/Append_Tr054_Abs00000132_F4-099_Lap0_cableData-SHRQ2.txt"
+#   python export_stream.py Append_*.txt --chunk-rows 20000 --all-channels
+
+import argparse
+import io
+import itertools
+import os
+import numpy as np
+import pandas as pd
+from telemetry_loader import SNIFF_BYTES, sniff_format, find_exports, _load_xlsx, _split_line, _channel_dtype
+from sector_timing import load_sectors, classify_samples, crossing_times, _fix_starts, sector_frame
+from reliability_metrics import METRICS, lap_metrics
+from track_model import load_circuits, circuit_gates
+from lap_index import LapIndex
+from profiling import profiled
+
+CHUNK_ROWS = 1 << 16
+CIRCUIT = 'MIC'
+BASE_CHANNELS = ('Time', 'Logger_Lap', 'GPS_Lat', 'GPS_Long')
+
+
+def stream_channels(metrics=None):
+    """Channels the lap, sector and reliability state need."""
+    names = list(BASE_CHANNELS)
+    for metric in METRICS if metrics is None else metrics:
+        names.extend(name for name in metric.channels if name not in names)
+    return names
+
+
+def export_columns(file_path, layout=None):
+    """(column positions, channel names) of a delimited export's header."""
+    with open(file_path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+    layout = layout or sniff_format(file_path, head)
+    names = _split_line(head.decode('latin-1').splitlines()[layout['header_row']], layout['delimiter'])
+    keep = [i for i, name in enumerate(names) if name != '']
+    return keep, [names[i] for i in keep]
+
+
+def parse_block(raw, layout, keep, names):
+    """{channel: array} of a block of complete data lines (bytes), typed like load_export."""
+    if layout['decimal'] == ',' or layout['prn_time']:
+        table = bytes.maketrans(b',:', b'..') if layout['prn_time'] else bytes.maketrans(b',', b'.')
+        raw = raw.translate(table)
+    frame = pd.read_csv(
+        io.BytesIO(raw),
+        sep=layout['delimiter'],
+        header=None,
+        usecols=keep,
+        dtype={i: _channel_dtype(name) for i, name in zip(keep, names)},
+        skip_blank_lines=True,
+        engine='c',
+    )
+    return {name: frame[i].to_numpy() for i, name in zip(keep, names)}
+
+
+def iter_chunks(file_path, chunk_rows=CHUNK_ROWS, channels=None):
+    """Yields {channel: array} chunks of chunk_rows samples (the last one shorter).
+
+    channels limits the columns parsed; names the export does not log are
+    skipped. xlsx sheets cannot be read in parts and are loaded whole.
+    """
+    layout = sniff_format(file_path)
+    if layout['kind'] == 'xlsx':
+        columns = _load_xlsx(file_path)
+        if channels is not None:
+            columns = {name: values for name, values in columns.items() if name in channels}
+        n = len(next(iter(columns.values()))) if columns else 0
+        for start in range(0, n, chunk_rows):
+            yield {name: values[start:start + chunk_rows] for name, values in columns.items()}
+        return
+
+    keep, names = export_columns(file_path, layout)
+    if channels is not None:
+        wanted = [(i, name) for i, name in zip(keep, names) if name in channels]
+        keep, names = [i for i, _ in wanted], [name for _, name in wanted]
+
+    with open(file_path, 'rb') as f:
+        for _ in range(layout['data_row']):
+            f.readline()
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                return
+            yield parse_block(b''.join(lines), layout, keep, names)
+
+
+class RunSplitter:
+    """Splits a chunk stream into runs: Time going backwards or Logger_Lap going back or skipping a lap starts a new one."""
+
+    def __init__(self):
+        self.run = 0
+        self.last_time = None
+        self.last_lap = None
+
+    def split(self, chunk):
+        """[(run number, chunk part)] of one chunk, in order."""
+        time = np.asarray(chunk['Time'], dtype=np.float64)
+        n = len(time)
+        if n == 0:
+            return []
+        previous = np.concatenate(([time[0] if self.last_time is None else self.last_time], time[:-1]))
+        breaks = time < previous
+        laps = chunk.get('Logger_Lap')
+        if laps is not None:
+            laps = np.asarray(laps, dtype=np.float64)
+            previous = np.concatenate(([laps[0] if self.last_lap is None else self.last_lap], laps[:-1]))
+            step = laps - previous
+            breaks |= (step < 0) | (step > 1)
+            self.last_lap = laps[-1]
+        self.last_time = time[-1]
+
+        parts = []
+        bounds = np.concatenate(([0], np.flatnonzero(breaks), [n]))
+        for i, (a, b) in enumerate(zip(bounds[:-1], bounds[1:])):
+            if i > 0:
+                self.run += 1
+            if b > a:
+                parts.append((self.run, {name: values[a:b] for name, values in chunk.items()}))
+        return parts
+
+
+class LapAssembler:
+    """Collects the samples of the current Logger_Lap and hands out each lap once the next one starts."""
+
+    def __init__(self):
+        self.parts = []
+        self.lap = None
+        self.samples = 0
+        self.numbers, self.start_times, self.first = [], [], []
+        self.last_time = np.nan
+
+    def _take(self):
+        lap = self.current()
+        self.parts = []
+        return lap
+
+    def feed(self, chunk):
+        """Laps completed by this chunk, as {channel: array} dicts."""
+        laps = np.asarray(chunk['Logger_Lap'])
+        n = len(laps)
+        if n == 0:
+            return []
+        previous = np.concatenate(([laps[0] if self.lap is None else self.lap], laps[:-1]))
+        starts = np.flatnonzero(laps != previous)
+        if self.lap is None:
+            starts = np.concatenate(([0], starts))
+        done = []
+        a = 0
+        for start in starts:
+            if start > a:
+                self.parts.append({name: values[a:start] for name, values in chunk.items()})
+            if self.parts:
+                done.append(self._take())
+            self.numbers.append(laps[start])
+            self.start_times.append(float(chunk['Time'][start]))
+            self.first.append(self.samples + start)
+            a = start
+        self.parts.append({name: values[a:] for name, values in chunk.items()})
+        self.lap = laps[-1]
+        self.samples += n
+        self.last_time = float(chunk['Time'][-1])
+        return done
+
+    def current(self):
+        """Samples of the lap in progress so far."""
+        if not self.parts:
+            return None
+        return {name: np.concatenate([part[name] for part in self.parts]) for name in self.parts[0]}
+
+    def flush(self):
+        """The last (unfinished) lap."""
+        return self._take() if self.parts else None
+
+    def index(self, min_lap=None, max_lap=None):
+        """LapIndex of the laps seen so far; sample offsets count from the start of the run."""
+        end_times = self.start_times[1:] + [self.last_time]
+        stop = self.first[1:] + [self.samples]
+        return LapIndex(self.numbers, self.start_times, end_times, self.first, stop, min_lap, max_lap)
+
+
+class SectorTimer:
+    """Sector times of one run fed in chunks, identical to sector_times_by_lap over the whole run.
+
+    Between chunks only the sample where the current GPS fix was first
+    logged and the last sample are kept, which is all the next crossing
+    interpolation reads: the samples in between repeat the same position.
+    """
+
+    def __init__(self, sectors):
+        self.sectors = sectors
+        self.sf = [s['Sector'] for s in sectors].index('SF')
+        self.tail = None          # (lat, lon, time) carried into the next chunk
+        self.state = None         # current sector, None before the first SF entry
+        self.boundary = None      # time the current sector was entered
+        self.row = np.zeros(len(sectors))
+        self.last_time = None
+
+    def feed(self, lat, lon, time):
+        """Per-sector time rows of the laps completed by this chunk."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        time = np.asarray(time, dtype=np.float64)
+        if not len(time):
+            return []
+        labels = classify_samples(lat, lon, self.sectors)
+        offset = 0
+        if self.tail is not None:
+            offset = len(self.tail[0])
+            lat, lon, time = (np.concatenate((old, new)) for old, new in zip(self.tail, (lat, lon, time)))
+        self.last_time = float(time[-1])
+        keep = np.unique([_fix_starts(lat, lon)[-1], len(time) - 1])
+        self.tail = (lat[keep], lon[keep], time[keep])
+
+        # Laps start at the first sample inside the SF box
+        begin = 0
+        if self.state is None:
+            hits = np.flatnonzero(labels == self.sf)
+            if not len(hits):
+                return []
+            begin = hits[0]
+
+        # Samples outside every box keep the previous sector, as in sector_runs
+        labels = labels[begin:]
+        valid = np.flatnonzero(labels >= 0)
+        last_valid = np.maximum.accumulate(np.where(labels >= 0, np.arange(len(labels)), -1))
+        carried = labels[valid[0]] if self.state is None else self.state
+        state = np.where(last_valid >= 0, labels[np.maximum(last_valid, 0)], carried)
+        previous = np.concatenate(([carried], state[:-1]))
+        changes = np.flatnonzero(state != previous)
+        if self.state is None:
+            changes = np.concatenate(([0], changes))
+        if not len(changes):
+            return []
+        run_starts = changes + begin + offset
+        run_sectors = state[changes]
+
+        # A leading placeholder run gives the first crossing its real previous sector
+        if self.state is not None:
+            run_starts = np.concatenate(([0], run_starts))
+            run_sectors = np.concatenate(([self.state], run_sectors))
+        boundaries = crossing_times(lat, lon, time, self.sectors, run_starts, run_sectors)
+        if self.state is not None:
+            boundaries, run_sectors = boundaries[1:], run_sectors[1:]
+
+        done = []
+        for boundary, sector in zip(boundaries, run_sectors):
+            if self.boundary is not None:
+                self.row[self.state] += boundary - self.boundary
+                if sector == self.sf:
+                    done.append(self.row)
+                    self.row = np.zeros(len(self.sectors))
+            self.state = int(sector)
+            self.boundary = boundary
+        return done
+
+    def flush(self):
+        """Closes the last lap at the final sample, like the whole-run timing."""
+        if self.boundary is None:
+            return []
+        self.row[self.state] += self.last_time - self.boundary
+        self.boundary = None
+        return [self.row]
+
+
+class RunStream:
+    """Lap, sector and reliability state of one run."""
+
+    def __init__(self, number, sectors, gates, metrics=None):
+        self.number = number
+        self.gates = gates
+        self.metrics = metrics
+        self.sectors = sectors
+        self.laps = LapAssembler()
+        self.timer = SectorTimer(sectors)
+        self.lap_count = 0
+        self.reliability = []
+        self.sector_rows = []
+
+    def _add_lap(self, lap):
+        # The first lap of every run is the out lap
+        if self.lap_count:
+            self.reliability.append(lap_metrics(lap, self.gates, self.metrics, skip_first_lap=False))
+        self.lap_count += 1
+
+    def feed(self, chunk):
+        """Laps completed by this chunk."""
+        done = self.laps.feed(chunk)
+        for lap in done:
+            self._add_lap(lap)
+        self.sector_rows.extend(self.timer.feed(chunk['GPS_Lat'], chunk['GPS_Long'], chunk['Time']))
+        return done
+
+    def finish(self):
+        lap = self.laps.flush()
+        if lap is not None:
+            self._add_lap(lap)
+        self.sector_rows.extend(self.timer.flush())
+
+    def tables(self):
+        """{'laps': LapIndex, 'reliability': lap_metrics table, 'sectors': sector_table report}."""
+        columns = ['Lap'] + [m.column for m in (METRICS if self.metrics is None else self.metrics)]
+        times = np.array(self.sector_rows).reshape(-1, len(self.sectors))
+        return {
+            'run': self.number,
+            'laps': self.laps.index(),
+            'reliability': pd.concat(self.reliability, ignore_index=True) if self.reliability
+            else pd.DataFrame(columns=columns),
+            'sectors': sector_frame(times, self.sectors),
+        }
+
+
+class ExportStream:
+    """Feeds chunks of one export through a RunStream per run."""
+
+    def __init__(self, sectors, gates, metrics=None):
+        self.sectors = sectors
+        self.gates = gates
+        self.metrics = metrics
+        self.splitter = RunSplitter()
+        self.runs = []
+
+    def feed(self, chunk):
+        """[(RunStream, completed lap)] for the laps this chunk completes."""
+        if 'Logger_Lap' not in chunk:
+            raise ValueError("Streaming needs the Logger_Lap channel")
+        done = []
+        for number, part in self.splitter.split(chunk):
+            if not self.runs or self.runs[-1].number != number:
+                if self.runs:
+                    self.runs[-1].finish()
+                self.runs.append(RunStream(number, self.sectors, self.gates, self.metrics))
+            done.extend((self.runs[-1], lap) for lap in self.runs[-1].feed(part))
+        return done
+
+    def finish(self):
+        if self.runs:
+            self.runs[-1].finish()
+
+    def tables(self):
+        return [run.tables() for run in self.runs]
+
+
+# Helper function to get the sector boxes and gates of a circuit from circuits.json
+def circuit_setup(circuit=CIRCUIT):
+    circuits = load_circuits()
+    return load_sectors(circuits[circuit]['sectors']), circuit_gates(circuit, circuits)
+
+
+@profiled
+def stream_export(file_path, chunk_rows=CHUNK_ROWS, circuit=CIRCUIT, metrics=None, channels=None):
+    """Per-run tables (see RunStream.tables) of one export, read chunk by chunk."""
+    sectors, gates = circuit_setup(circuit)
+    stream = ExportStream(sectors, gates, metrics)
+    channels = stream_channels(metrics) if channels is None else channels
+    for chunk in iter_chunks(file_path, chunk_rows, channels):
+        stream.feed(chunk)
+    stream.finish()
+    return stream.tables()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream exports chunk by chunk and print per-run lap, sector and reliability tables.")
+    parser.add_argument('sources', nargs='+', help="folders, globs or export files")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--circuit', default=CIRCUIT)
+    parser.add_argument('--all-channels', action='store_true', help="parse every column, not only the ones used")
+    args = parser.parse_args()
+
+    files = [path for path in find_exports(args.sources) if not path.lower().endswith('.xlsx')]
+    if not files:
+        print(f"No exports found in {args.sources}")
+        return 1
+    failed = False
+    for file_path in files:
+        try:
+            channels = export_columns(file_path)[1] if args.all_channels else None
+            runs = stream_export(file_path, args.chunk_rows, args.circuit, channels=channels)
+        except Exception as e:
+            print(f"{file_path}: FAILED {type(e).__name__}: {e}")
+            failed = True
+            continue
+        print(f"{os.path.basename(file_path)}: {len(runs)} run(s)")
+        for run in runs:
+            print(f"\nRun {run['run'] + 1}: {len(run['laps'])} laps")
+            print(run['laps'].to_frame().to_string(index=False))
+            print(run['sectors'].round(3).to_string(index=False))
+            print(run['reliability'].to_string(index=False))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -16,6 +16,12 @@ import fastf1.plotting
 from matplotlib import colormaps
 from matplotlib.collections import LineCollection
 import matplotlib.pyplot as plt
+from session_cache import load_dataframe
+from decimate import decimate
+from track_basemap import load_basemap
+
+# Pixels along the drawn track path, the coloured line is decimated to it
+MAP_WIDTH = 2000
 
 def load_car_data(json_file):
     with open(json_file, 'r') as f:
@@ -45,24 +51,28 @@ def get_driver_engineer(car_data, car_number):
     return "Unknown", "Unknown"
 
 def process_file(file_path,driver ):
-    df = pd.read_csv(file_path, sep=';', decimal=',')
+    df = load_dataframe(file_path)
     print(df.columns)
     
    
     
         
-    x = np.array(df['GPS_Lat'].values)
-    y = np.array(df['GPS_Long'].values)
+    # Min/max envelope of Gear along the lap keeps every shift
+    keep = decimate(np.arange(len(df)), df['Gear'], MAP_WIDTH, method='minmax')
+    x = df['GPS_Lat'].to_numpy()[keep]
+    y = df['GPS_Long'].to_numpy()[keep]
     
     points = np.array([y, x]).T.reshape(-1, 1, 2)
     segments = np.concatenate([points[:-1], points[1:]], axis=1)
-    gear = df['Gear'].to_numpy().astype(float)
+    gear = df['Gear'].to_numpy()[keep].astype(float)
     
     cmap = colormaps['Paired']
     lc_comp = LineCollection(segments, norm=plt.Normalize(1, cmap.N+1), cmap=cmap)
     lc_comp.set_array(gear)
     lc_comp.set_linewidth(4)
     
+    # Offline track outline underneath the coloured line
+    load_basemap(df['GPS_Lat'].to_numpy(), df['GPS_Long'].to_numpy()).draw(plt.gca())
     plt.gca().add_collection(lc_comp)
     plt.axis('equal')
     plt.tick_params(labelleft=False, left=False, labelbottom=False, bottom=False)
@@ -4,16 +4,21 @@ import plotly.graph_objects as go
 import plotly.io as pio
 from tkinter import Tk
 from tkinter.filedialog import askopenfilename
+from session_cache import load_export
+from lap_index import LapIndex
+from decimate import distance_indices
+from track_basemap import load_basemap
+
+# Acceptable fastest-lap range in seconds, filters out/in laps and outliers
+LAP_WINDOW = (95, 120)
+
+# Track map points are kept every MAP_STEP metres along the lap
+MAP_STEP = 2.0
 
 # Helper function to load metadata and telemetry
 def load_data(file_path):
-    metadata_df = pd.read_csv(file_path, nrows=14, header=None, engine='python')
-    telemetry_df = pd.read_csv(file_path, skiprows=14, low_memory=False)
-    
-    for col in telemetry_df.columns:
-        telemetry_df[col] = pd.to_numeric(telemetry_df[col], errors='coerce')
-    
-    return metadata_df, telemetry_df
+    export = load_export(file_path)
+    return export.metadata_frame(), export.to_dataframe()
 
 # Helper function to convert segment times
 def convert_time_to_seconds(time_str):
@@ -30,18 +35,11 @@ def get_fastest_lap_data(metadata_df, telemetry_df):
     # Convert segment times to seconds
     segment_times = [convert_time_to_seconds(time) for time in segment_times_raw if isinstance(time, str)]
     
-    # Remove outliers for lap times (acceptable range: 95 to 120 seconds)
-    laps_array = [time for time in segment_times if 95 <= time <= 120]
-    
-    # Calculate start and end timestamps for the fastest lap
-    fastest_lap_time = min(laps_array)
-    fastest_lap_index = segment_times.index(fastest_lap_time)
-    
-    start_time_stamp = sum(segment_times[:fastest_lap_index])
-    end_time_stamp = sum(segment_times[:fastest_lap_index + 1])
+    # Index every lap once (acceptable lap range: 95 to 120 seconds)
+    laps = LapIndex.from_segment_times(telemetry_df['Time'].to_numpy(), segment_times, *LAP_WINDOW)
     
-    # Filter telemetry data for the fastest lap
-    telemetry_FL = telemetry_df[(telemetry_df['Time'] >= start_time_stamp) & (telemetry_df['Time'] <= end_time_stamp)]
+    # Slice the fastest lap by sample offsets instead of boolean masks
+    telemetry_FL = laps.frame(laps.fastest(), telemetry_df)
     
     # Adjust the distance calculation to be relative to the start of the fastest lap
     start_distance = telemetry_FL['Distance on Vehicle Speed'].iloc[0]
@@ -49,54 +47,37 @@ def get_fastest_lap_data(metadata_df, telemetry_df):
     
     return telemetry_FL
 
+# Helper function to build one driver's track trace, decimated along the lap
+def map_trace(telemetry_FL, name, driver, color):
+    keep = distance_indices(telemetry_FL['Distance'], MAP_STEP)
+    lap = telemetry_FL.iloc[keep]
+    return go.Scattermapbox(
+        lon=lap['GPS Longitude'].to_numpy(),
+        lat=lap['GPS Latitude'].to_numpy(),
+        mode='lines',
+        name=name,
+        line=dict(width=4, color=color),
+        # Numeric hover data with one template instead of a label string per sample
+        customdata=np.round(np.column_stack([lap['Speed'].to_numpy(), lap['Distance'].to_numpy()]), 1),
+        hovertemplate=(f"{driver} Speed: %{{customdata[0]:.1f}} km/h<br>Distance: %{{customdata[1]:.0f}} m"
+                       "<br>Lat: %{lat:.6f}<br>Lon: %{lon:.6f}<extra></extra>"),
+    )
+
 # Function to generate a track map using GPS coordinates
 def generate_track_map(telemetry_FL_1, telemetry_FL_2, driver_1, car_1, driver_2, car_2):
     # Create figure
     fig = go.Figure()
 
-    # Plot Driver 1 track with latitude and longitude in hover text
-    fig.add_trace(go.Scattermapbox(
-        lon=telemetry_FL_1['GPS Longitude'], 
-        lat=telemetry_FL_1['GPS Latitude'],
-        mode='lines',
-        name=f'{driver_1} #({car_1})',
-        line=dict(width=4, color='blue'),
-        hoverinfo='text',
-        text=[
-            f"{driver_1} Speed: {speed} km/h<br>Lat: {lat}<br>Lon: {lon}"
-            for speed, lat, lon in zip(
-                telemetry_FL_1['Speed'], 
-                telemetry_FL_1['GPS Latitude'], 
-                telemetry_FL_1['GPS Longitude']
-            )
-        ]
-    ))
-
-    # Plot Driver 2 track with latitude and longitude in hover text
-    fig.add_trace(go.Scattermapbox(
-        lon=telemetry_FL_2['GPS Longitude'], 
-        lat=telemetry_FL_2['GPS Latitude'],
-        mode='lines',
-        name=f'{driver_2} #({car_2})',
-        line=dict(width=4, color='red'),
-        hoverinfo='text',
-        text=[
-            f"{driver_2} Speed: {speed} km/h<br>Lat: {lat}<br>Lon: {lon}"
-            for speed, lat, lon in zip(
-                telemetry_FL_2['Speed'], 
-                telemetry_FL_2['GPS Latitude'], 
-                telemetry_FL_2['GPS Longitude']
-            )
-        ]
-    ))
+    # Plot both drivers' tracks with speed, distance and position on hover
+    fig.add_trace(map_trace(telemetry_FL_1, f'{driver_1} #({car_1})', driver_1, 'blue'))
+    fig.add_trace(map_trace(telemetry_FL_2, f'{driver_2} #({car_2})', driver_2, 'red'))
 
-    # Update layout
+    # Update layout, the cached track outline replaces the Mapbox tiles
+    basemap = load_basemap(telemetry_FL_1['GPS Latitude'].to_numpy(), telemetry_FL_1['GPS Longitude'].to_numpy())
     fig.update_layout(
-        mapbox=dict(
-            style="carto-darkmatter",
-            center=dict(lat=telemetry_FL_1['GPS Latitude'].mean(), lon=telemetry_FL_1['GPS Longitude'].mean()),
+        mapbox=basemap.mapbox_layout(
             zoom=16,
-            accesstoken="sk.eyJ1Ijoib2Z0ZW4tY2FsbGVkLXBrIiwiYSI6ImNtMnFtd3ZveTB3aWIybHNiMmJvYjVubjcifQ.FGH6BkG6vZgFF0dMCYovjg", 
+            center=(telemetry_FL_1['GPS Latitude'].mean(), telemetry_FL_1['GPS Longitude'].mean()),
         ),
         title="Track Map Comparison: Fastest Lap",
         margin={"r":0,"t":0,"l":0,"b":0}
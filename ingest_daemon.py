@@ -0,0 +1,245 @@
+## Ingest daemon
+#
+# Watches the export folders (watchdog) and processes every new or changed
+# export as soon as the logger software has finished writing it:
+#   1. debounce: a file is taken once its size and mtime have not changed
+#      for --settle seconds, so half-copied exports are never parsed
+#   2. ingest: content hash, parse into the columnar cache (session_cache)
+#      and a row in the session catalog (session_catalog)
+#   3. jobs: the sector and reliability PDFs and the speed/action
+#      comparison of the export's session folder are rebuilt through
+#      report_pipeline, with the report_farm process pool, in the background
+# Exports written while the daemon was not running are picked up at start.
+# Jobs of a folder that is already waiting to run are not queued twice, so
+# a burst of exports after a session builds the reports once or twice, not
+# once per file. Reports go to OUT/<session folder>/.
+#
+#   python ingest_daemon.py                                   watches "Marelli WinTAX Exports"
+#   python ingest_daemon.py "Marelli WinTAX Exports" "RS3 Exports" --out reports --workers 4
+#   python ingest_daemon.py //server/share/exports --polling  network shares send no file events
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from watchdog.events import PatternMatchingEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
+import session_cache
+from session_catalog import CAR_FILE, SessionCatalog, load_car_lookup
+from telemetry_loader import EXPORT_PATTERNS, find_exports
+from report_pipeline import run_pipeline
+
+WATCH_FOLDERS = ('Marelli WinTAX Exports',)
+JOB_STEPS = ('reliability', 'sectors', 'comparison')
+SETTLE_SECONDS = 3.0     # unchanged size/mtime for this long = export fully written
+POLL_SECONDS = 0.5
+MAX_ATTEMPTS = 5         # parse failures before a file is given up on (until it changes again)
+
+
+def log(message):
+    print(f"{time.strftime('%H:%M:%S')} {message}", flush=True)
+
+
+class PendingExports:
+    """Files seen changing, released once they have been still for settle seconds."""
+
+    def __init__(self, settle=SETTLE_SECONDS):
+        self.settle = settle
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def touch(self, path):
+        with self.lock:
+            entry = self.entries.setdefault(os.path.abspath(path), {'stat': None, 'since': 0.0, 'attempts': 0})
+            entry['since'] = time.monotonic()
+
+    def ready(self):
+        """Paths whose size and mtime have not changed for settle seconds."""
+        now = time.monotonic()
+        ready = []
+        with self.lock:
+            for path, entry in list(self.entries.items()):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    del self.entries[path]      # deleted or moved away
+                    continue
+                signature = (stat.st_size, stat.st_mtime)
+                if signature != entry['stat']:
+                    entry['stat'], entry['since'] = signature, now
+                elif stat.st_size and now - entry['since'] >= self.settle:
+                    ready.append(path)
+        return ready
+
+    def done(self, path):
+        with self.lock:
+            self.entries.pop(path, None)
+
+    def failed(self, path):
+        """Counts a failed attempt; returns False once the file is given up on."""
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return False
+            entry['attempts'] += 1
+            entry['since'] = time.monotonic()
+            if entry['attempts'] >= MAX_ATTEMPTS:
+                del self.entries[path]
+                return False
+            return True
+
+
+class ExportEvents(PatternMatchingEventHandler):
+    """Feeds created, modified and moved-in exports to the pending set."""
+
+    def __init__(self, pending, ignore=()):
+        super().__init__(patterns=list(EXPORT_PATTERNS), ignore_directories=True, case_sensitive=False)
+        self.pending = pending
+        self.ignore = [os.path.abspath(path) + os.sep for path in ignore]
+
+    def on_any_event(self, event):
+        if event.event_type not in ('created', 'modified', 'moved', 'closed'):
+            return
+        path = os.path.abspath(event.dest_path if event.event_type == 'moved' else event.src_path)
+        if any(path.startswith(prefix) for prefix in self.ignore):
+            return
+        self.pending.touch(path)
+
+
+class IngestDaemon:
+    """Watch, debounce, ingest and schedule the report jobs."""
+
+    def __init__(self, folders, out_dir='reports', steps=JOB_STEPS, settle=SETTLE_SECONDS, workers=None,
+                 car_file=CAR_FILE, catalog_path=None, polling=False):
+        self.folders = [os.path.abspath(folder) for folder in folders]
+        self.out_dir = os.path.abspath(out_dir)
+        self.steps = tuple(steps)
+        self.workers = workers
+        self.car_file = car_file
+        self.car_lookup = load_car_lookup(car_file)
+        self.catalog = SessionCatalog(catalog_path)
+        self.pending = PendingExports(settle)
+        self.observer = PollingObserver() if polling else Observer()
+        # One job at a time; the reports themselves fan out over report_farm's pool
+        self.jobs = ThreadPoolExecutor(max_workers=1)
+        self.queued = {}          # folder -> settled exports of a job not started yet
+        self.queued_lock = threading.Lock()
+
+    def scan(self):
+        """Queues exports that are not catalogued with their current size and mtime."""
+        count = 0
+        folders = [path for folder in self.folders for path, _, _ in os.walk(folder)
+                   if not (path + os.sep).startswith(self.out_dir + os.sep)]
+        for path in find_exports(folders):
+            if not self.catalog.is_current(path):
+                self.pending.touch(path)
+                count += 1
+        return count
+
+    def ingest(self, path):
+        """Hashes, caches and catalogues one export; returns False if it was already current."""
+        if self.catalog.is_current(path):
+            return False
+        source_hash = session_cache.content_hash(path)
+        self.catalog.index_file(path, self.car_lookup, source_hash, force=True)
+        return True
+
+    def submit(self, folder):
+        # Only catalogued, unchanged exports: a file still being copied in is left to its own job
+        files = [path for path in find_exports([folder])
+                 if os.path.dirname(path) == folder and self.catalog.is_current(path)]
+        with self.queued_lock:
+            waiting = folder in self.queued
+            self.queued[folder] = files
+        if not waiting:
+            self.jobs.submit(self.run_jobs, folder)
+
+    def run_jobs(self, folder):
+        # Files arriving while the job runs queue it again
+        with self.queued_lock:
+            files = self.queued.pop(folder)
+        name = os.path.basename(folder)
+        out_dir = os.path.join(self.out_dir, name)
+        start = time.perf_counter()
+        try:
+            written, errors = run_pipeline(files, out_dir, self.steps, name, self.workers, self.car_file)
+        except Exception as e:
+            log(f"{name}: jobs FAILED {type(e).__name__}: {e}")
+            return
+        count = sum(len(paths) for paths in written.values())
+        log(f"{name}: {count} reports from {len(files)} exports in {out_dir} ({time.perf_counter() - start:.1f} s)")
+        for step, step_errors in errors.items():
+            for path, error in step_errors.items():
+                log(f"{name}: {step}: {path}: FAILED {error}")
+
+    def poll(self):
+        """Ingests the exports that have settled and schedules their folders; returns how many were ingested."""
+        folders = set()
+        for path in self.pending.ready():
+            try:
+                changed = self.ingest(path)
+            except Exception as e:
+                if self.pending.failed(path):
+                    log(f"{path}: not readable yet ({type(e).__name__}: {e}), retrying")
+                else:
+                    log(f"{path}: FAILED {type(e).__name__}: {e}")
+                continue
+            self.pending.done(path)
+            if changed:
+                log(f"ingested {path}")
+                folders.add(os.path.dirname(path))
+        for folder in sorted(folders):
+            self.submit(folder)
+        return len(folders)
+
+    def start(self):
+        handler = ExportEvents(self.pending, ignore=[self.out_dir])
+        for folder in self.folders:
+            self.observer.schedule(handler, folder, recursive=True)
+        self.observer.start()
+        log(f"watching {', '.join(self.folders)}; {self.scan()} exports to catch up on")
+
+    def stop(self):
+        self.observer.stop()
+        self.observer.join()
+        self.jobs.shutdown(wait=True)
+        self.catalog.close()
+
+    def run(self):
+        self.start()
+        try:
+            while True:
+                self.poll()
+                time.sleep(POLL_SECONDS)
+        except KeyboardInterrupt:
+            log("stopping, waiting for running jobs")
+        finally:
+            self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch export folders, ingest new exports and build their reports.")
+    parser.add_argument('folders', nargs='*', default=list(WATCH_FOLDERS), help="folders to watch (recursively)")
+    parser.add_argument('--out', default='reports', help="report folder, one subfolder per session folder")
+    parser.add_argument('--steps', nargs='+', default=list(JOB_STEPS), choices=list(JOB_STEPS))
+    parser.add_argument('--settle', type=float, default=SETTLE_SECONDS,
+                        help="seconds a file must stay unchanged before it is read")
+    parser.add_argument('--workers', type=int, default=None, help="report processes")
+    parser.add_argument('--db', default=None, help="catalog database (default: in the cache folder)")
+    parser.add_argument('--polling', action='store_true', help="poll the folders instead of OS file events")
+    args = parser.parse_args()
+
+    folders = [folder for folder in args.folders if os.path.isdir(folder)]
+    for folder in set(args.folders) - set(folders):
+        print(f"{folder} is not a folder, skipped")
+    if not folders:
+        return 1
+    IngestDaemon(folders, args.out, args.steps, args.settle, args.workers,
+                 catalog_path=args.db, polling=args.polling).run()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,64 @@
+## Lap delta
+#
+# Resamples any number of laps onto one common distance grid (1 m by
+# default) with linear interpolation, giving a (laps x grid) array per
+# channel. Time delta, speed delta and channel overlays for a whole grid of
+# cars are then single array operations instead of pairwise
+# reindex(method="nearest") alignments.
+
+import numpy as np
+
+
+def _monotonic(distance, *values):
+    """Drops samples where the distance does not increase, np.interp needs it sorted."""
+    distance = np.asarray(distance, dtype=np.float64)
+    finite = np.isfinite(distance)
+    distance = distance[finite]
+    values = [np.asarray(v, dtype=np.float64)[finite] for v in values]
+    keep = np.ones(len(distance), dtype=bool)
+    keep[1:] = distance[1:] > np.maximum.accumulate(distance)[:-1]
+    return (distance[keep], *[v[keep] for v in values])
+
+
+def resample_laps(laps, channels=(), step=1.0, distance='Distance', time='Time', length=None):
+    """Resamples laps onto a shared distance grid.
+
+    laps is a list of DataFrames / TelemetryExports with a lap-relative
+    distance column. Returns (grid, resampled) where resampled maps
+    'Elapsed' (seconds since the lap start) and every requested channel to
+    a (laps x grid) array. The grid stops at the shortest lap unless a
+    length is given; points past the end of a lap are NaN.
+    """
+    traces = []
+    for lap in laps:
+        d = np.asarray(lap[distance], dtype=np.float64)
+        t = np.asarray(lap[time], dtype=np.float64)
+        traces.append(_monotonic(d - d[0], t - t[0], *[lap[name] for name in channels]))
+
+    if length is None:
+        length = min(trace[0][-1] for trace in traces)
+    grid = np.arange(0.0, length + step / 2, step)
+    grid = grid[grid <= length]
+
+    names = ['Elapsed', *channels]
+    resampled = {name: np.full((len(laps), len(grid)), np.nan) for name in names}
+    for i, (d, *values) in enumerate(traces):
+        inside = grid <= d[-1]
+        for name, v in zip(names, values):
+            resampled[name][i, inside] = np.interp(grid[inside], d, v)
+    return grid, resampled
+
+
+def time_delta(elapsed, reference=0):
+    """Time gained (-) or lost (+) by every lap against the reference lap, per grid point."""
+    return elapsed - elapsed[reference]
+
+
+def channel_delta(values, reference=0):
+    """Difference of a resampled channel against the reference lap."""
+    return values - values[reference]
+
+
+def fastest_reference(elapsed):
+    """Row of the lap with the lowest elapsed time at the end of the grid."""
+    return int(np.nanargmin(elapsed[:, -1]))
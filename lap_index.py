@@ -0,0 +1,101 @@
+## Lap index
+#
+# Built once per session: start/end time, first/last sample offset, lap
+# time and a validity flag for every lap. Sample offsets are found with
+# searchsorted on the Time column, and any lap comes back as a slice of the
+# loaded arrays (views, no copy), so stint-long analyses don't rescan the
+# telemetry once per lap.
+#
+# RS3 exports carry the lap times in the "Segment Times" header row;
+# WinTAX exports mark laps with the Logger_Lap channel.
+
+import numpy as np
+import pandas as pd
+from telemetry_loader import TelemetryExport
+
+
+class LapIndex:
+    """Lap boundaries of one session."""
+
+    def __init__(self, numbers, start_times, end_times, first, stop, min_lap=None, max_lap=None):
+        self.numbers = np.asarray(numbers)
+        self.start_times = np.asarray(start_times, dtype=np.float64)
+        self.end_times = np.asarray(end_times, dtype=np.float64)
+        self.first = np.asarray(first, dtype=np.int64)   # first sample of each lap
+        self.stop = np.asarray(stop, dtype=np.int64)     # one past the last sample
+        self.lap_times = self.end_times - self.start_times
+        self.valid = np.isfinite(self.lap_times) & (self.stop > self.first)
+        if min_lap is not None:
+            self.valid &= self.lap_times >= min_lap
+        if max_lap is not None:
+            self.valid &= self.lap_times <= max_lap
+
+    @classmethod
+    def from_segment_times(cls, time, segment_times, min_lap=None, max_lap=None):
+        """Laps from RS3 segment times: lap k runs from sum(t[:k]) to sum(t[:k+1])."""
+        time = np.asarray(time, dtype=np.float64)
+        segment_times = np.asarray(segment_times, dtype=np.float64)
+        bounds = np.concatenate(([0.0], np.cumsum(segment_times)))
+        first = np.searchsorted(time, bounds[:-1], side='left')
+        stop = np.searchsorted(time, bounds[1:], side='right')
+        return cls(np.arange(len(segment_times)), bounds[:-1], bounds[1:], first, stop, min_lap, max_lap)
+
+    @classmethod
+    def from_logger_laps(cls, time, laps, min_lap=None, max_lap=None):
+        """Laps from the WinTAX Logger_Lap channel (contiguous runs of one value)."""
+        time = np.asarray(time, dtype=np.float64)
+        laps = np.asarray(laps)
+        first = np.concatenate(([0], np.flatnonzero(np.diff(laps) != 0) + 1))
+        stop = np.append(first[1:], len(laps))
+        # A lap ends where the next one starts
+        end_times = np.append(time[first[1:]], time[-1]) if len(laps) else np.zeros(0)
+        return cls(laps[first], time[first], end_times, first, stop, min_lap, max_lap)
+
+    @classmethod
+    def from_export(cls, export, min_lap=None, max_lap=None):
+        """Picks the lap source the export provides."""
+        if export.metadata.get('segment_times'):
+            return cls.from_segment_times(export['Time'], export.metadata['segment_times'], min_lap, max_lap)
+        if 'Logger_Lap' in export:
+            return cls.from_logger_laps(export['Time'], export['Logger_Lap'], min_lap, max_lap)
+        raise ValueError("Export has neither RS3 segment times nor a Logger_Lap channel")
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def valid_laps(self):
+        """Positions of the valid laps."""
+        return np.flatnonzero(self.valid)
+
+    def fastest(self):
+        """Position of the fastest valid lap."""
+        candidates = np.where(self.valid, self.lap_times, np.inf)
+        if not np.isfinite(candidates).any():
+            raise ValueError("No valid laps in session")
+        return int(np.argmin(candidates))
+
+    def slice(self, lap):
+        return slice(int(self.first[lap]), int(self.stop[lap]))
+
+    def view(self, lap, data):
+        """Columns of one lap as views into data (TelemetryExport or dict of arrays)."""
+        s = self.slice(lap)
+        columns = data.columns if isinstance(data, TelemetryExport) else data
+        metadata = dict(getattr(data, 'metadata', {}), lap=int(self.numbers[lap]))
+        return TelemetryExport({name: values[s] for name, values in columns.items()}, metadata)
+
+    def frame(self, lap, telemetry_df):
+        """Rows of one lap from a DataFrame (positional slice, no boolean mask)."""
+        return telemetry_df.iloc[self.slice(lap)]
+
+    def to_frame(self):
+        """Summary table of the index."""
+        return pd.DataFrame({
+            'Lap': self.numbers,
+            'Start': self.start_times,
+            'End': self.end_times,
+            'LapTime': self.lap_times,
+            'FirstSample': self.first,
+            'StopSample': self.stop,
+            'Valid': self.valid,
+        })
@@ -0,0 +1,234 @@
+## Live reliability
+#
+# Follows a WinTAX export while the logger is still writing it and keeps
+# the reliability numbers of reliab.py up to date as the car runs. Every
+# poll reads only the bytes appended since the last one (complete lines;
+# a half-written line waits for the next poll), parses them with the
+# export_stream block parser and adds them to a LapAccumulator for the lap
+# in progress. Runs are split like export_stream (Time reset, Logger_Lap
+# going back or skipping), so Append_ files work too.
+#
+# After every poll the lap in progress is checked against ALARM_LIMITS and
+# an alarm is printed the first time a metric crosses its limit in a lap,
+# so with the default 0.25 s poll an alarm lands well within a second of
+# the data. Each completed lap prints its row of the reliability table; the
+# whole table of every run is printed on Ctrl-C.
+#
+#   python live_reliability.py "Marelli WinTAX Exports/Testing/Tr301_Abs00000901_F4-042_Lap0_cableData.txt"
+#   python live_reliability.py export.txt --limits my_limits.json --interval 0.1
+#
+# A limits file maps reliability columns to [">", limit] or ["<", limit].
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from telemetry_loader import SNIFF_BYTES, sniff_format
+from export_stream import RunSplitter, export_columns, parse_block, stream_channels
+from reliability_metrics import METRICS, LapAccumulator, lap_segments
+from track_model import circuit_gates
+
+CIRCUIT = 'MIC'
+POLL_INTERVAL = 0.25     # seconds between reads of the export
+READ_BYTES = 8 << 20     # most bytes parsed per read, bounds catching up on a long file
+
+# Per-lap limits on the reliability columns
+ALARM_LIMITS = {
+    'tWat_avg': ('>', 102.0),
+    'tOil_max': ('>', 125.0),
+    'pOil_min': ('<', 2.5),
+    'Vbatt_avg': ('<', 12.5),
+    'Lockup_time': ('>', 1.0),
+    'Fuel': ('>', 2.5),
+}
+
+
+def load_limits(json_file):
+    with open(json_file, 'r') as f:
+        return {column: (op, float(limit)) for column, (op, limit) in json.load(f).items()}
+
+
+def breached(value, op, limit):
+    if not np.isfinite(value):
+        return False
+    return value > limit if op == '>' else value < limit
+
+
+class ExportTail:
+    """Complete data lines appended to an export since the previous read."""
+
+    def __init__(self, file_path, channels=None):
+        self.file_path = file_path
+        self.channels = channels
+        self.layout = None
+        self.offset = 0
+
+    def _open(self):
+        # Wait until the header and a first complete data row are on disk: a
+        # half-written row can hide the decimal comma and the layout is kept
+        with open(self.file_path, 'rb') as f:
+            head = f.read(SNIFF_BYTES)
+        head = head[:head.rfind(b'\n') + 1]
+        if not head:
+            return False
+        try:
+            layout = sniff_format(self.file_path, head)
+        except ValueError:
+            return False
+        if layout['kind'] == 'xlsx':
+            raise ValueError(f"{self.file_path}: xlsx exports cannot be followed")
+        keep, names = export_columns(self.file_path, layout)
+        if self.channels is not None:
+            wanted = [(i, name) for i, name in zip(keep, names) if name in self.channels]
+            keep, names = [i for i, _ in wanted], [name for _, name in wanted]
+        self.layout, self.keep, self.names = layout, keep, names
+        lines = head.split(b'\n')
+        self.offset = sum(len(line) + 1 for line in lines[:layout['data_row']])
+        return True
+
+    def read(self):
+        """{channel: array} of the new samples, None when nothing complete was added.
+
+        Raises EOFError if the file got shorter (rewritten from scratch).
+        """
+        if not os.path.exists(self.file_path):
+            return None
+        if self.layout is None and not self._open():
+            return None
+        size = os.path.getsize(self.file_path)
+        if size < self.offset:
+            self.layout = None
+            raise EOFError(f"{self.file_path} was truncated")
+        if size == self.offset:
+            return None
+        with open(self.file_path, 'rb') as f:
+            f.seek(self.offset)
+            raw = f.read(min(size - self.offset, READ_BYTES))
+        end = raw.rfind(b'\n') + 1
+        if end == 0:
+            return None
+        self.offset += end
+        return parse_block(raw[:end], self.layout, self.keep, self.names)
+
+
+class LiveMonitor:
+    """Per-lap reliability values and limit alarms over a stream of sample blocks."""
+
+    def __init__(self, gates, metrics=None, limits=None, on_alarm=None, on_lap=None):
+        self.gates = gates
+        self.metrics = METRICS if metrics is None else metrics
+        self.limits = ALARM_LIMITS if limits is None else limits
+        self.on_alarm = on_alarm or print_alarm
+        self.on_lap = on_lap or print_lap
+        self.splitter = RunSplitter()
+        self.run = None
+        self.lap = None
+        self.current = None
+        self.laps_in_run = 0
+        self.tables = {}          # run -> completed lap rows, out laps left out
+        self.raised = set()
+
+    def _close_lap(self):
+        if self.current is None:
+            return
+        self._check()
+        row = self.current.values()
+        # The first lap of every run is the out lap, as in reliab.py
+        if self.laps_in_run:
+            self.tables.setdefault(self.run, []).append(row)
+        self.on_lap(self.run, row, self.laps_in_run == 0)
+        self.laps_in_run += 1
+        self.current = None
+
+    def _check(self):
+        values = self.current.values()
+        for column, (op, limit) in self.limits.items():
+            key = (self.run, self.laps_in_run, column)
+            if column in values and key not in self.raised and breached(values[column], op, limit):
+                self.raised.add(key)
+                self.on_alarm(self.run, values['Lap'], column, values[column], op, limit)
+
+    def feed(self, chunk):
+        """Adds new samples; alarms and completed laps go to the callbacks."""
+        if 'Logger_Lap' not in chunk:
+            raise ValueError("Live mode needs the Logger_Lap channel")
+        for run, part in self.splitter.split(chunk):
+            if run != self.run:
+                self.close()
+                self.run, self.lap, self.laps_in_run = run, None, 0
+            laps = np.asarray(part['Logger_Lap'])
+            starts = lap_segments(laps)
+            stops = np.append(starts[1:], len(laps))
+            for a, b in zip(starts, stops):
+                if self.current is None or laps[a] != self.lap:
+                    period = self.current.period if self.current is not None else None
+                    self._close_lap()
+                    self.lap = laps[a]
+                    self.current = LapAccumulator(int(laps[a]), self.gates, self.metrics, period)
+                self.current.update({name: values[a:b] for name, values in part.items()})
+        if self.current is not None:
+            self._check()
+
+    def close(self):
+        """Closes the lap in progress (end of run or of the follow)."""
+        self._close_lap()
+
+    def frames(self):
+        """Reliability table of every run so far."""
+        columns = ['Lap'] + [m.column for m in self.metrics]
+        return {run: pd.DataFrame(rows, columns=columns) for run, rows in self.tables.items()}
+
+
+def print_alarm(run, lap, column, value, op, limit):
+    print(f"\a{time.strftime('%H:%M:%S')} ALARM run {run + 1} lap {lap}: {column} {value} {op} {limit}", flush=True)
+
+
+def print_lap(run, row, out_lap):
+    label = 'out lap' if out_lap else 'lap'
+    values = ', '.join(f"{column} {value}" for column, value in row.items() if column != 'Lap')
+    print(f"{time.strftime('%H:%M:%S')} run {run + 1} {label} {row['Lap']}: {values}", flush=True)
+
+
+def follow(file_path, monitor, interval=POLL_INTERVAL, stop=None):
+    """Polls the export and feeds the monitor until stop() is true (or forever)."""
+    tail = ExportTail(file_path, stream_channels(monitor.metrics))
+    while stop is None or not stop():
+        try:
+            chunk = tail.read()
+        except EOFError as e:
+            print(f"{e}, starting over")
+            monitor.close()
+            tail = ExportTail(file_path, tail.channels)
+            continue
+        if chunk is not None and len(chunk['Time']):
+            monitor.feed(chunk)
+        else:
+            time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Follow a growing export and raise reliability alarms.")
+    parser.add_argument('file', help="WinTAX export being written")
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL, help="seconds between polls")
+    parser.add_argument('--limits', default=None, help="JSON file of alarm limits")
+    parser.add_argument('--circuit', default=CIRCUIT)
+    args = parser.parse_args()
+
+    limits = load_limits(args.limits) if args.limits else ALARM_LIMITS
+    monitor = LiveMonitor(circuit_gates(args.circuit), limits=limits)
+    print(f"Following {args.file} (Ctrl-C to stop)")
+    try:
+        follow(args.file, monitor, args.interval)
+    except KeyboardInterrupt:
+        pass
+    monitor.close()
+    for run, frame in monitor.frames().items():
+        print(f"\nRun {run + 1}")
+        print(frame.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
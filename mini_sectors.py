@@ -0,0 +1,69 @@
+## Mini-sectors
+#
+# Splits the lap into fixed-length distance bins and times every driver
+# through each bin from their laps resampled onto a common distance grid
+# (lap_delta.resample_laps), so bins compare the same piece of track for
+# every driver. The fastest driver per bin is then an argmin over the
+# (drivers x bins) time table, for any number of drivers.
+
+import numpy as np
+
+MINI_SECTOR_LENGTH = 50.0   # metres per mini-sector
+
+
+def mini_sector_edges(length, bin_length=MINI_SECTOR_LENGTH):
+    """Bin edges from 0 to length; the last bin takes the remainder."""
+    edges = np.arange(0.0, length, bin_length)
+    return np.append(edges, length)
+
+
+def mini_sector_times(grid, elapsed, bin_length=MINI_SECTOR_LENGTH):
+    """Bin edges and the (drivers x bins) time each driver spent in every bin."""
+    edges = mini_sector_edges(grid[-1], bin_length)
+    at_edges = np.vstack([np.interp(edges, grid, row, left=np.nan, right=np.nan) for row in elapsed])
+    return edges, np.diff(at_edges, axis=1)
+
+
+def fastest_driver(times):
+    """Row of the fastest driver in every bin, -1 where nobody has a time."""
+    owner = np.full(times.shape[1], -1)
+    timed = np.isfinite(times).any(axis=0)
+    owner[timed] = np.nanargmin(times[:, timed], axis=0)
+    return owner
+
+
+def time_gained(times):
+    """Margin of the fastest driver over the next fastest in every bin (s)."""
+    if len(times) < 2:
+        return np.zeros(times.shape[1])
+    ranked = np.sort(np.where(np.isfinite(times), times, np.inf), axis=0)
+    with np.errstate(invalid='ignore'):
+        gained = ranked[1] - ranked[0]
+    return np.where(np.isfinite(gained), gained, np.nan)
+
+
+def grid_bins(grid, edges):
+    """Mini-sector index of every grid point."""
+    return np.clip(np.searchsorted(edges, grid, side='right') - 1, 0, len(edges) - 2)
+
+
+def owner_paths(grid, edges, owner, *channels):
+    """{driver row: (grid positions, channel values)} of the bins each driver owns.
+
+    Runs of owned bins are separated by a break (position -1, values NaN)
+    so one line trace per driver draws all of them. Each run reaches one
+    grid point into the next bin so neighbouring colours meet.
+    """
+    point_owner = owner[grid_bins(grid, edges)]
+    paths = {}
+    for row in np.unique(owner[owner >= 0]):
+        mine = point_owner == row
+        mine[1:] |= mine[:-1]
+        # Keep owned points plus the first point after every run as the break
+        breaks = np.zeros(len(mine), dtype=bool)
+        breaks[1:] = mine[:-1] & ~mine[1:]
+        keep = np.flatnonzero(mine | breaks)
+        positions = np.where(mine[keep], keep, -1)
+        paths[int(row)] = (positions, [np.where(positions >= 0, np.asarray(c, dtype=np.float64)[keep], np.nan)
+                                       for c in channels])
+    return paths
@@ -0,0 +1,217 @@
+## Profiling hooks
+#
+# Stage timing for the processing functions, off unless F4_PROFILE is set.
+# Functions decorated with @profiled (or code in `with stage(...)`) record
+# wall time, CPU time, rows processed and peak traced memory. At exit each
+# process prints a summary table and writes a Chrome trace
+# (chrome://tracing or https://ui.perfetto.dev) to the profile folder,
+# including report_farm / track_map_batch pool workers.
+#
+#   F4_PROFILE=1 python report_pipeline.py "Marelli WinTAX Exports/Qualifying"     -> ./profiles/
+#   F4_PROFILE=/tmp/prof python splitt.py
+#   python profiling.py profiles/      merge every trace in a folder into one, with a summary
+#
+# Peak memory comes from tracemalloc, which slows allocation-heavy code
+# (matplotlib rendering several times over) while profiling is on; set
+# F4_PROFILE_MEMORY=0 to time without it. With F4_PROFILE unset the
+# decorator returns the function unchanged.
+
+import atexit
+import functools
+import glob
+import json
+import multiprocessing.util
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+PROFILE_DIR = 'profiles'
+
+
+def profile_dir():
+    """Trace folder from F4_PROFILE, or None when profiling is off."""
+    value = os.environ.get('F4_PROFILE', '')
+    if value in ('', '0'):
+        return None
+    return PROFILE_DIR if value == '1' else value
+
+
+ENABLED = profile_dir() is not None
+TRACE_MEMORY = os.environ.get('F4_PROFILE_MEMORY', '1') != '0'
+
+_events = []
+_stack = []              # [absolute tracemalloc peak, largest child row count] of the open stages
+_lock = threading.Lock()
+_registered_pid = None
+
+
+def count_rows(value):
+    """Sample count of a DataFrame, array or export (largest one inside a tuple), else None."""
+    if isinstance(value, (tuple, list)):
+        counts = [count_rows(item) for item in value]
+        counts = [c for c in counts if c is not None]
+        return max(counts) if counts else None
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)) or hasattr(value, 'columns') and hasattr(value, 'metadata'):
+        return len(value)
+    return None
+
+
+def _register_exit():
+    # Pool workers leave through os._exit, which skips atexit but runs multiprocessing finalizers
+    global _registered_pid
+    if _registered_pid == os.getpid():
+        return
+    _registered_pid = os.getpid()
+    _events.clear()
+    atexit.register(write_profile)
+    multiprocessing.util.Finalize(None, write_profile, exitpriority=100)
+
+
+class stage:
+    """Context manager recording one stage.
+
+    rows can be set inside the block; otherwise the stage reports the
+    largest row count of the stages nested in it, then result_rows.
+    """
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self.result_rows = None
+
+    def __enter__(self):
+        if not ENABLED:
+            return self
+        _register_exit()
+        if TRACE_MEMORY and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        current, peak = tracemalloc.get_traced_memory()
+        if _stack:
+            _stack[-1][0] = max(_stack[-1][0], peak)
+        if TRACE_MEMORY:
+            tracemalloc.reset_peak()
+        _stack.append([current, None])
+        self._start_memory = current
+        self._ts = time.time_ns() // 1000
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        if not ENABLED:
+            return False
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        peak, child_rows = _stack.pop()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        rows = next((r for r in (self.rows, child_rows, self.result_rows) if r is not None), None)
+        if _stack:
+            _stack[-1][0] = max(_stack[-1][0], peak)
+            if rows is not None:
+                _stack[-1][1] = max(_stack[-1][1] or 0, rows)
+        with _lock:
+            _events.append({
+                'name': self.name, 'ts': self._ts, 'wall': wall, 'cpu': cpu, 'rows': rows,
+                'peak': peak - self._start_memory if TRACE_MEMORY else None, 'tid': threading.get_ident(),
+                'error': exc[0].__name__ if exc[0] else None,
+            })
+        return False
+
+
+def profiled(fn=None, name=None):
+    """Decorator recording every call of fn as a stage; rows from the arguments, nested stages or the result."""
+    def wrap(fn):
+        if not ENABLED:
+            return fn
+        label = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(label, count_rows(args)) as s:
+                result = fn(*args, **kwargs)
+                s.result_rows = count_rows(result)
+                return result
+        return wrapper
+    return wrap(fn) if fn is not None else wrap
+
+
+def summary(events):
+    """Per-stage totals: calls, wall and CPU seconds, rows, rows/s and peak MB."""
+    if not events:
+        return pd.DataFrame(columns=['stage', 'calls', 'wall_s', 'cpu_s', 'rows', 'rows/s', 'peak_MB'])
+    frame = pd.DataFrame(events)
+    frame['rows'] = pd.to_numeric(frame['rows'], errors='coerce')
+    frame['peak'] = pd.to_numeric(frame['peak'], errors='coerce')
+    table = frame.groupby('name', sort=False).agg(
+        calls=('wall', 'size'), wall_s=('wall', 'sum'), cpu_s=('cpu', 'sum'),
+        rows=('rows', lambda rows: rows.sum(min_count=1)), peak_MB=('peak', 'max'))
+    table['rows/s'] = (table['rows'] / table['wall_s']).where(table['rows'] > 0).round(0)
+    table['peak_MB'] = (table['peak_MB'] / 2 ** 20).round(1)
+    table = table.reset_index().rename(columns={'name': 'stage'}).sort_values('wall_s', ascending=False)
+    return table[['stage', 'calls', 'wall_s', 'cpu_s', 'rows', 'rows/s', 'peak_MB']].round(4)
+
+
+def chrome_trace(events, pid=None, process_name=None):
+    """Chrome trace events ('X' complete events, microseconds) of recorded stages."""
+    pid = os.getpid() if pid is None else pid
+    trace = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': process_name or str(pid)}}]
+    for event in events:
+        trace.append({
+            'name': event['name'], 'cat': 'stage', 'ph': 'X', 'pid': pid, 'tid': event['tid'],
+            'ts': event['ts'], 'dur': round(event['wall'] * 1e6),
+            'args': {'cpu_s': round(event['cpu'], 6), 'rows': event['rows'],
+                     'peak_MB': None if event['peak'] is None else round(event['peak'] / 2 ** 20, 2),
+                     'error': event['error']},
+        })
+    return trace
+
+
+def write_profile():
+    """Prints this process's summary and writes its trace; registered at the first stage."""
+    with _lock:
+        events = list(_events)
+        _events.clear()
+    if not events:
+        return
+    directory = profile_dir() or PROFILE_DIR
+    script = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python'
+    process_name = script if multiprocessing.parent_process() is None else f"{script} worker"
+    path = os.path.join(directory, f"{script}-{os.getpid()}.trace.json")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': chrome_trace(events, process_name=process_name),
+                       'displayTimeUnit': 'ms', 'stages': events}, f)
+    except OSError as e:
+        print(f"Could not write profile trace: {e}")
+        return
+    if multiprocessing.parent_process() is None:
+        print(f"\nProfile ({process_name}, trace {path}):")
+        print(summary(events).to_string(index=False))
+
+
+def merge_traces(directory, out_path=None):
+    """Combines every trace in a folder into one Chrome trace; returns (path, summary table)."""
+    trace, events = [], []
+    for path in sorted(glob.glob(os.path.join(directory, '*.trace.json'))):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        trace.extend(data['traceEvents'])
+        events.extend(data.get('stages', []))
+    out_path = out_path or os.path.join(directory, 'merged.json')
+    with open(out_path, 'w') as f:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+    return out_path, summary(events)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python profiling.py PROFILE_DIR [OUT.json]")
+        raise SystemExit(1)
+    merged, table = merge_traces(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print(table.to_string(index=False))
+    print(f"Merged trace written to {merged}")
@@ -0,0 +1,149 @@
+## Pyramid
+#
+# Multi-resolution min/max/mean aggregates of a few channels over a whole
+# session, at power-of-two bucket sizes (2, 4, 8, ... samples). Built once
+# at ingest next to the cached export; a viewer picks the level matching
+# the zoom window so it never touches more than about `width` buckets,
+# whether it shows a 40 minute session or one braking zone. Below the
+# finest level the raw (memory-mapped) samples are used.
+#
+# Stored as an uncompressed .npz, keys "<bucket>:x" and
+# "<bucket>:<channel>:<min|max|mean>"; levels are read lazily. The x
+# channel (Time by default) is made increasing first: Append_ exports
+# restart Time at every run, so each run is laid after the previous one
+# (session_time) and windows are given in that session time.
+
+import os
+import numpy as np
+
+# Channels aggregated at ingest (WinTAX and RS3 names)
+PYRAMID_CHANNELS = ('CarSpeed', 'pBrakeF', 'rPedal', 'Speed', 'GPS Speed', 'Brake Press', 'Throttle Pos')
+MIN_BUCKETS = 256        # coarsest level keeps at least this many buckets
+PYRAMID_VERSION = 2
+
+
+def session_time(x):
+    """x made increasing: after every reset a run continues one sample period after the previous one."""
+    x = np.asarray(x, dtype=np.float64)
+    resets = np.flatnonzero(np.diff(x) < 0) + 1
+    if not len(resets):
+        return x
+    steps = np.diff(x)
+    period = np.median(steps[steps > 0]) if (steps > 0).any() else 0.0
+    x = x.copy()
+    for start in resets:
+        x[start:] += x[start - 1] + period - x[start]
+    return x
+
+
+def _halve(low, high, total, count):
+    """Merges neighbouring buckets pairwise."""
+    if len(low) % 2:
+        low = np.append(low, np.inf)
+        high = np.append(high, -np.inf)
+        total = np.append(total, 0.0)
+        count = np.append(count, 0)
+    return (low.reshape(-1, 2).min(axis=1), high.reshape(-1, 2).max(axis=1),
+            total.reshape(-1, 2).sum(axis=1), count.reshape(-1, 2).sum(axis=1))
+
+
+def build_levels(x, channels, min_buckets=MIN_BUCKETS):
+    """Pyramid arrays for {name: values} sampled at x (see session_time)."""
+    x = session_time(x)
+    n = len(x)
+    arrays = {'version': np.array(PYRAMID_VERSION), 'channels': np.array(list(channels), dtype=str)}
+    buckets = []
+    state = {}
+    for name, values in channels.items():
+        values = np.asarray(values, dtype=np.float64)
+        finite = np.isfinite(values)
+        state[name] = (np.where(finite, values, np.inf), np.where(finite, values, -np.inf),
+                       np.where(finite, values, 0.0), finite.astype(np.int64))
+
+    bucket = 2
+    while n // bucket >= min_buckets:
+        buckets.append(bucket)
+        arrays[f'{bucket}:x'] = x[::bucket]
+        for name in channels:
+            low, high, total, count = state[name] = _halve(*state[name])
+            with np.errstate(invalid='ignore', divide='ignore'):
+                arrays[f'{bucket}:{name}:mean'] = np.where(count > 0, total / count, np.nan).astype(np.float32)
+            arrays[f'{bucket}:{name}:min'] = np.where(count > 0, low, np.nan).astype(np.float32)
+            arrays[f'{bucket}:{name}:max'] = np.where(count > 0, high, np.nan).astype(np.float32)
+        bucket *= 2
+    arrays['buckets'] = np.array(buckets, dtype=np.int64)
+    return arrays
+
+
+class Pyramid:
+    """Zoom-level access to the aggregates of one session.
+
+    arrays is the build_levels dict or an opened .npz; raw is the export
+    (anything indexable by channel name) used below the finest level.
+    """
+
+    def __init__(self, arrays, raw=None, x_name='Time'):
+        self.arrays = arrays
+        self.raw = raw
+        self.x_name = x_name
+        self.buckets = [int(b) for b in arrays['buckets']]
+        self.channels = [str(c) for c in arrays['channels']]
+        self._loaded = {}
+
+    @classmethod
+    def build(cls, export, channels=PYRAMID_CHANNELS, x_name='Time', min_buckets=MIN_BUCKETS):
+        present = {name: export[name] for name in channels if name in export}
+        return cls(build_levels(export[x_name], present, min_buckets), export, x_name)
+
+    @classmethod
+    def load(cls, path, raw=None, x_name='Time'):
+        arrays = np.load(path)
+        if int(arrays['version']) != PYRAMID_VERSION:
+            raise ValueError(f"{path} is an old pyramid version")
+        return cls(arrays, raw, x_name)
+
+    def save(self, path):
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **{key: self.arrays[key] for key in self.arrays})
+        os.replace(tmp_path, path)
+
+    def _get(self, key):
+        if key not in self._loaded:
+            self._loaded[key] = self.arrays[key]
+        return self._loaded[key]
+
+    def _x(self, bucket):
+        if bucket == 1:
+            if 'raw:x' not in self._loaded:
+                self._loaded['raw:x'] = session_time(self.raw[self.x_name])
+            return self._loaded['raw:x']
+        return self._get(f'{bucket}:x')
+
+    def level_for(self, x0, x1, width):
+        """Smallest bucket size showing [x0, x1] in at most `width` buckets (1 = raw)."""
+        levels = ([1] if self.raw is not None else []) + self.buckets
+        # Sample count of the window from the raw x, or estimated from the coarsest level
+        lo, hi = np.searchsorted(self._x(levels[0] if self.raw is not None else levels[-1]), [x0, x1])
+        samples = hi - lo if self.raw is not None else (hi - lo + 1) * levels[-1]
+        for bucket in levels:
+            if samples <= width * bucket:
+                return bucket
+        return levels[-1]
+
+    def window(self, channel, x0=None, x1=None, width=2000):
+        """(x, min, max, mean) of channel over [x0, x1] (session time) at the matching level."""
+        if channel not in self.channels:
+            raise KeyError(f"{channel} is not in the pyramid")
+        x_all = self._x(self.buckets[-1] if self.buckets else 1)
+        x0 = x_all[0] if x0 is None else x0
+        x1 = x_all[-1] if x1 is None else x1
+        bucket = self.level_for(x0, x1, width)
+        x = self._x(bucket)
+        # One bucket of margin either side so lines run to the window edges
+        lo = max(int(np.searchsorted(x, x0)) - 1, 0)
+        hi = int(np.searchsorted(x, x1, side='right')) + 1
+        if bucket == 1:
+            values = np.asarray(self.raw[channel], dtype=np.float64)[lo:hi]
+            return x[lo:hi], values, values, values
+        return (x[lo:hi], self._get(f'{bucket}:{channel}:min')[lo:hi],
+                self._get(f'{bucket}:{channel}:max')[lo:hi], self._get(f'{bucket}:{channel}:mean')[lo:hi])
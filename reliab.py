@@ -1,13 +1,19 @@
 import tkinter as tk
 from tkinter import filedialog, simpledialog
-import pandas as pd
-import numpy as np
 import re
 import json
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet
+from session_cache import load_export
+from reliability_metrics import lap_metrics, highlight_cells
+from track_model import circuit_gates
+from profiling import profiled
+
+# Speed trap and brake zone gates come from circuits.json
+CIRCUIT = 'MIC'
+GATES = circuit_gates(CIRCUIT)
 
 # Load car data from the JSON file
 def load_car_data(json_file):
@@ -31,101 +37,91 @@ def extract_run_and_car(filename):
 
 def get_driver_engineer(car_data, car_number):
     """Looks up the driver and engineer based on the car number."""
+    if not str(car_number).isdigit():
+        return "Unknown", "Unknown"
     for entry in car_data:
         if entry["car"] == int(car_number):
             return entry["driver"], entry["engineer"]
     return "Unknown", "Unknown"
 
+@profiled
 def process_file(file_path):
-    df = pd.read_csv(file_path, sep=';', decimal=',')
+    data = load_export(file_path)
+
+    # All per-lap statistics in one pass over the lap segments
+    return lap_metrics(data, GATES)
+
+def report_section(data, file_path, car_data):
+    """Title, table rows and highlighted cells of one run, plain lists that pickle to a report worker."""
+    # Extract run number and car number from the filename
+    filename = file_path.split('/')[-1]
+    run_number, car_number = extract_run_and_car(filename)
+    
+    # Look up driver and engineer names based on car number
+    driver, engineer = get_driver_engineer(car_data, car_number)
     
-    # Ensure 'Time' and 'DistanceLap' are treated as numeric values
-    df['Time'] = pd.to_numeric(df['Time'], errors='coerce')
-    df['DistanceLap'] = pd.to_numeric(df['DistanceLap'], errors='coerce')
+    # Convert the data to a list of lists for easier processing
+    # Highlight rules come from the metric registry (+1 row for the header)
+    return {
+        'title': f"Run {run_number} of Car {car_number}/{driver}/{engineer}",
+        'table': [data.columns.tolist()] + data.values.tolist(),
+        'highlights': [(col, row + 1) for col, row in highlight_cells(data)],
+    }
+
+def report_elements(section, usable_width, styles):
+    """reportlab flowables of one report section."""
+    # Calculate column widths to fit the table on the page
+    num_columns = len(section['table'][0])
+    col_width = usable_width / num_columns
+    
+    highlight_styles = [('BACKGROUND', cell, cell, colors.yellow) for cell in section['highlights']]
+
+    # Create the table with highlighted values
+    data_table = Table(section['table'], colWidths=[col_width] * num_columns)
+    data_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 8),  # Smaller font size for headers
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 6),  # Adjust padding if needed
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ] + highlight_styles))
+    
+    return [Paragraph(section['title'], styles['Heading2']), Spacer(1, 12), data_table, Spacer(1, 24)]
 
-    # Determine the first lap number to ignore
-    first_lap = df['Logger_Lap'].iloc[0]
-    df = df[df['Logger_Lap'] != first_lap]
+@profiled
+def build_pdf(sections, pdf_name):
+    """Lays out prepared report sections into one PDF."""
+    pdf = SimpleDocTemplate(pdf_name, pagesize=letter)
+    styles = getSampleStyleSheet()
 
-    lap_numbers = df['Logger_Lap'].unique()
-    report_data = []
+    # Page width and margins
+    page_width, page_height = letter
+    margin = 50
+    usable_width = page_width - 2 * margin
 
-    for lap in lap_numbers:
-        lap_data = df[df['Logger_Lap'] == lap]
-        
-        # Calculate the required values
-        avg_twater = lap_data['tWater'].mean()
-        avg_vbatt = lap_data['VBatt'].mean()
-        max_toil = lap_data['tOil'].max()
-        max_poil = lap_data['pOil'].max()
-        min_poil = lap_data['pOil'].min() if lap_data['pOil'].min() >= 1 else None
-        
-        
-        # Top speed in the specific GPS range
-        section_data = lap_data[(lap_data['GPS_Lat'].between(13.0029010, 13.0031654)) & (lap_data['GPS_Long'].between(79.9815728, 79.9837020))]
-        max_speed_section = section_data['CarSpeed'].max()
-        
-        # Maximum TAir in the GPS section
-        max_tair_section = section_data['tAir'].max()
-        
-        # Percentage of lap spent in full throttle
-        full_throttle_time = lap_data[lap_data['rPedal'] > 96]['Time'].count()
-        total_time = lap_data['Time'].count()
-        full_throttle_percent = (full_throttle_time / total_time) * 100
-        
-        # Brake balance in another GPS range
-        brake_section = lap_data[(lap_data['GPS_Lat'].between(13.0048683, 13.0050674)) & (lap_data['GPS_Long'].between(79.9828976, 79.9840276))]
-        if not brake_section.empty:
-            max_pbrakef = brake_section['pBrakeF'].max()
-            brake_balance_row = brake_section[brake_section['pBrakeF'] == max_pbrakef]
-            if not brake_balance_row.empty:
-                brake_balance = brake_balance_row['BrakeBalance'].iloc[0]
-            else:
-                brake_balance = np.nan  # or some other default value
-        else:
-            brake_balance = np.nan  # or some other default value
-        
-        # Lockup condition time calculation with pBrakeF > 5 condition
-        lockup_condition = lap_data[(np.abs(lap_data['WSpeed_FL'] - lap_data['WSpeed_FR']) > 0.1 * lap_data['WSpeed_FL']) & (lap_data['pBrakeF'] > 5)]
-        
-        lockup_time = len(lockup_condition) * 0.005  # Total time spent in lockup condition in seconds
-
-        # Fuel consumption per lap
-        fuel_consumption = lap_data['mFuelConsLap'].max() - lap_data['mFuelConsLap'].min()
-        
-        #LP fuel current
-        lp_fuel = lap_data['PBX_LP_Fuel_Current'].min() #- lap_data['PBX_LP_Fuel_Current'].min()
-        
-        
-        report_data.append([
-            lap,  # Add the lap number as the first column
-            round(avg_twater, 2),
-            round(avg_vbatt, 2),
-            round(max_toil, 2),
-            round(max_poil, 2),
-            round(min_poil, 2) if min_poil is not None else np.nan,
-            round(max_speed_section, 2),
-            round(max_tair_section, 2),
-            round(full_throttle_percent, 2),
-            round(brake_balance, 2),
-            round(lockup_time, 2),  # lockup_time is now calculated in seconds
-            round(fuel_consumption, 2),
-            round(lp_fuel,2)
-        ])
-    
-    return pd.DataFrame(report_data, columns=[
-        'Lap', 'tWat_avg', 'Vbatt_avg', 'tOil_max', 'pOil_max', 'pOil_min',
-        'Vmax', 'tAir_max', '%fThr', 'BB%', 'Lockup_time', 'Fuel','PBX_LP_Fuel_Current'
-    ])
+    elements = []
+    for section in sections:
+        elements.extend(report_elements(section, usable_width, styles))
+    pdf.build(elements)
+    return pdf_name
 
-def generate_pdf_report(report_data, file_paths, car_data):
+def ask_pdf_name():
     # Initialize tkinter root window
     root = tk.Tk()
     root.withdraw()  # Hide the root window
     
     # Prompt for a PDF file name
     base_name = "24_F4 India R01 Reliability Session"
-    pdf_name = simpledialog.askstring("Save PDF", "Enter a name for the PDF file:", initialvalue=base_name, parent=root)
+    return simpledialog.askstring("Save PDF", "Enter a name for the PDF file:", initialvalue=base_name, parent=root)
+
+@profiled
+def generate_pdf_report(report_data, file_paths, car_data, pdf_name=None):
+    # Prompt for a PDF file name unless one is given (headless runs)
+    if pdf_name is None:
+        pdf_name = ask_pdf_name()
     
     #Cancel generation if name not provided (could be user trialling the code)
     if not pdf_name:
@@ -140,91 +136,11 @@ def generate_pdf_report(report_data, file_paths, car_data):
     if not pdf_name.endswith(".pdf"):
         pdf_name += ".pdf"
     
-    pdf = SimpleDocTemplate(pdf_name, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Page width and margins
-    page_width, page_height = letter
-    margin = 50
-    usable_width = page_width - 2 * margin
-    
-    for i, file_path in enumerate(file_paths):
-        # Extract run number and car number from the filename
-        filename = file_path.split('/')[-1]
-        run_number, car_number = extract_run_and_car(filename)
-        
-        # Look up driver and engineer names based on car number
-        driver, engineer = get_driver_engineer(car_data, car_number)
-        
-        title = f"Run {run_number} of Car {car_number}/{driver}/{engineer}"
-        
-        elements.append(Paragraph(title, styles['Heading2']))
-        elements.append(Spacer(1, 12))
-        
-        # Get the data for the current file
-        data = report_data[i]
-        
-        # Calculate column widths to fit the table on the page
-        num_columns = len(data.columns)
-        col_width = usable_width / num_columns
-        
-        # Convert the data to a list of lists for easier processing
-        table_data = [data.columns.tolist()] + data.values.tolist()
-        
-        # Determine indices for the highlights
-        highlight_styles = []
-        
-        # Get the data (excluding header) for highlighting
-        data_values = data.iloc[:, 1:]  # Exclude 'Lap' column
-
-        max_twat = data_values['tWat_avg'].idxmax() + 1  # +1 because table_data includes the header
-        min_vbatt = data_values['Vbatt_avg'].idxmin() + 1
-        max_toil = data_values['tOil_max'].idxmax() + 1
-        max_poil_max = data_values['pOil_max'].idxmax() + 1
-        min_poil_min = data_values[data_values['pOil_min'] >= 1]['pOil_min'].idxmin() + 1
-        max_vmax = data_values['Vmax'].idxmax() + 1
-        max_tair = data_values['tAir_max'].idxmax() + 1
-        max_fthr = data_values['%fThr'].idxmax() + 1
-        max_lockup = data_values['Lockup_time'].idxmax() + 1
-        max_fuel = data_values['Fuel'].idxmax() + 1
-        avg_bb = abs(data_values['BB%'] - data_values['BB%'].mean()).idxmin() + 1
-        min_lp = data_values['PBX_LP_Fuel_Current'].idxmin()+1
-
-        # Highlighting the values
-        highlight_styles.extend([
-            ('BACKGROUND', (1, max_twat), (1, max_twat), colors.yellow),
-            ('BACKGROUND', (2, min_vbatt), (2, min_vbatt), colors.yellow),
-            ('BACKGROUND', (3, max_toil), (3, max_toil), colors.yellow),
-            ('BACKGROUND', (4, max_poil_max), (4, max_poil_max), colors.yellow),
-            ('BACKGROUND', (5, min_poil_min), (5, min_poil_min), colors.yellow),
-            ('BACKGROUND', (6, max_vmax), (6, max_vmax), colors.yellow),
-            ('BACKGROUND', (7, max_tair), (7, max_tair), colors.yellow),
-            ('BACKGROUND', (8, max_fthr), (8, max_fthr), colors.yellow),
-            ('BACKGROUND', (9, avg_bb), (9, avg_bb), colors.yellow),
-            ('BACKGROUND', (10, max_lockup), (10, max_lockup), colors.yellow),
-            ('BACKGROUND', (11, max_fuel), (11, max_fuel), colors.yellow),
-            ('BACKGROUND', (12, min_lp), (12, min_lp), colors.yellow)
-        ])
-
-        # Create the table with highlighted values
-        data_table = Table(table_data, colWidths=[col_width] * num_columns)
-        data_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 8),  # Smaller font size for headers
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 6),  # Adjust padding if needed
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ] + highlight_styles))
-        
-        elements.append(data_table)
-        elements.append(Spacer(1, 24))
-    
-    pdf.build(elements)
+    # One section per run
+    sections = [report_section(report_data[i], file_path, car_data) for i, file_path in enumerate(file_paths)]
+    build_pdf(sections, pdf_name)
     print(f"PDF report '{pdf_name}' generated successfully!")
+    return pdf_name
 
 def main():
     # Load car data from JSON file
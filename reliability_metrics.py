@@ -0,0 +1,337 @@
+## Reliability metrics
+#
+# Single pass replacement for the per-lap filtering in reliab.process_file.
+# Lap boundaries are located once, then every statistic is a ufunc.reduceat
+# over the lap segments, so the cost is linear in the number of samples no
+# matter how many laps the run has.
+#
+# Metrics are declared in a registry: each one names its channel(s), the
+# reduction, an optional track gate, unit, rounding and the highlight rule
+# used in the PDF. lap_metrics evaluates all registered metrics together,
+# sharing gate masks and reductions, so adding a channel is one
+# register_metric call and no report changes. LapAccumulator computes the
+# same values for a lap that is still being logged, block by block.
+
+import numpy as np
+import pandas as pd
+from track_model import in_box
+
+FULL_THROTTLE = 96       # rPedal %
+LOCKUP_SLIP = 0.1        # |WSpeed_FL - WSpeed_FR| as a fraction of WSpeed_FL
+LOCKUP_PRESSURE = 5      # pBrakeF
+MIN_VALID_POIL = 1       # pOil_min below this is a sensor dropout
+
+REDUCTIONS = ('mean', 'max', 'min', 'range', 'percent', 'duration', 'value_at_max')
+HIGHLIGHTS = ('max', 'min', 'closest_to_mean')
+
+
+class Metric:
+    """One column of the reliability table.
+
+    column      report column name
+    channel     channel reduced (for 'value_at_max' the value returned)
+    reduction   one of REDUCTIONS; 'percent' and 'duration' count the
+                samples where `where` holds
+    gate        optional gate name (speed_trap, brake_zone, ...) restricting the samples
+    key         channel whose peak selects the sample for 'value_at_max'
+    where       function(channels) -> bool mask for 'percent'/'duration'
+    requires    extra channels `where` reads
+    valid_min   results below this are reported as NaN
+    highlight   one of HIGHLIGHTS, or None
+    """
+
+    def __init__(self, column, channel, reduction, gate=None, unit='', decimals=2, highlight=None,
+                 key=None, where=None, requires=(), valid_min=None):
+        if reduction not in REDUCTIONS:
+            raise ValueError(f"Unknown reduction {reduction!r} for {column}")
+        if highlight is not None and highlight not in HIGHLIGHTS:
+            raise ValueError(f"Unknown highlight rule {highlight!r} for {column}")
+        self.column = column
+        self.channel = channel
+        self.reduction = reduction
+        self.gate = gate
+        self.unit = unit
+        self.decimals = decimals
+        self.highlight = highlight
+        self.key = key
+        self.where = where
+        self.requires = tuple(requires)
+        self.valid_min = valid_min
+
+    @property
+    def channels(self):
+        names = [self.channel, *self.requires]
+        if self.key:
+            names.append(self.key)
+        return names
+
+
+METRICS = []
+
+
+def register_metric(metric):
+    """Adds a metric to the reliability table; columns appear in registration order."""
+    if any(m.column == metric.column for m in METRICS):
+        raise ValueError(f"Metric {metric.column} is already registered")
+    METRICS.append(metric)
+    return metric
+
+
+def _lockup(ch):
+    return (np.abs(ch['WSpeed_FL'] - ch['WSpeed_FR']) > LOCKUP_SLIP * ch['WSpeed_FL']) & (ch['pBrakeF'] > LOCKUP_PRESSURE)
+
+
+register_metric(Metric('tWat_avg', 'tWater', 'mean', unit='degC', highlight='max'))
+register_metric(Metric('Vbatt_avg', 'VBatt', 'mean', unit='V', highlight='min'))
+register_metric(Metric('tOil_max', 'tOil', 'max', unit='degC', highlight='max'))
+register_metric(Metric('pOil_max', 'pOil', 'max', unit='bar', highlight='max'))
+register_metric(Metric('pOil_min', 'pOil', 'min', unit='bar', highlight='min', valid_min=MIN_VALID_POIL))
+register_metric(Metric('Vmax', 'CarSpeed', 'max', gate='speed_trap', unit='km/h', highlight='max'))
+register_metric(Metric('tAir_max', 'tAir', 'max', gate='speed_trap', unit='degC', highlight='max'))
+register_metric(Metric('%fThr', 'rPedal', 'percent', unit='%', highlight='max',
+                       where=lambda ch: ch['rPedal'] > FULL_THROTTLE))
+register_metric(Metric('BB%', 'BrakeBalance', 'value_at_max', gate='brake_zone', key='pBrakeF',
+                       unit='%', highlight='closest_to_mean'))
+register_metric(Metric('Lockup_time', 'pBrakeF', 'duration', unit='s', highlight='max',
+                       where=_lockup, requires=('WSpeed_FL', 'WSpeed_FR')))
+register_metric(Metric('Fuel', 'mFuelConsLap', 'range', unit='l', highlight='max'))
+register_metric(Metric('PBX_LP_Fuel_Current', 'PBX_LP_Fuel_Current', 'min', unit='A', highlight='min'))
+
+
+def _channel(data, name, n):
+    """Channel as float64, all-NaN if the export does not log it."""
+    if name in data:
+        return np.asarray(data[name], dtype=np.float64)
+    return np.full(n, np.nan)
+
+
+def lap_segments(laps):
+    """Start index of every run of constant Logger_Lap.
+
+    Appended exports can repeat a lap number after a reset, so laps are
+    contiguous runs rather than unique values.
+    """
+    return np.concatenate(([0], np.flatnonzero(np.diff(laps) != 0) + 1))
+
+
+def segment_mean(values, starts):
+    finite = np.isfinite(values)
+    total = np.add.reduceat(np.where(finite, values, 0.0), starts)
+    count = np.add.reduceat(finite.astype(np.int64), starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def segment_max(values, starts, mask=None):
+    keep = np.isfinite(values) if mask is None else np.isfinite(values) & mask
+    result = np.maximum.reduceat(np.where(keep, values, -np.inf), starts)
+    return np.where(np.isneginf(result), np.nan, result)
+
+
+def segment_min(values, starts, mask=None):
+    keep = np.isfinite(values) if mask is None else np.isfinite(values) & mask
+    result = np.minimum.reduceat(np.where(keep, values, np.inf), starts)
+    return np.where(np.isposinf(result), np.nan, result)
+
+
+def segment_count(mask, starts):
+    return np.add.reduceat(mask.astype(np.int64), starts)
+
+
+def segment_value_at_max(values, key, starts, mask):
+    """values at the first sample where key peaks inside mask, per segment."""
+    n = len(key)
+    peak = segment_max(key, starts, mask)
+    lengths = np.diff(np.append(starts, n))
+    at_peak = mask & (key == np.repeat(peak, lengths))
+    first = np.minimum.reduceat(np.where(at_peak, np.arange(n), n), starts)
+    found = first < n
+    return np.where(found, values[np.minimum(first, n - 1)], np.nan)
+
+
+def sample_period(time):
+    """Logger sample period in seconds, from the Time column."""
+    steps = np.diff(time[np.isfinite(time)])
+    steps = steps[steps > 0]
+    return round(float(np.median(steps)), 6) if len(steps) else 0.005
+
+
+def lap_metrics(data, gates, metrics=None, skip_first_lap=True):
+    """Per-lap reliability table for one export.
+
+    data is anything indexable by channel name (TelemetryExport or
+    DataFrame); gates maps gate names to (lat_min, lat_max, long_min,
+    long_max) boxes. Uses the registered METRICS unless a list is given.
+    """
+    metrics = METRICS if metrics is None else metrics
+    columns = ['Lap'] + [m.column for m in metrics]
+    laps = np.asarray(data['Logger_Lap'])
+    n = len(laps)
+
+    names = {'Time', 'GPS_Lat', 'GPS_Long'}
+    for metric in metrics:
+        names.update(metric.channels)
+    ch = {name: _channel(data, name, n) for name in names}
+
+    # The first (out) lap is ignored, like the original report
+    first = 0
+    if skip_first_lap and n:
+        first = int(np.argmax(laps != laps[0])) if (laps != laps[0]).any() else n
+    if first >= n:
+        return pd.DataFrame(columns=columns)
+    laps = laps[first:]
+    ch = {name: values[first:] for name, values in ch.items()}
+
+    starts = lap_segments(laps)
+    timed = np.isfinite(ch['Time'])
+    period = sample_period(ch['Time'])
+
+    # Gate masks and reductions are shared between metrics
+    masks = {}
+    cache = {}
+
+    def gate_mask(gate):
+        if gate is None:
+            return None
+        if gate not in masks:
+            masks[gate] = in_box(ch['GPS_Lat'], ch['GPS_Long'], gates[gate])
+        return masks[gate]
+
+    def reduce(kind, channel, gate):
+        if (kind, channel, gate) not in cache:
+            reducer = segment_max if kind == 'max' else segment_min
+            cache[kind, channel, gate] = reducer(ch[channel], starts, gate_mask(gate))
+        return cache[kind, channel, gate]
+
+    report = {'Lap': laps[starts].astype(int)}
+    for metric in metrics:
+        mask = gate_mask(metric.gate)
+        if metric.reduction == 'mean':
+            values = ch[metric.channel] if mask is None else np.where(mask, ch[metric.channel], np.nan)
+            result = segment_mean(values, starts)
+        elif metric.reduction in ('max', 'min'):
+            result = reduce(metric.reduction, metric.channel, metric.gate)
+        elif metric.reduction == 'range':
+            result = reduce('max', metric.channel, metric.gate) - reduce('min', metric.channel, metric.gate)
+        elif metric.reduction == 'value_at_max':
+            in_gate = np.ones(len(laps), dtype=bool) if mask is None else mask
+            result = segment_value_at_max(ch[metric.channel], ch[metric.key], starts, in_gate)
+        else:
+            hit = timed & metric.where(ch)
+            if mask is not None:
+                hit &= mask
+            if metric.reduction == 'percent':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    result = 100.0 * segment_count(hit, starts) / segment_count(timed, starts)
+            else:
+                result = segment_count(hit, starts) * period
+        if metric.valid_min is not None:
+            result = np.where(result >= metric.valid_min, result, np.nan)
+        report[metric.column] = np.round(result, metric.decimals)
+
+    return pd.DataFrame(report, columns=columns)
+
+
+
+class LapAccumulator:
+    """Running lap_metrics values of one lap, updated as samples arrive.
+
+    Keeps only sums, counts and extremes per metric, so a live lap costs
+    the same to update whatever its length. period is the sample period
+    used for 'duration' metrics; without it the first update's Time
+    column sets it.
+    """
+
+    def __init__(self, lap, gates, metrics=None, period=None):
+        self.lap = lap
+        self.gates = gates
+        self.metrics = METRICS if metrics is None else metrics
+        self.period = period
+        self.samples = 0
+        self.state = {m.column: {'sum': 0.0, 'count': 0, 'max': -np.inf, 'min': np.inf, 'key': -np.inf,
+                                 'value': np.nan, 'hits': 0, 'timed': 0} for m in self.metrics}
+
+    def update(self, data):
+        """Adds a block of samples of this lap (anything indexable by channel name)."""
+        n = len(data['Time'])
+        if not n:
+            return
+        names = {'Time', 'GPS_Lat', 'GPS_Long'}
+        for metric in self.metrics:
+            names.update(metric.channels)
+        ch = {name: _channel(data, name, n) for name in names}
+        if self.period is None and n > 1:
+            self.period = sample_period(ch['Time'])
+        timed = np.isfinite(ch['Time'])
+        masks = {}
+        for metric in self.metrics:
+            state = self.state[metric.column]
+            if metric.gate is not None and metric.gate not in masks:
+                masks[metric.gate] = in_box(ch['GPS_Lat'], ch['GPS_Long'], self.gates[metric.gate])
+            mask = masks.get(metric.gate, np.ones(n, dtype=bool))
+            values = ch[metric.channel]
+            if metric.reduction == 'mean':
+                keep = mask & np.isfinite(values)
+                state['sum'] += float(values[keep].sum())
+                state['count'] += int(keep.sum())
+            elif metric.reduction in ('max', 'min', 'range'):
+                keep = values[mask & np.isfinite(values)]
+                if len(keep):
+                    state['max'] = max(state['max'], float(keep.max()))
+                    state['min'] = min(state['min'], float(keep.min()))
+            elif metric.reduction == 'value_at_max':
+                key = np.where(mask & np.isfinite(ch[metric.key]), ch[metric.key], -np.inf)
+                peak = int(np.argmax(key))
+                # First sample at the peak wins, like segment_value_at_max
+                if key[peak] > state['key']:
+                    state['key'] = float(key[peak])
+                    state['value'] = float(values[peak])
+            else:
+                hit = timed & metric.where(ch) & mask
+                state['hits'] += int(hit.sum())
+                state['timed'] += int(timed.sum())
+        self.samples += n
+
+    def values(self):
+        """{column: value} of the lap so far, rounded and validated like lap_metrics."""
+        result = {'Lap': self.lap}
+        for metric in self.metrics:
+            state = self.state[metric.column]
+            if metric.reduction == 'mean':
+                value = state['sum'] / state['count'] if state['count'] else np.nan
+            elif metric.reduction == 'max':
+                value = state['max'] if np.isfinite(state['max']) else np.nan
+            elif metric.reduction == 'min':
+                value = state['min'] if np.isfinite(state['min']) else np.nan
+            elif metric.reduction == 'range':
+                value = state['max'] - state['min'] if np.isfinite(state['max']) else np.nan
+            elif metric.reduction == 'value_at_max':
+                value = state['value']
+            elif metric.reduction == 'percent':
+                value = 100.0 * state['hits'] / state['timed'] if state['timed'] else np.nan
+            else:
+                value = state['hits'] * (self.period or 0.005)
+            if metric.valid_min is not None and not value >= metric.valid_min:
+                value = np.nan
+            result[metric.column] = float(np.round(value, metric.decimals))
+        return result
+
+
+def highlight_cells(report, metrics=None):
+    """(column, row) positions to highlight in a lap_metrics table, header excluded."""
+    metrics = METRICS if metrics is None else metrics
+    cells = []
+    for metric in metrics:
+        if metric.highlight is None or metric.column not in report:
+            continue
+        values = report[metric.column].to_numpy(dtype=np.float64)
+        if not np.isfinite(values).any():
+            continue
+        if metric.highlight == 'max':
+            row = np.nanargmax(values)
+        elif metric.highlight == 'min':
+            row = np.nanargmin(values)
+        else:
+            row = np.nanargmin(np.abs(values - np.nanmean(values)))
+        cells.append((report.columns.get_loc(metric.column), int(row)))
+    return cells
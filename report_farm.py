@@ -0,0 +1,100 @@
+## Report farm
+#
+# Builds the reliability (reliab.py, reportlab) and sector (splitt.py, fpdf)
+# PDFs of a whole event in one pass. Each export is handed to a process
+# pool worker that loads it once and returns both of its report fragments:
+# the per-lap tables already formatted, with their highlight cells, as
+# plain lists. The parent only lays the fragments out, in file order, into
+# the two documents, so the serial part is the PDF writing itself.
+#
+#   python report_farm.py "Marelli WinTAX Exports/Qualifying" --out reports --name "R01 Qualifying"
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import reliab
+import splitt
+from telemetry_loader import find_exports
+from session_catalog import CAR_FILE
+from profiling import profiled
+
+REPORTS = ('reliability', 'sectors')
+
+
+@profiled
+def file_fragments(file_path, car_data, reports=REPORTS):
+    """{report: fragment or exception message} of one export, run in a worker."""
+    fragments = {}
+    for report in reports:
+        try:
+            if report == 'reliability':
+                fragments[report] = reliab.report_section(reliab.process_file(file_path), file_path, car_data)
+            else:
+                df = splitt.process_file(file_path)
+                df['File Name'] = os.path.basename(file_path)
+                fragments[report] = splitt.sector_page(df)
+        except Exception as e:
+            fragments[report] = f"{type(e).__name__}: {e}"
+    return fragments
+
+
+def build_reports(files, out_dir, name='Session', car_data=(), reports=REPORTS, workers=None):
+    """Writes one PDF per report over all files.
+
+    Returns ({report: pdf path}, {report: {file: error message}}); files
+    that fail are left out of their report and the rest still render.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    collected = {report: [] for report in reports}
+    errors = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {path: pool.submit(file_fragments, path, list(car_data), tuple(reports)) for path in files}
+        for path, future in futures.items():
+            try:
+                fragments = future.result()
+            except Exception as e:
+                fragments = {report: f"{type(e).__name__}: {e}" for report in reports}
+            for report, fragment in fragments.items():
+                if isinstance(fragment, str):
+                    errors.setdefault(report, {})[path] = fragment
+                else:
+                    collected[report].append(fragment)
+
+    written = {}
+    if collected.get('reliability'):
+        written['reliability'] = reliab.build_pdf(collected['reliability'],
+                                                  os.path.join(out_dir, f"{name} Reliability.pdf"))
+    if collected.get('sectors'):
+        written['sectors'] = os.path.join(out_dir, f"{name} Sectors.pdf")
+        splitt.build_pdf(collected['sectors'], written['sectors'])
+    return written, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the reliability and sector PDFs of an event.")
+    parser.add_argument('sources', nargs='+', help="folders, globs or export files")
+    parser.add_argument('--out', default='reports', help="output folder")
+    parser.add_argument('--name', default='Session', help="report name prefix")
+    parser.add_argument('--reports', nargs='+', default=list(REPORTS), choices=list(REPORTS))
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    files = find_exports(args.sources)
+    if not files:
+        print(f"No exports found in {args.sources}")
+        return 1
+    with open(CAR_FILE, 'r') as f:
+        car_data = json.load(f)
+
+    written, errors = build_reports(files, args.out, args.name, car_data, args.reports, args.workers)
+    for report, path in written.items():
+        print(f"{report}: {path}")
+    for report, report_errors in errors.items():
+        for path, error in report_errors.items():
+            print(f"{report}: {path}: FAILED {error}")
+    return 1 if errors or not written else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,165 @@
+## Headless report pipeline
+#
+# Runs the session reports without any tkinter dialog, for unattended batch
+# runs (cron, a shell loop over event folders):
+#   reliability  reliab.py reliability PDF over the WinTAX exports (.txt/.csv/.xlsx)
+#   sectors      splitt.py sector time PDF over the WinTAX exports (both via report_farm)
+#   comparison   speed/action plotly HTML, the fastest RS3 export against each other one
+#   maps         track_map_batch.py coloured track maps
+# Folders are searched with their subfolders, so one command covers a whole
+# event. A failing file or step is reported and the others still run; the
+# exit status is 1 if anything failed or no exports were found.
+#
+#   python report_pipeline.py "Marelli WinTAX Exports" --out reports
+#   python report_pipeline.py "Marelli WinTAX Exports/Qualifying" --out reports
+#   python report_pipeline.py "exports/*.csv" --out reports --steps comparison maps
+
+import argparse
+import json
+import os
+from session_cache import load_export
+from telemetry_loader import find_exports, sniff_format
+from lap_index import LapIndex
+from session_catalog import CAR_FILE
+from profiling import stage
+
+STEPS = ('reliability', 'sectors', 'comparison', 'maps')
+
+
+# Helper function to sort exports by layout
+def classify_exports(files):
+    """{kind: [files]} by sniff_format kind, plus {file: error} for unreadable ones."""
+    kinds, errors = {}, {}
+    for file_path in files:
+        try:
+            kind = sniff_format(file_path)['kind']
+        except (OSError, ValueError) as e:
+            errors[file_path] = f"{type(e).__name__}: {e}"
+            continue
+        kinds.setdefault(kind, []).append(file_path)
+    return kinds, errors
+
+
+def run_reports(files, out_dir, car_data, name, reports, workers=None):
+    """Reliability and/or sector PDFs of the WinTAX exports; returns ({report: written}, {report: errors})."""
+    from report_farm import build_reports
+    pdfs, errors = build_reports(files, out_dir, name, car_data, reports, workers)
+    return {report: [pdfs[report]] if report in pdfs else [] for report in reports}, errors
+
+
+# Helper function to get the fastest lap time of an RS3 export
+def fastest_lap_time(file_path, lap_window):
+    laps = LapIndex.from_export(load_export(file_path), *lap_window)
+    return float(laps.lap_times[laps.fastest()])
+
+
+def run_comparison(files, out_dir):
+    """Speed/action HTML of the fastest RS3 export against each other one; returns (written, errors)."""
+    import speed_action_FL_2drivers_RS3export_plotly as speed_action
+    lap_times, errors = {}, {}
+    for file_path in files:
+        try:
+            lap_times[file_path] = fastest_lap_time(file_path, speed_action.LAP_WINDOW)
+        except Exception as e:
+            errors[file_path] = f"{type(e).__name__}: {e}"
+    if len(lap_times) < 2:
+        return [], errors
+
+    reference = min(lap_times, key=lap_times.get)
+    reference_stem = os.path.splitext(os.path.basename(reference))[0]
+    written = []
+    for file_path in lap_times:
+        if file_path == reference:
+            continue
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        try:
+            fig = speed_action.build_figure(reference, file_path)
+            path = os.path.join(out_dir, f"{reference_stem} vs {stem}.html")
+            fig.write_html(path, include_plotlyjs='cdn')
+            written.append(path)
+        except Exception as e:
+            errors[file_path] = f"{type(e).__name__}: {e}"
+    return written, errors
+
+
+def run_maps(sources, out_dir, workers=None):
+    """Track maps of every export, in the subfolders of the sources; returns (written, errors)."""
+    from track_map_batch import render_event
+    results, errors = render_event(sources, os.path.join(out_dir, 'track_maps'), workers=workers)
+    return [path for paths in results.values() for path in paths], errors
+
+
+def run_pipeline(sources, out_dir, steps=STEPS, name='Session', workers=None, car_file=CAR_FILE):
+    """Runs the requested steps over every export found; returns ({step: written}, {step: {file: error}})."""
+    files = find_exports(sources, recursive=True)
+    os.makedirs(out_dir, exist_ok=True)
+    car_data = []
+    if car_file and os.path.exists(car_file):
+        with open(car_file, 'r') as f:
+            car_data = json.load(f)
+    kinds, unreadable = classify_exports(files)
+    # WinTAX data exported as .txt/.csv or as an Excel sheet; RS3 exports go to the comparison
+    wintax_files = sorted(kinds.get('wintax', []) + kinds.get('xlsx', []))
+
+    written, errors = {}, {}
+    if unreadable:
+        errors['load'] = unreadable
+    # Both PDFs come out of one pass over the files
+    reports = [step for step in steps if step in ('reliability', 'sectors')]
+    if reports and kinds.get('prn'):
+        print(f"{len(kinds['prn'])} .prn exports skipped for the {' and '.join(reports)} reports "
+              f"(no Logger_Lap / GPS channels)")
+    if reports:
+        try:
+            with stage('report_pipeline.reports'):
+                pdfs, report_errors = run_reports(wintax_files, out_dir, car_data, name, reports, workers)
+        except Exception as e:
+            pdfs = {report: [] for report in reports}
+            report_errors = {report: {'*': f"{type(e).__name__}: {e}"} for report in reports}
+        written.update(pdfs)
+        errors.update(report_errors)
+    for step in steps:
+        if step in reports:
+            continue
+        try:
+            with stage(f'report_pipeline.{step}'):
+                if step == 'comparison':
+                    written[step], step_errors = run_comparison(kinds.get('rs3', []), out_dir)
+                elif step == 'maps':
+                    written[step], step_errors = run_maps(sources, out_dir, workers)
+                else:
+                    raise ValueError(f"Unknown step {step}")
+        except Exception as e:
+            written.setdefault(step, [])
+            step_errors = {'*': f"{type(e).__name__}: {e}"}
+        if step_errors:
+            errors[step] = step_errors
+    return written, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the session reports without dialogs.")
+    parser.add_argument('sources', nargs='+', help="folders (with their subfolders), globs or export files")
+    parser.add_argument('--out', default='reports', help="output folder")
+    parser.add_argument('--steps', nargs='+', default=list(STEPS), choices=list(STEPS))
+    parser.add_argument('--name', default='Session', help="report name prefix")
+    parser.add_argument('--workers', type=int, default=None, help="report and track map processes")
+    args = parser.parse_args()
+
+    if not find_exports(args.sources, recursive=True):
+        print(f"No exports found in {args.sources}")
+        return 1
+
+    written, errors = run_pipeline(args.sources, args.out, args.steps, args.name, args.workers)
+    for step, paths in written.items():
+        print(f"{step}: {len(paths)} files")
+        for path in paths:
+            print(f"  {path}")
+    for step, step_errors in errors.items():
+        for path, error in step_errors.items():
+            print(f"{step}: {path}: FAILED {error}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
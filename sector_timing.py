@@ -0,0 +1,220 @@
+## Sector timing
+#
+# Vectorised replacement for the per-row sector walk in splitt.process_file.
+# Every sample is classified against all sector boxes in one broadcast, the
+# sector changes are found with diff/flatnonzero and the run durations are
+# summed per (lap, sector) with bincount.
+#
+# The box edges act as timing lines: at each sector change the segment
+# between the two GPS fixes either side of it is intersected with the edge
+# that was crossed, and the crossing time is interpolated from the Time
+# column. This keeps sector times accurate at any sample rate.
+
+import json
+import numpy as np
+import pandas as pd
+
+# Sub-sectors that are combined in the report
+COMBINED_SECTORS = {
+    'S': ['SA', 'SB', 'SC'],
+    'T10_T11': ['T10E', 'T10_11'],
+}
+
+REPORT_COLUMNS = [
+    'Lap', 'SF', 'T1', 'T2', 'T3', 'S', 'T4_5', 'T6_7', 'T8', 'T9', 'T10_T11', 'T12', 'Total_Lap'
+]
+
+# Rows classified per broadcast, keeps the (rows x sectors) masks small
+CLASSIFY_CHUNK = 1 << 16
+
+
+def _to_float(value):
+    return float(str(value).replace(",", "."))
+
+
+def load_sectors(json_file):
+    """Loads sector boxes from a JSON file, converting decimal-comma coordinates."""
+    with open(json_file, 'r') as f:
+        sectors = json.load(f)
+    for sector in sectors:
+        for key in ('GPS_Lat1', 'GPS_Long1', 'GPS_Lat2', 'GPS_Long2'):
+            sector[key] = _to_float(sector[key])
+    return sectors
+
+
+def sector_bounds(sectors):
+    """Returns (lat_min, lat_max, long_min, long_max) arrays, one entry per sector."""
+    lat1 = np.array([s['GPS_Lat1'] for s in sectors])
+    lat2 = np.array([s['GPS_Lat2'] for s in sectors])
+    long1 = np.array([s['GPS_Long1'] for s in sectors])
+    long2 = np.array([s['GPS_Long2'] for s in sectors])
+    return np.minimum(lat1, lat2), np.maximum(lat1, lat2), np.minimum(long1, long2), np.maximum(long1, long2)
+
+
+def classify_samples(lat, lon, sectors):
+    """Index of the first sector whose box contains each sample, -1 if none.
+
+    Sectors are tested in file order, same as the original loop, so
+    overlapping boxes resolve to the earlier entry.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    lat_min, lat_max, long_min, long_max = sector_bounds(sectors)
+
+    labels = np.full(len(lat), -1, dtype=np.int16)
+    for start in range(0, len(lat), CLASSIFY_CHUNK):
+        la = lat[start:start + CLASSIFY_CHUNK, None]
+        lo = lon[start:start + CLASSIFY_CHUNK, None]
+        inside = (la >= lat_min) & (la <= lat_max) & (lo >= long_min) & (lo <= long_max)
+        hit = inside.any(axis=1)
+        labels[start:start + CLASSIFY_CHUNK] = np.where(hit, inside.argmax(axis=1), -1)
+    return labels
+
+
+def sector_runs(labels, start_index):
+    """Splits the current-sector state into runs.
+
+    A sample outside every box keeps the previous sector, as in the original
+    loop. Returns (run_starts, run_sectors) from start_index onwards.
+    """
+    valid = labels >= 0
+    last_valid = np.maximum.accumulate(np.where(valid, np.arange(len(labels)), 0))
+    state = labels[last_valid][start_index:]
+    run_starts = np.concatenate(([0], np.flatnonzero(np.diff(state)) + 1)) + start_index
+    return run_starts, labels[last_valid][run_starts]
+
+
+def _slab_interval(p0, delta, low, high):
+    """Parameter interval [t_in, t_out] where p0 + t * delta lies in [low, high]."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (low - p0) / delta
+        t2 = (high - p0) / delta
+    t_in = np.minimum(t1, t2)
+    t_out = np.maximum(t1, t2)
+    # Segments parallel to the slab are either always or never inside it
+    parallel = delta == 0
+    inside = (p0 >= low) & (p0 <= high)
+    t_in = np.where(parallel, np.where(inside, -np.inf, np.inf), t_in)
+    t_out = np.where(parallel, np.where(inside, np.inf, -np.inf), t_out)
+    return t_in, t_out
+
+
+def box_crossing_fraction(lat0, lon0, lat1, lon1, bounds, entered, exited):
+    """Fraction along each segment (lat0, lon0) -> (lat1, lon1) where the sector changes.
+
+    Segment/box-edge intersection (Liang-Barsky) against the axis aligned
+    sector boxes. Normally the change is the entry into the new box; when
+    the start point already sat inside the new box (overlapping boxes,
+    earlier sector wins) it is the exit from the old one.
+    """
+    lat_min, lat_max, long_min, long_max = bounds
+    d_lat = lat1 - lat0
+    d_lon = lon1 - lon0
+
+    lat_in, lat_out = _slab_interval(lat0, d_lat, lat_min[entered], lat_max[entered])
+    lon_in, lon_out = _slab_interval(lon0, d_lon, long_min[entered], long_max[entered])
+    t_enter = np.maximum(lat_in, lon_in)
+
+    lat_in, lat_out = _slab_interval(lat0, d_lat, lat_min[exited], lat_max[exited])
+    lon_in, lon_out = _slab_interval(lon0, d_lon, long_min[exited], long_max[exited])
+    t_exit = np.minimum(lat_out, lon_out)
+
+    t = np.where(t_enter > 0, t_enter, t_exit)
+    return np.clip(np.nan_to_num(t, nan=1.0, posinf=1.0, neginf=0.0), 0.0, 1.0)
+
+
+def _fix_starts(lat, lon):
+    """Index where the GPS fix held at each sample was first logged.
+
+    GPS updates slower than the logger, so positions repeat; interpolating
+    between fix times rather than neighbouring samples avoids a bias of up
+    to one GPS period. Zero coordinates (no fix yet, or lost) never start a
+    fix of their own.
+    """
+    changed = np.ones(len(lat), dtype=bool)
+    changed[1:] = ((np.diff(lat) != 0) | (np.diff(lon) != 0)) & (lat[1:] != 0) & (lon[1:] != 0)
+    return np.maximum.accumulate(np.where(changed, np.arange(len(lat)), 0))
+
+
+def crossing_times(lat, lon, time, sectors, run_starts, run_sectors):
+    """Interpolated time at which each run (sector entry) starts."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    time = np.asarray(time, dtype=np.float64)
+
+    # The first run has no previous sector; it is always a box entry
+    previous = np.concatenate((run_sectors[:1], run_sectors[:-1]))
+    starts = np.maximum(run_starts, 1)
+    a = _fix_starts(lat, lon)[starts - 1]
+
+    fraction = box_crossing_fraction(
+        lat[a], lon[a], lat[starts], lon[starts], sector_bounds(sectors), run_sectors, previous
+    )
+    return np.where(run_starts > 0, time[a] + fraction * (time[starts] - time[a]), time[run_starts])
+
+
+def sector_times_by_lap(lat, lon, sectors, time=None, sample_period=0.005):
+    """Per-lap time spent in each sector as a (laps x sectors) array.
+
+    Laps start every time the car enters the 'SF' box; samples before the
+    first SF entry are ignored. With a time array the sector boundaries are
+    interpolated box-edge crossings, otherwise sample counts x sample_period.
+    Append_ exports restart Time at every run, so each run (split wherever
+    Time goes backwards) is timed on its own and its laps appended; a run
+    with missing Time values falls back to sample counts.
+    """
+    if time is not None:
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        time = np.asarray(time, dtype=np.float64)
+        resets = np.flatnonzero(np.diff(time) < 0) + 1
+        if len(resets):
+            bounds = np.concatenate(([0], resets, [len(time)]))
+            return np.concatenate([sector_times_by_lap(lat[a:b], lon[a:b], sectors, time[a:b], sample_period)
+                                   for a, b in zip(bounds[:-1], bounds[1:])])
+        if not np.isfinite(time).all():
+            time = None
+
+    names = [s['Sector'] for s in sectors]
+    sf = names.index('SF')
+    labels = classify_samples(lat, lon, sectors)
+
+    sf_hits = np.flatnonzero(labels == sf)
+    if len(sf_hits) == 0:
+        return np.zeros((0, len(sectors)))
+
+    run_starts, run_sectors = sector_runs(labels, sf_hits[0])
+
+    # The final run is closed at the last sample, like the original loop
+    if time is None:
+        run_ends = np.append(run_starts[1:], len(labels) - 1)
+        durations = (run_ends - run_starts) * sample_period
+    else:
+        boundaries = crossing_times(lat, lon, time, sectors, run_starts, run_sectors)
+        durations = np.diff(np.append(boundaries, float(time[-1])))
+
+    laps = np.cumsum(run_sectors == sf) - 1
+    n_laps = laps[-1] + 1
+    flat = np.bincount(laps * len(sectors) + run_sectors, weights=durations, minlength=n_laps * len(sectors))
+    return flat.reshape(n_laps, len(sectors))
+
+
+def sector_frame(times, sectors):
+    """Report table (Lap, SF, T1 ... T12, Total_Lap) of a (laps x sectors) time array."""
+    names = [s['Sector'] for s in sectors]
+    result_df = pd.DataFrame(times, columns=names)
+    result_df['Total_Lap'] = result_df[names].sum(axis=1)
+
+    for combined, parts in COMBINED_SECTORS.items():
+        result_df[combined] = result_df[parts].sum(axis=1)
+        result_df = result_df.drop(columns=parts)
+
+    result_df.index.name = 'Lap'
+    result_df.reset_index(inplace=True)
+    result_df['Lap'] = result_df['Lap'].astype(int)
+    return result_df[REPORT_COLUMNS]
+
+
+def sector_table(lat, lon, sectors, time=None, sample_period=0.005):
+    """Builds the per-lap sector report table (Lap, SF, T1 ... T12, Total_Lap)."""
+    return sector_frame(sector_times_by_lap(lat, lon, sectors, time, sample_period), sectors)
@@ -0,0 +1,155 @@
+## Session cache
+#
+# Parsed exports are stored as uncompressed Feather (Arrow IPC) files keyed
+# by a hash of the source bytes, so re-opening a session memory-maps the
+# columns instead of re-parsing the text export. A changed source gets a
+# new key and the stale entry for that path is dropped.
+#
+# Drop-in replacements for telemetry_loader.load_export / load_dataframe.
+# Each entry gets a min/max/mean zoom pyramid (pyramid.py) of the speed and
+# brake channels next to it. Set F4_CACHE_DIR to move the cache, or F4_NO_CACHE=1 to bypass it.
+# Columns always come back read-only, memory-mapped or freshly parsed, so
+# copy a column before changing it in place.
+
+import hashlib
+import json
+import os
+import zipfile
+import telemetry_loader
+from pyramid import Pyramid
+from profiling import profiled
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow missing: fall back to parsing every time
+    pa = None
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.telemetry_cache')
+HASH_CHUNK = 1 << 20
+
+
+def cache_dir():
+    return os.environ.get('F4_CACHE_DIR', DEFAULT_CACHE_DIR)
+
+
+def content_hash(file_path):
+    """blake2b digest of the file contents (hex)."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _path_key(file_path):
+    return hashlib.blake2b(os.path.abspath(file_path).encode(), digest_size=6).hexdigest()
+
+
+def cache_path(file_path, source_hash=None):
+    """Location of the cache entry for the current contents of file_path."""
+    if source_hash is None:
+        source_hash = content_hash(file_path)
+    return os.path.join(cache_dir(), f"{_path_key(file_path)}-{source_hash}-v{CACHE_VERSION}.feather")
+
+
+def pyramid_path(entry):
+    """Location of the zoom pyramid belonging to a cache entry."""
+    return os.path.splitext(entry)[0] + '.pyramid.npz'
+
+
+def _drop_stale_entries(file_path, keep):
+    prefix = _path_key(file_path) + '-'
+    stem = os.path.splitext(os.path.basename(keep))[0]
+    directory = cache_dir()
+    for name in os.listdir(directory):
+        entry = os.path.join(directory, name)
+        if name.startswith(prefix) and not name.startswith(stem):
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
+
+
+def write_entry(path, export):
+    """Writes a TelemetryExport as a Feather file with the metadata in the schema."""
+    table = pa.table({name: values for name, values in export.columns.items()})
+    table = table.replace_schema_metadata({b'f4_metadata': json.dumps(export.metadata, default=str).encode()})
+    tmp_path = path + '.tmp'
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+
+
+def read_entry(path):
+    """Memory-maps a cache entry back into a TelemetryExport."""
+    table = feather.read_table(path, memory_map=True)
+    metadata = json.loads(table.schema.metadata[b'f4_metadata'])
+    columns = {name: table.column(i).to_numpy() for i, name in enumerate(table.column_names)}
+    return telemetry_loader.TelemetryExport(columns, metadata)
+
+
+# Helper function to give parsed exports the same read-only columns as memory-mapped ones
+def _read_only(export):
+    for values in export.columns.values():
+        values.flags.writeable = False
+    return export
+
+
+@profiled
+def load_export(file_path, source_hash=None):
+    """Cached telemetry_loader.load_export; the columns are read-only."""
+    if pa is None or os.environ.get('F4_NO_CACHE'):
+        return _read_only(telemetry_loader.load_export(file_path))
+
+    entry = cache_path(file_path, source_hash)
+    if os.path.exists(entry):
+        try:
+            export = read_entry(entry)
+            export.metadata['source'] = os.path.abspath(file_path)
+            return export
+        except (OSError, ValueError, KeyError, pa.ArrowException):
+            pass  # unreadable entry, rebuild it below
+
+    export = telemetry_loader.load_export(file_path)
+    export.metadata['hash'] = os.path.basename(entry).split('-')[1]
+    try:
+        os.makedirs(cache_dir(), exist_ok=True)
+        write_entry(entry, export)
+        Pyramid.build(export).save(pyramid_path(entry))
+        _drop_stale_entries(file_path, entry)
+    except (OSError, KeyError) as e:
+        print(f"Could not write cache entry for {file_path}: {e}")
+    return _read_only(export)
+
+
+def load_dataframe(file_path):
+    """Cached telemetry_loader.load_dataframe."""
+    return load_export(file_path).to_dataframe()
+
+
+def load_pyramid(file_path):
+    """Zoom pyramid of an export, built if the cache entry predates it."""
+    export = load_export(file_path)
+    if pa is None or os.environ.get('F4_NO_CACHE'):
+        return Pyramid.build(export)
+    path = pyramid_path(cache_path(file_path, export.metadata.get('hash')))
+    try:
+        return Pyramid.load(path, raw=export)
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        pyramid = Pyramid.build(export)
+        try:
+            pyramid.save(path)
+        except OSError as e:
+            print(f"Could not write pyramid for {file_path}: {e}")
+        return pyramid
+
+
+def clear_cache():
+    """Removes every cache entry."""
+    directory = cache_dir()
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(('.feather', '.npz', '.tmp')):
+            os.remove(os.path.join(directory, name))
@@ -0,0 +1,249 @@
+## Session catalog
+#
+# SQLite index of every export: path, format, content hash, run, Abs
+# counter, car, driver, engineer, session type, lap count, fastest lap and
+# duration. Each file is parsed once (through session_cache) when it is
+# indexed; re-indexing skips files whose size and mtime are unchanged.
+# Queries like "all runs of car 42 in qualifying" or "fastest lap per
+# driver" then run against indexed columns instead of regexes over file
+# names and reopened exports. The database lives in the cache folder
+# (F4_CACHE_DIR) as catalog.sqlite.
+#
+#   python session_catalog.py index "Marelli WinTAX Exports"
+#   python session_catalog.py runs --car 42 --session Qualifying
+#   python session_catalog.py fastest
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+import numpy as np
+import session_cache
+from telemetry_loader import find_exports, parse_export_filename, sniff_format
+from lap_index import LapIndex
+
+CATALOG_VERSION = 1
+MIN_LAP_TIME = 60        # shorter laps are out/in or partial laps
+CAR_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cardrivers.json')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exports (
+    path TEXT PRIMARY KEY,
+    format TEXT,
+    hash TEXT,
+    size INTEGER,
+    mtime REAL,
+    run INTEGER,
+    abs INTEGER,
+    car INTEGER,
+    driver TEXT,
+    engineer TEXT,
+    session_type TEXT,
+    laps INTEGER,
+    fastest_lap REAL,
+    duration REAL,
+    indexed_at REAL
+);
+CREATE INDEX IF NOT EXISTS exports_car ON exports (car, session_type);
+CREATE INDEX IF NOT EXISTS exports_driver ON exports (driver, fastest_lap);
+CREATE INDEX IF NOT EXISTS exports_session ON exports (session_type, fastest_lap);
+CREATE INDEX IF NOT EXISTS exports_hash ON exports (hash);
+"""
+
+COLUMNS = ('path', 'format', 'hash', 'size', 'mtime', 'run', 'abs', 'car', 'driver', 'engineer',
+           'session_type', 'laps', 'fastest_lap', 'duration', 'indexed_at')
+
+
+def catalog_path():
+    return os.path.join(session_cache.cache_dir(), 'catalog.sqlite')
+
+
+# Helper function to key cardrivers.json by car number
+def load_car_lookup(car_file=CAR_FILE):
+    if not car_file or not os.path.exists(car_file):
+        return {}
+    with open(car_file, 'r') as f:
+        return {entry['car']: entry for entry in json.load(f)}
+
+
+def session_type(file_path, metadata):
+    """RS3 Session header if filled in, otherwise the export's folder name (Qualifying, Race 3, ...)."""
+    session = metadata.get('Session')
+    if isinstance(session, str) and session:
+        return session
+    return os.path.basename(os.path.dirname(os.path.abspath(file_path)))
+
+
+def lap_summary(export):
+    """(valid lap count, fastest lap time) of an export, (0, None) without lap data."""
+    try:
+        laps = LapIndex.from_export(export, min_lap=MIN_LAP_TIME)
+    except ValueError:
+        return 0, None
+    valid = laps.valid_laps()
+    if not len(valid):
+        return 0, None
+    return len(valid), float(laps.lap_times[laps.fastest()])
+
+
+def run_duration(time):
+    """Logged seconds, summed over the runs of an Append_ export (Time restarts at each run)."""
+    time = np.asarray(time, dtype=np.float64)
+    time = time[np.isfinite(time)]
+    if not len(time):
+        return None
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(time) < 0) + 1, [len(time)]))
+    return float(sum(time[b - 1] - time[a] for a, b in zip(bounds[:-1], bounds[1:])))
+
+
+def describe_export(file_path, car_lookup, source_hash=None):
+    """Catalog row (dict) of one export; parses it through the session cache."""
+    stat = os.stat(file_path)
+    source_hash = source_hash or session_cache.content_hash(file_path)
+    export = session_cache.load_export(file_path, source_hash)
+    info = parse_export_filename(file_path)
+
+    car = info['car']
+    vehicle = export.metadata.get('vehicle')
+    if car is None and vehicle:
+        match = re.search(r'(\d+)\D*$', vehicle)
+        car = int(match.group(1)) if match else None
+    entry = car_lookup.get(car, {})
+    laps, fastest = lap_summary(export)
+    duration = run_duration(export['Time']) if 'Time' in export else None
+
+    return {
+        'path': os.path.abspath(file_path),
+        'format': sniff_format(file_path)['kind'],
+        'hash': source_hash,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'run': int(info['run']) if info['run'] else None,
+        'abs': info['abs'],
+        'car': car,
+        'driver': export.metadata.get('racer') or entry.get('driver'),
+        'engineer': entry.get('engineer'),
+        'session_type': session_type(file_path, export.metadata),
+        'laps': laps,
+        'fastest_lap': fastest,
+        'duration': duration,
+        'indexed_at': time.time(),
+    }
+
+
+class SessionCatalog:
+    """Connection to the catalog database, created on first use."""
+
+    def __init__(self, path=None):
+        self.path = path or catalog_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.row_factory = sqlite3.Row
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version != CATALOG_VERSION:
+            self.db.execute("DROP TABLE IF EXISTS exports")
+            self.db.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def is_current(self, file_path):
+        """True if the file is catalogued with its current size and mtime."""
+        stat = os.stat(file_path)
+        row = self.db.execute("SELECT size, mtime FROM exports WHERE path = ?",
+                              (os.path.abspath(file_path),)).fetchone()
+        return row is not None and row['size'] == stat.st_size and row['mtime'] == stat.st_mtime
+
+    def add(self, row):
+        self.db.execute(f"INSERT OR REPLACE INTO exports ({', '.join(COLUMNS)}) "
+                        f"VALUES ({', '.join('?' * len(COLUMNS))})", [row[name] for name in COLUMNS])
+        self.db.commit()
+
+    def index_file(self, file_path, car_lookup=None, source_hash=None, force=False):
+        """Catalogues one export; returns False if it was already current."""
+        if not force and self.is_current(file_path):
+            return False
+        self.add(describe_export(file_path, load_car_lookup() if car_lookup is None else car_lookup, source_hash))
+        return True
+
+    def index(self, sources, car_file=CAR_FILE, force=False):
+        """Catalogues every export under sources, subfolders included; returns (indexed, errors)."""
+        car_lookup = load_car_lookup(car_file)
+        indexed, errors = [], {}
+        for file_path in find_exports(sources, recursive=True):
+            try:
+                if self.index_file(file_path, car_lookup, force=force):
+                    indexed.append(file_path)
+            except Exception as e:
+                errors[file_path] = f"{type(e).__name__}: {e}"
+        return indexed, errors
+
+    def prune(self):
+        """Drops rows of files that no longer exist; returns how many."""
+        missing = [row['path'] for row in self.db.execute("SELECT path FROM exports")
+                   if not os.path.exists(row['path'])]
+        self.db.executemany("DELETE FROM exports WHERE path = ?", [(path,) for path in missing])
+        self.db.commit()
+        return len(missing)
+
+    def runs(self, car=None, driver=None, session_type=None):
+        """Catalogued exports matching every given filter, by run."""
+        filters = {'car': car, 'driver': driver, 'session_type': session_type}
+        where = [f"{name} = ?" for name, value in filters.items() if value is not None]
+        sql = "SELECT * FROM exports" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY run, abs"
+        return self.db.execute(sql, [value for value in filters.values() if value is not None]).fetchall()
+
+    def fastest_per_driver(self, session_type=None):
+        """Fastest catalogued lap of every driver (car when the driver is unknown), quickest first."""
+        sql = ("SELECT driver, car, MIN(fastest_lap) AS fastest_lap, path FROM exports "
+               "WHERE fastest_lap IS NOT NULL" + (" AND session_type = ?" if session_type else "") +
+               " GROUP BY COALESCE(driver, 'car ' || car) ORDER BY fastest_lap")
+        return self.db.execute(sql, (session_type,) if session_type else ()).fetchall()
+
+    def by_hash(self, source_hash):
+        return self.db.execute("SELECT * FROM exports WHERE hash = ?", (source_hash,)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index exports and query the session catalog.")
+    parser.add_argument('--db', default=None, help="catalog database (default: in the cache folder)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    index = commands.add_parser('index', help="catalogue every export under the sources")
+    index.add_argument('sources', nargs='+', help="folders, globs or export files")
+    index.add_argument('--force', action='store_true', help="re-read files that look unchanged")
+    runs = commands.add_parser('runs', help="list catalogued runs")
+    runs.add_argument('--car', type=int)
+    runs.add_argument('--driver')
+    runs.add_argument('--session')
+    fastest = commands.add_parser('fastest', help="fastest lap per driver")
+    fastest.add_argument('--session')
+    args = parser.parse_args()
+
+    with SessionCatalog(args.db) as catalog:
+        if args.command == 'index':
+            indexed, errors = catalog.index(args.sources, force=args.force)
+            pruned = catalog.prune()
+            print(f"{len(indexed)} exports indexed, {pruned} missing files dropped")
+            for path, error in errors.items():
+                print(f"{path}: FAILED {error}")
+            return 1 if errors else 0
+        if args.command == 'runs':
+            rows = catalog.runs(args.car, args.driver, args.session)
+        else:
+            rows = catalog.fastest_per_driver(args.session)
+        for row in rows:
+            print(dict(row))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,68 @@
+## Whole-session overview
+#
+# Speed and brake pressure over a full session, drawn from the zoom pyramid
+# as min/max envelopes with the mean line. session_traces can be called
+# again with a zoom window (e.g. from a FigureWidget relayout callback in a
+# notebook) and only reads the pyramid level that window needs.
+
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from tkinter import Tk
+from tkinter.filedialog import askopenfilename
+from session_cache import load_pyramid
+
+PLOT_WIDTH = 2000
+
+# First channel the export has wins (WinTAX name, RS3 name)
+SPEED_CHANNELS = ('CarSpeed', 'Speed', 'GPS Speed')
+BRAKE_CHANNELS = ('pBrakeF', 'Brake Press')
+
+
+# Helper function to pick the first available channel
+def pick_channel(pyramid, candidates):
+    for name in candidates:
+        if name in pyramid.channels:
+            return name
+    raise KeyError(f"None of {candidates} in the pyramid")
+
+
+def envelope_traces(pyramid, channel, x0=None, x1=None, width=PLOT_WIDTH, color='cyan'):
+    """Max, min (filled to max) and mean traces of one channel over [x0, x1]."""
+    x, low, high, mean = pyramid.window(channel, x0, x1, width)
+    return [
+        go.Scatter(x=x, y=high, mode='lines', line=dict(width=0, color=color), showlegend=False, hoverinfo='skip'),
+        go.Scatter(x=x, y=low, mode='lines', line=dict(width=0, color=color), fill='tonexty',
+                   opacity=0.3, name=f'{channel} min/max', hoverinfo='skip'),
+        go.Scatter(x=x, y=mean, mode='lines', line=dict(width=1, color=color), name=channel),
+    ]
+
+
+def session_traces(pyramid, x0=None, x1=None, width=PLOT_WIDTH):
+    """(row, trace) pairs for the speed and brake rows of the overview."""
+    speed = pick_channel(pyramid, SPEED_CHANNELS)
+    brake = pick_channel(pyramid, BRAKE_CHANNELS)
+    return ([(1, trace) for trace in envelope_traces(pyramid, speed, x0, x1, width, 'cyan')] +
+            [(2, trace) for trace in envelope_traces(pyramid, brake, x0, x1, width, 'red')])
+
+
+def generate_plot():
+    root = Tk()
+    root.withdraw()
+    file_path = askopenfilename(title="Select session export")
+    root.destroy()
+    if not file_path:
+        return
+
+    pyramid = load_pyramid(file_path)
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.6, 0.4], vertical_spacing=0.05,
+                        subplot_titles=["Speed", "Brake Pressure"])
+    for row, trace in session_traces(pyramid):
+        fig.add_trace(trace, row=row, col=1)
+
+    fig.update_layout(height=900, width=PLOT_WIDTH, title_text="Session Overview", template="plotly_dark")
+    fig.update_xaxes(title_text="Time (s)", row=2, col=1)
+    fig.show()
+
+
+if __name__ == "__main__":
+    generate_plot()
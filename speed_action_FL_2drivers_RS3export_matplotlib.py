@@ -1,57 +1,33 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
+from session_cache import load_export
+from lap_index import LapIndex
+from action_strip import action_runs
+from decimate import downsample, axes_pixel_width
 
 # Step 1: Load the metadata (first 14 rows) and telemetry (rest) separately
 file_path = 'Jaden Pariat Round 3 Race 1 Telemetry.csv'
 
-# Load the metadata (first 14 rows)
-metadata_df = pd.read_csv(file_path, nrows=14, header=None, engine='python')
-
-# Load the telemetry data (from row 15 onwards)
-telemetry_df = pd.read_csv(file_path, skiprows=14, low_memory=False)
-# Load the CSV file
-telemetry_df = pd.read_csv(file_path, skiprows=14, low_memory=False)
-
-# Convert all columns to numeric where possible, coercing errors to NaN
-for col in telemetry_df.columns:
-    telemetry_df[col] = pd.to_numeric(telemetry_df[col], errors='coerce')
-
-# Proceed with the rest of your code
-del_df = [2, 3]  # Adjust the columns to be deleted as needed
-telemetry_df = telemetry_df.drop(index=metadata_df.index[del_df])
+# Load the metadata (first 14 rows) and the numeric telemetry rows in one pass
+export = load_export(file_path)
+metadata_df = export.metadata_frame()
+telemetry_df = export.to_dataframe()
 
 # Extract vehicle number and driver's name from the metadata dataframe
 championship = metadata_df.iloc[2, 1]
 vehicle_number = metadata_df.iloc[2, 1]  # Vehicle number is in row 3 (index 2) and column 2 (index 1)
 driver_name = metadata_df.iloc[3, 1]  # Driver's name is in row 4 (index 3) and column 2 (index 1)
 
-# Step 2: Extract segment times from metadata
-segment_times_raw = metadata_df.iloc[12].values[1:]  # Skip the first column as it may contain labels
-
-# Convert segment times to seconds
-segment_times = []
-for time in segment_times_raw:
-    if isinstance(time, str):
-        minutes, seconds = map(float, time.split(':'))
-        total_seconds = minutes * 60 + seconds
-        segment_times.append(total_seconds)
-
-# Step 3: Remove outliers for lap times (acceptable range: 95 seconds to 120 seconds)
-laps_array = [time for time in segment_times if 95 <= time <= 120]
-
-# Step 4: Calculate start and end timestamps for the fastest lap
-fastest_lap_time = min(laps_array)
-
-# Find the index of the fastest lap
-fastest_lap_index = laps_array.index(fastest_lap_time)
+# Step 2: Extract segment times from metadata (already converted to seconds by the loader)
+segment_times = export.metadata['segment_times']
 
-# Calculate the start and end timestamps for the fastest lap
-start_time_stamp = sum(segment_times[:fastest_lap_index])
-end_time_stamp = sum(segment_times[:fastest_lap_index + 1])
+# Step 3-4: Index every lap once and pick the fastest inside the acceptable range (95 to 120 seconds)
+laps = LapIndex.from_segment_times(telemetry_df['Time'].to_numpy(), segment_times, min_lap=95, max_lap=120)
+fastest_lap_index = laps.fastest()
 
-# Step 5: Filter telemetry data for the fastest lap
-telemetry_FL = telemetry_df[(telemetry_df['Time'] >= start_time_stamp) & (telemetry_df['Time'] <= end_time_stamp)]
+# Step 5: Slice telemetry data for the fastest lap by sample offsets
+telemetry_FL = laps.frame(fastest_lap_index, telemetry_df)
 
 # Step 6: Adjust the distance calculation to be relative to the start of the fastest lap
 start_distance = telemetry_FL['Distance on GPS Speed'].iloc[0]
@@ -83,7 +59,8 @@ plt.style.use('dark_background')
 fig, ax = plt.subplots(2, figsize=(20, 11.25), gridspec_kw={'height_ratios': [3, 1]}, sharex=True)
 
 # Plot Speed vs Distance (Top Plot)
-ax[0].plot(telemetry_FL['Distance'], telemetry_FL['Speed_kmph'], label='Speed', color='cyan', linewidth=2)
+speed_x, speed_y = downsample(telemetry_FL['Distance'], telemetry_FL['Speed_kmph'], axes_pixel_width(ax[0]))
+ax[0].plot(speed_x, speed_y, label='Speed', color='cyan', linewidth=2)
 ax[0].set_ylabel('Speed (km/h)', fontweight='bold', fontsize=25)
 ax[0].set_ylim(0, 210)  # Adjust y-axis to speed range of 0 to 210 km/h
 ax[0].tick_params(axis='y', which='major', labelsize=22)
@@ -99,18 +76,10 @@ actions = ['Full Throttle', 'Turning', 'Brake']
 action_colors = {'Full Throttle': 'green', 'Turning': 'yellow', 'Brake': 'red'}
 
 for driver in ['Driver']:  # Placeholder driver name
-    driver_data = telemetry_FL.copy()
-    previous_action_end = 0
-
-    action_changes = driver_data['Action'].ne(driver_data['Action'].shift()).cumsum()
-    driver_data['ActionID'] = action_changes
-
-    grouped_actions = driver_data.groupby('ActionID')
-    for _, group in grouped_actions:
-        action_type = group['Action'].iloc[0]
-        color = action_colors[action_type]
-        ax[1].barh(driver, group['Distance'].max() - group['Distance'].min(),
-                   left=group['Distance'].min(), color=color)
+    # One barh call per action class over the run-length encoded actions
+    runs = action_runs(telemetry_FL['Action'].to_numpy(), telemetry_FL['Distance'].to_numpy())
+    for action_type, (base, length) in runs.items():
+        ax[1].barh(np.full(len(length), driver), length, left=base, color=action_colors[action_type])
 
 # Set x-label for both plots
 ax[1].set_xlabel('Distance (m)', fontweight='bold', fontsize=25)
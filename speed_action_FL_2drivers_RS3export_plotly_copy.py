@@ -4,16 +4,22 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from tkinter import Tk
 from tkinter.filedialog import askopenfilename
+from session_cache import load_export
+from lap_index import LapIndex
+from lap_delta import resample_laps, time_delta
+from action_strip import action_runs
+from decimate import downsample
+
+# Acceptable fastest-lap range in seconds, filters out/in laps and outliers
+LAP_WINDOW = (95, 120)
+
+# Figure width in pixels, traces are decimated to it
+PLOT_WIDTH = 1480
 
 # Helper function to load metadata and telemetry
 def load_data(file_path):
-    metadata_df = pd.read_csv(file_path, nrows=14, header=None, engine='python')
-    telemetry_df = pd.read_csv(file_path, skiprows=14, low_memory=False)
-    
-    for col in telemetry_df.columns:
-        telemetry_df[col] = pd.to_numeric(telemetry_df[col], errors='coerce')
-    
-    return metadata_df, telemetry_df
+    export = load_export(file_path)
+    return export.metadata_frame(), export.to_dataframe()
 
 # Helper function to convert segment times
 def convert_time_to_seconds(time_str):
@@ -30,18 +36,11 @@ def get_fastest_lap_data(metadata_df, telemetry_df):
     # Convert segment times to seconds
     segment_times = [convert_time_to_seconds(time) for time in segment_times_raw if isinstance(time, str)]
     
-    # Remove outliers for lap times (acceptable range: 95 to 120 seconds)
-    laps_array = [time for time in segment_times if 95 <= time <= 120]
+    # Index every lap once (acceptable lap range: 95 to 120 seconds)
+    laps = LapIndex.from_segment_times(telemetry_df['Time'].to_numpy(), segment_times, *LAP_WINDOW)
     
-    # Calculate start and end timestamps for the fastest lap
-    fastest_lap_time = min(laps_array)
-    fastest_lap_index = segment_times.index(fastest_lap_time)
-    
-    start_time_stamp = sum(segment_times[:fastest_lap_index])
-    end_time_stamp = sum(segment_times[:fastest_lap_index + 1])
-    
-    # Filter telemetry data for the fastest lap
-    telemetry_FL = telemetry_df[(telemetry_df['Time'] >= start_time_stamp) & (telemetry_df['Time'] <= end_time_stamp)]
+    # Slice the fastest lap by sample offsets instead of boolean masks
+    telemetry_FL = laps.frame(laps.fastest(), telemetry_df)
     
     # Adjust the distance calculation to be relative to the start of the fastest lap
     start_distance = telemetry_FL['Distance on Vehicle Speed'].iloc[0]
@@ -77,18 +76,11 @@ def select_files():
     return file_path_car1, file_path_car2
 
 def normalize_and_calculate_delta(telemetry_FL_car1, telemetry_FL_car2):
-    # Normalize time to start from zero for both drivers
-    telemetry_FL_car1['Normalized Time'] = telemetry_FL_car1['Time'] - telemetry_FL_car1['Time'].iloc[0]
-    telemetry_FL_car2['Normalized Time'] = telemetry_FL_car2['Time'] - telemetry_FL_car2['Time'].iloc[0]
-    
-    # Interpolating time over distance for alignment
-    car1_interp = pd.Series(telemetry_FL_car1['Normalized Time'].values, index=telemetry_FL_car1['Distance']).reindex(
-        telemetry_FL_car2['Distance'], method="nearest"
-    )
-    car2_interp = pd.Series(telemetry_FL_car2['Normalized Time'].values, index=telemetry_FL_car2['Distance'])
+    # Resample both laps onto a common 1 m distance grid, time normalized to start from zero
+    grid, resampled = resample_laps([telemetry_FL_car1, telemetry_FL_car2])
     
     # Calculating the time delta (car2 - car1)
-    lap_delta = car2_interp - car1_interp
+    lap_delta = pd.Series(time_delta(resampled['Elapsed'])[1], index=grid)
     return lap_delta
 
 # Main function to generate plot
@@ -123,19 +115,22 @@ def generate_plot():
                                         f"{driver_name_car2} Actions"],
                         row_heights=[0.4, 0.2, 0.2, 0.2], vertical_spacing=0.05)
     
-    # Speed plot (top)
-    fig.add_trace(go.Scatter(x=telemetry_FL_car1['Distance'], y=telemetry_FL_car1['Speed'],
+    # Speed plot (top), decimated to the figure width
+    speed_x1, speed_y1 = downsample(telemetry_FL_car1['Distance'], telemetry_FL_car1['Speed'], PLOT_WIDTH)
+    speed_x2, speed_y2 = downsample(telemetry_FL_car2['Distance'], telemetry_FL_car2['Speed'], PLOT_WIDTH)
+    fig.add_trace(go.Scatter(x=speed_x1, y=speed_y1,
                              mode='lines', name=f'{driver_name_car1} Speed', line=dict(color='orange')),
                   row=1, col=1)
-    fig.add_trace(go.Scatter(x=telemetry_FL_car2['Distance'], y=telemetry_FL_car2['Speed'],
+    fig.add_trace(go.Scatter(x=speed_x2, y=speed_y2,
                              mode='lines', name=f'{driver_name_car2} Speed', line=dict(color='cyan')),
                   row=1, col=1)
 
     # Lap Delta plot (second row)
-    fig.add_trace(go.Scatter(x=telemetry_FL_car2['Distance'], y=lap_delta,
+    delta_x, delta_y = downsample(lap_delta.index, lap_delta.values, PLOT_WIDTH)
+    fig.add_trace(go.Scatter(x=delta_x, y=delta_y,
                              mode='lines', name=f'Delta ({driver_name_car2})', line=dict(color='cyan')),
                   row=2, col=1)
-    fig.add_trace(go.Scatter(x=telemetry_FL_car2['Distance'], y=[0] * len(telemetry_FL_car2['Distance']),
+    fig.add_trace(go.Scatter(x=[lap_delta.index[0], lap_delta.index[-1]], y=[0, 0],
                              mode='lines', name='Zero Reference', line=dict(color='gray', dash='dash')),
                   row=2, col=1)
 
@@ -144,24 +139,21 @@ def generate_plot():
     legend_added = {'Brake': False, 'Full Throttle': False, 'Turning': False}
 
     # Function to plot action bars with constant height
+    # One bar trace per action class, built from the run-length encoded Action channel
     def plot_action_bars(telemetry_data, driver_name, row_idx):
-        action_changes = telemetry_data['Action'].ne(telemetry_data['Action'].shift()).cumsum()
-        telemetry_data['ActionID'] = action_changes
-        grouped_actions = telemetry_data.groupby('ActionID')
-        
-        for _, group in grouped_actions:
-            action_type = group['Action'].iloc[0]
-            color = action_colors[action_type]
+        runs = action_runs(telemetry_data['Action'].to_numpy(), telemetry_data['Distance'].to_numpy())
+        for action_type, (base, length) in runs.items():
             show_legend = not legend_added[action_type]
             if show_legend:
                 legend_added[action_type] = True
-            
-            fig.add_trace(go.Bar(x=[group['Distance'].max() - group['Distance'].min()], 
-                             y=[driver_name],  # Constant y-value
-                             marker_color=color,
-                             width=[50],
-                             base=group['Distance'].min(), 
-                             orientation='h', name=f'{action_type}' if show_legend else None,
+
+            fig.add_trace(go.Bar(x=length,
+                             y=np.full(len(length), driver_name, dtype=object),  # Constant y-value
+                             marker_color=action_colors[action_type],
+                             width=50,
+                             base=base,
+                             orientation='h', name=action_type,
+                             legendgroup=action_type,
                              showlegend=show_legend),
                       row=row_idx, col=1)
 
@@ -172,7 +164,7 @@ def generate_plot():
     plot_action_bars(telemetry_FL_car2, driver_name_car2, 4)
     
     # Update layout
-    fig.update_layout(height=80, width=1480, title_text="Telemetry Data Comparison: Fastest Lap",
+    fig.update_layout(height=80, width=PLOT_WIDTH, title_text="Telemetry Data Comparison: Fastest Lap",
                       template="plotly_dark",
                       font=dict(color='white'),
                       showlegend=True,
@@ -0,0 +1,272 @@
+## Synthetic telemetry
+#
+# Generates WinTAX-like (';' separated, decimal comma) and RS3-like (14-row
+# header, quoted CSV) exports of cars lapping the Madras International
+# Circuit, for benchmarks and for trying scripts without real data. Cars
+# follow the MIC track model centerline with a small lateral wander. The
+# speed profile is limited by corner curvature and by acceleration and
+# braking, then scaled to each driver's lap time. Throttle, brake, gear,
+# RPM, temperatures, fuel and wheel speeds are derived from it, GPS fixes
+# are held between GPS_RATE updates like the logger does, and a few heavy
+# stops get a front-left lockup.
+#
+#   python synthetic_telemetry.py --out synthetic --cars 12 --laps 5
+
+import argparse
+import csv
+import io
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import geometry
+import track_model
+
+SAMPLE_RATE = 200        # Hz, WinTAX logging rate
+GPS_RATE = 20            # Hz, GPS fixes are held in between
+LAP_TIME = 100.0         # s, nominal MIC lap for the quickest driver
+PACE_SPREAD = 0.03       # slowest driver is this fraction slower
+LAP_SCATTER = 0.004      # lap-to-lap pace variation (fraction)
+LATERAL_WANDER = 1.5     # m, line variation either side of the centerline
+
+# Vehicle model
+A_LAT = 18.0             # m/s^2 cornering limit
+A_BRAKE = 14.0           # m/s^2 braking limit
+A_DRIVE = 7.0            # m/s^2 traction limit at standstill
+V_DRAG = 64.0            # m/s, speed where drag cancels the drive force
+CURVATURE_SMOOTHING = 15 # centerline points averaged before taking curvature
+GEAR_SPEEDS = (0, 55, 85, 115, 145, 175)   # km/h upshift points for gears 1..6
+TOP_SPEED = 215.0        # km/h at SHIFT_RPM in top gear
+SHIFT_RPM = 6600
+MAX_BRAKE_PRESSURE = 60.0                  # bar front at A_BRAKE
+LOCKUP_CHANCE = 0.05     # probability a heavy stop locks the front left
+
+WINTAX_CHANNELS = ('Time', 'GPS_Lat', 'GPS_Long', 'CarSpeed', 'pBrakeF', 'pBrakeR', 'tWater', 'tOil',
+                   'mFuelConsLap', 'Logger_Lap', 'aSteering', 'RPM', 'Gear', 'GPS_Speed', 'VBatt', 'rPedal',
+                   'tAir', 'WSpeed_FL', 'WSpeed_FR', 'DistanceLap', 'DistanceFull', 'BrakeBalance', 'pOil',
+                   'PBX_LP_Fuel_Current')
+# RS3 name: (source channel, decimals)
+RS3_CHANNELS = {
+    'Time': ('Time', 3), 'Speed': ('CarSpeed', 1), 'GPS Latitude': ('GPS_Lat', 8),
+    'GPS Longitude': ('GPS_Long', 8), 'Throttle Pos': ('rPedal', 1), 'Brake Pos': ('BrakePos', 1),
+    'Brake Press': ('pBrakeF', 2), 'Distance on Vehicle Speed': ('DistanceFull', 2),
+    'RPM': ('RPM', 0), 'Gear': ('Gear', 0),
+}
+DECIMALS = {'Time': 3, 'GPS_Lat': 7, 'GPS_Long': 7, 'Logger_Lap': 0, 'RPM': 0, 'Gear': 0,
+            'DistanceLap': 0, 'DistanceFull': 0, 'mFuelConsLap': 3, 'VBatt': 2, 'pOil': 2}
+
+
+def _smooth_closed(values, points):
+    kernel = np.ones(points) / points
+    pad = points // 2
+    return np.convolve(np.concatenate((values[-pad:], values, values[:points - pad - 1])), kernel, mode='valid')
+
+
+def speed_profile(x, y, step):
+    """Limit speed (m/s) at every point of a closed centerline."""
+    xs, ys = _smooth_closed(x, CURVATURE_SMOOTHING), _smooth_closed(y, CURVATURE_SMOOTHING)
+    heading = np.unwrap(np.arctan2(np.roll(ys, -1) - ys, np.roll(xs, -1) - xs))
+    curvature = np.abs(np.gradient(heading)) / step
+    limit = np.sqrt(A_LAT / np.maximum(curvature, 1e-6))
+    limit = np.minimum(limit, V_DRAG)
+
+    # Two laps of forward (traction) and backward (braking) passes close the loop
+    v = limit.copy()
+    n = len(v)
+    for _ in range(2):
+        for i in range(1, 2 * n):
+            prev, cur = (i - 1) % n, i % n
+            drive = A_DRIVE * max(1 - v[prev] / V_DRAG, 0)
+            v[cur] = min(v[cur], np.sqrt(v[prev] ** 2 + 2 * drive * step))
+        for i in range(2 * n - 2, -1, -1):
+            cur, nxt = i % n, (i + 1) % n
+            v[cur] = min(v[cur], np.sqrt(v[nxt] ** 2 + 2 * A_BRAKE * step))
+    return v, curvature
+
+
+class SyntheticTrack:
+    """MIC centerline with its speed profile, shared by every generated car."""
+
+    def __init__(self, model=None):
+        model = model or track_model.load_track_model('MIC')
+        self.origin = model.origin
+        self.x, self.y = model.x, model.y
+        self.step = track_model.CENTERLINE_STEP
+        self.length = len(self.x) * self.step
+        self.speed, self.curvature = speed_profile(self.x, self.y, self.step)
+        # Scale so the quickest driver laps in LAP_TIME
+        self.speed *= np.sum(self.step / self.speed) / LAP_TIME
+        self.distance = np.arange(len(self.x) + 1) * self.step
+        tx, ty = np.gradient(self.x), np.gradient(self.y)
+        norm = np.hypot(tx, ty)
+        self.nx, self.ny = -ty / norm, tx / norm
+
+    def _at(self, values, position):
+        return np.interp(position, self.distance, np.append(values, values[0]))
+
+    def session(self, laps, pace=1.0, rate=SAMPLE_RATE, rng=None):
+        """{channel: array} of a car doing `laps` flying laps from the SF line."""
+        rng = rng or np.random.default_rng()
+        n = len(self.x)
+        lap_pace = pace * (1 + rng.normal(0, LAP_SCATTER, laps))
+        # Time at every centerline point of every lap
+        dt = self.step / self.speed
+        point_times = np.concatenate([[0.0], np.cumsum(np.concatenate([dt * p for p in lap_pace]))])
+        point_distance = np.arange(laps * n + 1) * self.step
+
+        time = np.arange(0, point_times[-1], 1.0 / rate)
+        full = np.interp(time, point_times, point_distance)
+        lap_index = np.minimum((full // self.length).astype(int), laps - 1)
+        position = full - lap_index * self.length
+        scale = lap_pace[lap_index]
+
+        speed = self._at(self.speed, position) / scale
+        accel = np.gradient(speed, time)
+        wander = LATERAL_WANDER * np.sin(full / 180.0 + rng.uniform(0, 2 * np.pi))
+        east = self._at(self.x, position) + wander * self._at(self.nx, position)
+        north = self._at(self.y, position) + wander * self._at(self.ny, position)
+        lat, lon = geometry.from_enu(east, north, self.origin)
+
+        # GPS fixes and GPS speed are held between updates
+        held = (np.arange(len(time)) // (rate // GPS_RATE)) * (rate // GPS_RATE)
+        kmh = speed * 3.6 + rng.normal(0, 0.2, len(time))
+
+        brake = np.clip(-accel / A_BRAKE, 0, 1)
+        brake[brake < 0.05] = 0
+        throttle = np.where(accel > 0.3, 100.0, np.where(brake > 0, 0.0, 45.0))
+        throttle = np.clip(throttle + rng.normal(0, 0.5, len(time)), 0, 101.7)
+        gear = np.searchsorted(GEAR_SPEEDS, kmh, side='right').clip(1, len(GEAR_SPEEDS))
+        shift_speed = np.append(GEAR_SPEEDS[1:], TOP_SPEED)[gear - 1]
+        rpm = np.clip(kmh / shift_speed * SHIFT_RPM, 2500, SHIFT_RPM + 200)
+
+        wheel_fl = kmh + rng.normal(0, 0.3, len(time))
+        wheel_fr = kmh + rng.normal(0, 0.3, len(time))
+        # Front-left lockups on a few of the heaviest stops
+        heavy = np.flatnonzero((brake > 0.8) & (np.roll(brake, 1) <= 0.8))
+        for start in heavy[rng.random(len(heavy)) < LOCKUP_CHANCE]:
+            stop = min(start + int(0.3 * rate), len(time))
+            wheel_fl[start:stop] *= 0.7
+
+        warm = 1 - np.exp(-time / 300.0)
+        fuel_rate = 1.4 / LAP_TIME * throttle / 100.0 / 0.7   # l/s, about 1.4 l a lap
+        fuel_total = np.cumsum(fuel_rate) / rate
+        lap_start = np.searchsorted(lap_index, np.arange(laps))
+        fuel_lap = fuel_total - fuel_total[lap_start][lap_index]
+
+        return {
+            'Time': time,
+            'GPS_Lat': lat[held],
+            'GPS_Long': lon[held],
+            'CarSpeed': kmh,
+            'pBrakeF': brake * MAX_BRAKE_PRESSURE + rng.normal(0, 0.1, len(time)),
+            'pBrakeR': brake * MAX_BRAKE_PRESSURE * 0.72 + rng.normal(0, 0.1, len(time)),
+            'BrakePos': brake * 100.0,
+            'tWater': 85 + 12 * warm + rng.normal(0, 0.2, len(time)),
+            'tOil': 95 + 18 * warm + rng.normal(0, 0.2, len(time)),
+            'mFuelConsLap': fuel_lap,
+            'Logger_Lap': lap_index + 1,
+            'aSteering': np.degrees(np.arctan(2.7 * self._at(self.curvature, position))) * 12.0,
+            'RPM': rpm,
+            'Gear': gear,
+            'GPS_Speed': kmh[held],
+            'VBatt': 14.3 + rng.normal(0, 0.04, len(time)),
+            'rPedal': throttle,
+            'tAir': 35 + rng.normal(0, 0.1, len(time)),
+            'WSpeed_FL': wheel_fl,
+            'WSpeed_FR': wheel_fr,
+            'DistanceLap': position,
+            'DistanceFull': full,
+            'BrakeBalance': np.where(brake > 0, 58 + rng.normal(0, 0.5, len(time)), -1.0),
+            'pOil': 1.0 + rpm / 1500 + rng.normal(0, 0.02, len(time)),
+            'PBX_LP_Fuel_Current': 12 + rng.normal(0, 0.3, len(time)),
+        }
+
+
+def _rounded_table(columns):
+    """pyarrow Table of {name: (values, decimals)}; whole-number channels as integers."""
+    arrays = {}
+    for name, (values, decimals) in columns.items():
+        values = np.round(values, decimals)
+        arrays[name] = values.astype(np.int64) if decimals == 0 else values
+    return pa.table(arrays)
+
+
+def write_wintax(path, channels):
+    """';' separated WinTAX export with decimal commas."""
+    table = _rounded_table({name: (channels[name], DECIMALS.get(name, 1)) for name in WINTAX_CHANNELS})
+    # WinTAX ends every row with a separator: an all-empty last column
+    table = table.append_column('', pa.nulls(len(table)))
+    body = io.BytesIO()
+    pa_csv.write_csv(table, body, pa_csv.WriteOptions(include_header=False, delimiter=';', quoting_style='none'))
+    with open(path, 'wb') as f:
+        f.write((';'.join(WINTAX_CHANNELS) + ';\n').encode())
+        f.write(body.getvalue().translate(bytes.maketrans(b'.', b',')))
+
+
+def write_rs3(path, channels, racer, vehicle, lap_times, rate=SAMPLE_RATE):
+    """RaceStudio3 CSV export with the 14-row header."""
+    segment_times = [f"{int(t // 60)}:{t % 60:06.3f}" for t in lap_times]
+    duration = channels['Time'][-1]
+    header = [
+        ['Format', 'AiM CSV File'], ['Venue', 'MIC'], ['Vehicle', vehicle], ['Racer', racer],
+        ['Championship', 'F4 India'], ['Session', 'Synthetic'], ['Date', ''], ['Time', ''],
+        ['Sample Rate', str(rate)], ['Duration', f"{duration:.3f}"], ['Segment', 'Session'],
+        ['Beacon Markers'] + [f"{t:.3f}" for t in np.cumsum(lap_times)],
+        ['Segment Times'] + segment_times, [],
+    ]
+    table = _rounded_table({name: (channels[source], decimals) for name, (source, decimals) in RS3_CHANNELS.items()})
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        writer.writerows(header)
+        writer.writerow(list(RS3_CHANNELS))
+        writer.writerow(['' for _ in RS3_CHANNELS])
+    with open(path, 'ab') as f:
+        pa_csv.write_csv(table, f, pa_csv.WriteOptions(include_header=False, quoting_style='all_valid'))
+
+
+def lap_times(channels):
+    """Duration of every lap from the Logger_Lap counter."""
+    laps = channels['Logger_Lap']
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(laps)) + 1, [len(laps)]))
+    time = channels['Time']
+    ends = np.append(time[starts[1:-1]], time[-1] + (time[1] - time[0]))
+    return ends - time[starts[:-1]]
+
+
+def generate_event(out_dir, cars=12, laps=5, formats=('wintax', 'rs3'), rate=SAMPLE_RATE, seed=0, track=None):
+    """Writes one export per car and format; returns the file paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    track = track or SyntheticTrack()
+    rng = np.random.default_rng(seed)
+    paces = 1 + np.sort(rng.uniform(0, PACE_SPREAD, cars))
+    paces[0] = 1.0
+    written = []
+    for i, pace in enumerate(paces):
+        car = 100 + i
+        channels = track.session(laps, pace, rate, rng)
+        if 'wintax' in formats:
+            path = os.path.join(out_dir, f"Tr{900 + i:03d}_Abs{i + 1:08d}_F4-{car:03d}_Lap0_cableData-SYN.txt")
+            write_wintax(path, channels)
+            written.append(path)
+        if 'rs3' in formats:
+            path = os.path.join(out_dir, f"RS3_F4-{car:03d}_synthetic.csv")
+            write_rs3(path, channels, f"Driver {car}", f"F4-{car}", lap_times(channels), rate)
+            written.append(path)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic MIC exports.")
+    parser.add_argument('--out', default='synthetic', help="output folder")
+    parser.add_argument('--cars', type=int, default=2)
+    parser.add_argument('--laps', type=int, default=3)
+    parser.add_argument('--formats', nargs='+', default=['wintax', 'rs3'], choices=['wintax', 'rs3'])
+    parser.add_argument('--rate', type=int, default=SAMPLE_RATE)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for path in generate_event(args.out, args.cars, args.laps, args.formats, args.rate, args.seed):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
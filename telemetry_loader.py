@@ -0,0 +1,234 @@
+## Telemetry loader
+#
+# One loader for every export format we get from the loggers:
+#   - WinTAX .txt  : ';' separated, decimal comma (Time column uses '.')
+#   - WinTAX .csv  : ',' separated, decimal point
+#   - WinTAX .prn  : tab separated, decimal comma, Time as "seconds:hundredths"
+#   - WinTAX .xlsx : Excel sheet with the channel names in the first row
+#   - RaceStudio3  : ',' separated, 14 row metadata block before the header
+#
+# Everything is parsed straight into typed numpy arrays in a single pass.
+
+import glob
+import io
+import os
+import re
+import numpy as np
+import pandas as pd
+from profiling import profiled
+
+RS3_HEADER_ROWS = 14
+SNIFF_BYTES = 64 * 1024
+EXPORT_PATTERNS = ('*.csv', '*.txt', '*.prn', '*.xlsx')
+
+# Channels kept in float64: GPS degrees need more precision than float32
+# can hold (~0.1 m at 13 deg N) and Time/distance counters drive lap slicing
+FLOAT64_CHANNELS = {
+    'Time', 'GPS_Lat', 'GPS_Long', 'GPS_LAT', 'GPS_LONG',
+    'GPS Latitude', 'GPS Longitude', 'DistanceFull',
+    'Distance on Vehicle Speed', 'Distance on GPS Speed',
+}
+
+_NUMBER = re.compile(r'^[-+]?(\d+([.,]\d*)?|[.,]\d+)([eE][-+]?\d+)?$')
+_PRN_TIME = re.compile(r'^\d+:\d{2}$')
+
+
+class TelemetryExport:
+    """Parsed export: one numpy array per channel plus the file metadata."""
+
+    def __init__(self, columns, metadata):
+        self.columns = columns
+        self.metadata = metadata
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    @property
+    def channels(self):
+        return list(self.columns)
+
+    def to_dataframe(self):
+        """Wraps the arrays in a DataFrame without copying them."""
+        return pd.DataFrame(self.columns, copy=False)
+
+    def metadata_frame(self):
+        """RS3 header block laid out like pd.read_csv(nrows=14, header=None)."""
+        rows = self.metadata.get('header_rows', [])
+        return pd.DataFrame([[value if value != '' else np.nan for value in row] for row in rows])
+
+
+# Helper function to convert RS3 segment times ("m:ss.sss") to seconds
+def convert_time_to_seconds(time_str):
+    try:
+        minutes, seconds = map(float, time_str.split(':'))
+        return minutes * 60 + seconds
+    except ValueError:
+        return np.nan
+
+
+def parse_export_filename(file_path):
+    """Extracts run (Tr), Abs counter, car (F4-) and lap from a WinTAX file name."""
+    filename = os.path.basename(file_path)
+    run_match = re.search(r'Tr(\d+)', filename)
+    abs_match = re.search(r'Abs(\d+)', filename)
+    car_match = re.search(r'F4-(\d+)', filename)
+    lap_match = re.search(r'Lap(\d+)', filename)
+    tag_match = re.search(r'cableData-?([^.]*)', filename)
+    return {
+        'run': run_match.group(1) if run_match else None,
+        'abs': int(abs_match.group(1)) if abs_match else None,
+        'car': int(car_match.group(1)) if car_match else None,
+        'lap': int(lap_match.group(1)) if lap_match else None,
+        'session_tag': (tag_match.group(1) or None) if tag_match else None,
+        'appended': filename.startswith('Append_'),
+    }
+
+
+def find_exports(sources, recursive=False):
+    """Export files from folders, globs or file paths, sorted; recursive also searches subfolders."""
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            for pattern in EXPORT_PATTERNS:
+                pattern = os.path.join('**', pattern) if recursive else pattern
+                files.extend(glob.glob(os.path.join(glob.escape(source), pattern), recursive=recursive))
+        else:
+            files.extend(path for path in glob.glob(source, recursive=recursive) if os.path.isfile(path))
+    return sorted(set(files))
+
+
+def _split_line(line, delimiter):
+    return [field.strip().strip('"') for field in line.rstrip('\r\n').split(delimiter)]
+
+
+def _is_number(field):
+    return bool(_NUMBER.match(field))
+
+
+def _is_data_row(fields):
+    values = [field for field in fields if field != '']
+    return bool(values) and all(_is_number(v) or _PRN_TIME.match(v) for v in values)
+
+
+def sniff_format(file_path, head=None):
+    """Works out how an export is laid out from the first few KB of the file."""
+    if head is None:
+        with open(file_path, 'rb') as f:
+            head = f.read(SNIFF_BYTES)
+
+    if head.startswith(b'PK\x03\x04') or file_path.lower().endswith(('.xlsx', '.xls')):
+        return {'kind': 'xlsx', 'delimiter': None, 'decimal': '.',
+                'header_row': 0, 'data_row': 1, 'prn_time': False}
+
+    lines = head.decode('latin-1').splitlines()
+    if not lines:
+        raise ValueError(f"{file_path} is empty")
+
+    first_cell = _split_line(lines[0], ',')[0]
+    if first_cell == 'Format' or len(lines) > RS3_HEADER_ROWS and 'Time' in _split_line(lines[RS3_HEADER_ROWS], ','):
+        header_row = RS3_HEADER_ROWS
+        kind = 'rs3'
+    else:
+        header_row = 0
+        kind = None
+
+    header = lines[header_row]
+    delimiter = max(['\t', ';', ','], key=header.count)
+
+    data_row = None
+    for i in range(header_row + 1, len(lines)):
+        if _is_data_row(_split_line(lines[i], delimiter)):
+            data_row = i
+            break
+    if data_row is None:
+        raise ValueError(f"No numeric rows found in {file_path}")
+
+    sample = lines[data_row]
+    prn_time = bool(_PRN_TIME.match(_split_line(sample, delimiter)[0]))
+    decimal = ',' if delimiter != ',' and ',' in sample else '.'
+    if kind is None:
+        kind = 'prn' if delimiter == '\t' else 'wintax'
+
+    return {'kind': kind, 'delimiter': delimiter, 'decimal': decimal,
+            'header_row': header_row, 'data_row': data_row, 'prn_time': prn_time}
+
+
+def _parse_rs3_metadata(lines):
+    """Turns the RS3 key/value header block into a dict (Segment Times in seconds)."""
+    rows = [_split_line(line, ',') for line in lines[:RS3_HEADER_ROWS]]
+    metadata = {'header_rows': rows}
+    for row in rows:
+        if row and row[0]:
+            values = [value for value in row[1:] if value != '']
+            metadata[row[0]] = values[0] if len(values) == 1 else values
+    if len(rows) > 12:
+        metadata['segment_times'] = [convert_time_to_seconds(t) for t in rows[12][1:] if t]
+    metadata['vehicle'] = rows[2][1] if len(rows) > 2 and len(rows[2]) > 1 else None
+    metadata['racer'] = rows[3][1] if len(rows) > 3 and len(rows[3]) > 1 else None
+    return metadata
+
+
+def _channel_dtype(name):
+    return np.float64 if name in FLOAT64_CHANNELS else np.float32
+
+
+def _load_xlsx(file_path):
+    sheet = pd.read_excel(file_path)
+    sheet = sheet.loc[:, [not str(c).startswith('Unnamed') for c in sheet.columns]]
+    columns = {}
+    for name in sheet.columns:
+        columns[str(name)] = pd.to_numeric(sheet[name], errors='coerce').to_numpy(_channel_dtype(str(name)))
+    return columns
+
+
+@profiled
+def load_export(file_path):
+    """Loads any supported export into a TelemetryExport."""
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+
+    layout = sniff_format(file_path, raw[:SNIFF_BYTES])
+    metadata = {'source': os.path.abspath(file_path), 'format': layout['kind']}
+    metadata.update(parse_export_filename(file_path))
+
+    if layout['kind'] == 'xlsx':
+        columns = _load_xlsx(file_path)
+        return TelemetryExport(columns, metadata)
+
+    text_head = raw[:SNIFF_BYTES].decode('latin-1').splitlines()
+    if layout['kind'] == 'rs3':
+        metadata.update(_parse_rs3_metadata(text_head))
+
+    names = _split_line(text_head[layout['header_row']], layout['delimiter'])
+    keep = [i for i, name in enumerate(names) if name != '']
+    names = [names[i] for i in keep]
+
+    # Normalise decimal commas and prn "ss:hh" times to '.' on the raw bytes,
+    # so the C parser can produce typed columns directly
+    if layout['decimal'] == ',' or layout['prn_time']:
+        table = bytes.maketrans(b',:', b'..') if layout['prn_time'] else bytes.maketrans(b',', b'.')
+        raw = raw.translate(table)
+
+    frame = pd.read_csv(
+        io.BytesIO(raw),
+        sep=layout['delimiter'],
+        header=None,
+        skiprows=layout['data_row'],
+        usecols=keep,
+        dtype={i: _channel_dtype(name) for i, name in zip(keep, names)},
+        skip_blank_lines=True,
+        engine='c',
+    )
+    columns = {name: frame[i].to_numpy() for i, name in zip(keep, names)}
+    return TelemetryExport(columns, metadata)
+
+
+def load_dataframe(file_path):
+    """Convenience wrapper returning the telemetry as a DataFrame."""
+    return load_export(file_path).to_dataframe()
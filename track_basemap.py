@@ -0,0 +1,202 @@
+## Track basemap
+#
+# Offline replacement for the Mapbox tiles under the track maps. The track
+# outline (centerline plus both edges, TRACK_WIDTH apart) is built once per
+# circuit from GPS traces: the circuit's reference lap when circuits.json
+# has one, otherwise the first trace drawn there. It is cached as a small
+# .npz next to the session cache. Plotly maps draw it as GeoJSON layers on
+# the token-free "white-bg" style and matplotlib maps as a polygon patch,
+# so rendering never fetches anything over the network.
+
+import os
+import numpy as np
+from matplotlib.patches import PathPatch
+from matplotlib.path import Path
+import geometry
+import session_cache
+import track_model
+
+BASEMAP_VERSION = 1
+TRACK_WIDTH = 12.0         # metres between the drawn track edges
+OUTLINE_STEP = 2.0         # metres between outline points
+SMOOTHING = 5              # points in the moving average applied to GPS centerlines
+CIRCUIT_RADIUS = 5000.0    # a trace this close to a circuit's gates belongs to it
+BACKGROUND_MARGIN = 2000.0 # metres of dark background around the outline
+
+TRACK_COLOR = '#3a3a3a'
+EDGE_COLOR = '#8c8c8c'
+BACKGROUND_COLOR = '#111111'
+
+
+def find_circuit(lat, lon, circuits=None):
+    """Key of the circuits.json circuit the trace was driven on, or None."""
+    circuits = circuits or track_model.load_circuits()
+    lat0, lon0 = geometry.trace_origin(lat, lon)
+    best, best_distance = None, CIRCUIT_RADIUS
+    for key, circuit in circuits.items():
+        boxes = list(circuit.get('gates', {}).values())
+        if not boxes:
+            continue
+        box_lat = np.mean([[float(b['GPS_Lat1']), float(b['GPS_Lat2'])] for b in boxes])
+        box_lon = np.mean([[float(b['GPS_Long1']), float(b['GPS_Long2'])] for b in boxes])
+        distance = float(geometry.haversine(lat0, lon0, box_lat, box_lon))
+        if distance < best_distance:
+            best, best_distance = key, distance
+    return best
+
+
+def centerline_from_trace(lat, lon):
+    """Closed, smoothed centerline (lat, lon) from a lap of GPS samples."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    valid = np.isfinite(lat) & np.isfinite(lon) & (lat != 0) & (lon != 0)
+    lat, lon = lat[valid], lon[valid]
+    # Drop held GPS fixes
+    changed = np.ones(len(lat), dtype=bool)
+    changed[1:] = (np.diff(lat) != 0) | (np.diff(lon) != 0)
+    lat, lon = lat[changed], lon[changed]
+
+    origin = geometry.trace_origin(lat, lon)
+    x, y, _ = track_model._resample_closed(*geometry.to_enu(lat, lon, origin), OUTLINE_STEP)
+    kernel = np.ones(SMOOTHING) / SMOOTHING
+    pad = SMOOTHING // 2
+    x = np.convolve(np.concatenate((x[-pad:], x, x[:pad])), kernel, mode='valid')
+    y = np.convolve(np.concatenate((y[-pad:], y, y[:pad])), kernel, mode='valid')
+    return geometry.from_enu(x, y, origin)
+
+
+def _ring_area(x, y):
+    """Signed shoelace area, positive for counter-clockwise rings."""
+    return 0.5 * np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+
+
+class TrackBasemap:
+    """Track outline of one circuit in GPS degrees."""
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.center_lat, self.center_lon = arrays['center']
+        self.outer_lat, self.outer_lon = arrays['outer']
+        self.inner_lat, self.inner_lon = arrays['inner']
+
+    @classmethod
+    def from_centerline(cls, lat, lon, width=TRACK_WIDTH):
+        origin = geometry.trace_origin(lat, lon)
+        x, y = geometry.to_enu(lat, lon, origin)
+        # Unit normals from the centred tangent of the closed loop
+        tx, ty = np.roll(x, -1) - np.roll(x, 1), np.roll(y, -1) - np.roll(y, 1)
+        norm = np.hypot(tx, ty)
+        norm[norm == 0] = 1.0
+        nx, ny = -ty / norm, tx / norm
+        left = (x + nx * width / 2, y + ny * width / 2)
+        right = (x - nx * width / 2, y - ny * width / 2)
+        outer, inner = (left, right) if abs(_ring_area(*left)) > abs(_ring_area(*right)) else (right, left)
+        # Outer ring counter-clockwise, inner ring (the hole) clockwise
+        if _ring_area(*outer) < 0:
+            outer = (outer[0][::-1], outer[1][::-1])
+        if _ring_area(*inner) > 0:
+            inner = (inner[0][::-1], inner[1][::-1])
+        return cls({
+            'center': np.array([lat, lon]),
+            'outer': np.array(geometry.from_enu(*outer, origin)),
+            'inner': np.array(geometry.from_enu(*inner, origin)),
+        })
+
+    @property
+    def centre(self):
+        return float(self.center_lat.mean()), float(self.center_lon.mean())
+
+    def save(self, path):
+        # Written aside and renamed, batch workers may build the same circuit at once
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, version=BASEMAP_VERSION, **self.arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data['version']) != BASEMAP_VERSION:
+                raise ValueError(f"{path} is an old basemap version")
+            return cls({name: data[name] for name in ('center', 'outer', 'inner')})
+
+    def _ring(self, lat, lon):
+        return np.column_stack([np.append(lon, lon[0]), np.append(lat, lat[0])]).round(6).tolist()
+
+    def geojson(self):
+        """Track surface as a GeoJSON polygon (outer edge with the infield as a hole)."""
+        return {'type': 'Feature', 'properties': {}, 'geometry': {
+            'type': 'Polygon',
+            'coordinates': [self._ring(self.outer_lat, self.outer_lon), self._ring(self.inner_lat, self.inner_lon)],
+        }}
+
+    def _background(self):
+        lat0, lon0 = self.centre
+        east, north = geometry.to_enu(self.outer_lat, self.outer_lon, (lat0, lon0))
+        m = BACKGROUND_MARGIN
+        lat, lon = geometry.from_enu(np.array([east.min() - m, east.max() + m, east.max() + m, east.min() - m]),
+                                     np.array([north.min() - m, north.min() - m, north.max() + m, north.max() + m]),
+                                     (lat0, lon0))
+        return {'type': 'Feature', 'properties': {},
+                'geometry': {'type': 'Polygon', 'coordinates': [self._ring(lat, lon)]}}
+
+    def mapbox_layout(self, zoom=16, center=None):
+        """mapbox layout dict for Scattermapbox figures, no tiles or token needed."""
+        lat0, lon0 = self.centre if center is None else center
+        return dict(
+            style='white-bg',
+            center=dict(lat=lat0, lon=lon0),
+            zoom=zoom,
+            layers=[
+                dict(sourcetype='geojson', source=self._background(), type='fill', color=BACKGROUND_COLOR, below='traces'),
+                dict(sourcetype='geojson', source=self.geojson(), type='fill', color=TRACK_COLOR,
+                     fill=dict(outlinecolor=EDGE_COLOR), below='traces'),
+            ],
+        )
+
+    def draw(self, ax, zorder=0):
+        """Adds the track surface to a matplotlib Axes plotted as longitude (x) vs latitude (y)."""
+        outer = np.column_stack([self.outer_lon, self.outer_lat])
+        inner = np.column_stack([self.inner_lon, self.inner_lat])
+        vertices = np.concatenate([outer, outer[:1], inner, inner[:1]])
+        codes = np.full(len(vertices), Path.LINETO)
+        codes[0] = codes[len(outer) + 1] = Path.MOVETO
+        codes[len(outer)] = codes[-1] = Path.CLOSEPOLY
+        patch = PathPatch(Path(vertices, codes), facecolor=TRACK_COLOR, edgecolor=EDGE_COLOR,
+                          linewidth=0.5, zorder=zorder)
+        ax.add_patch(patch)
+        return patch
+
+
+def basemap_path(name):
+    return os.path.join(session_cache.cache_dir(), f"basemap-{name}-v{BASEMAP_VERSION}.npz")
+
+
+def load_basemap(lat, lon, circuits=None):
+    """Cached outline of the circuit a GPS trace was driven on, built on first use."""
+    circuits = circuits or track_model.load_circuits()
+    key = find_circuit(lat, lon, circuits)
+    if key is None:
+        lat0, lon0 = geometry.trace_origin(lat, lon)
+        name = f"trace-{lat0:.3f}-{lon0:.3f}"
+    else:
+        name = key
+    path = basemap_path(name)
+    if os.path.exists(path):
+        try:
+            return TrackBasemap.load(path)
+        except (OSError, ValueError, KeyError):
+            pass  # rebuild below
+
+    if key is not None and circuits[key].get('reference'):
+        c_lat, c_lon = track_model.load_track_model(key, circuits=circuits).centerline_latlon
+        step = max(int(round(OUTLINE_STEP / track_model.CENTERLINE_STEP)), 1)
+        c_lat, c_lon = c_lat[::step], c_lon[::step]
+    else:
+        c_lat, c_lon = centerline_from_trace(lat, lon)
+    basemap = TrackBasemap.from_centerline(c_lat, c_lon)
+    try:
+        os.makedirs(session_cache.cache_dir(), exist_ok=True)
+        basemap.save(path)
+    except OSError as e:
+        print(f"Could not cache the track basemap: {e}")
+    return basemap
@@ -0,0 +1,203 @@
+## Batch track maps
+#
+# Renders gear, brake pressure, speed and throttle coloured track maps for
+# every export in an event folder and its session subfolders, without
+# dialogs or plt.show(). Maps go to the same subfolder under --out, so
+# exports with the same name in two sessions do not overwrite each other;
+# exports without GPS (.prn) are skipped with a notice. Files are
+# spread over a process pool; each worker draws on matplotlib Figure
+# objects with the Agg canvas (no GUI backend), builds the LineCollection
+# segment array once per lap (one point per MAP_STEP metres) and reuses it
+# for every channel map, and writes PNG and/or SVG files.
+#
+#   python track_map_batch.py "Marelli WinTAX Exports" --out track_maps
+#   python track_map_batch.py "Marelli WinTAX Exports/Qualifying" --out track_maps --formats png svg
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.colors import LinearSegmentedColormap, Normalize
+from matplotlib.figure import Figure
+from matplotlib import colormaps
+from session_cache import load_export
+from telemetry_loader import parse_export_filename, find_exports
+from lap_index import LapIndex
+from session_catalog import CAR_FILE
+from track_basemap import load_basemap
+from geometry import cumulative_distance
+from decimate import distance_indices
+
+MIN_LAP_TIME = 60        # shorter logger laps are partial
+MAP_STEP = 1.0           # metres of track per map segment
+FIGSIZE = (10, 8)
+DPI = 150
+
+# GPS channel names (WinTAX, RS3)
+LATITUDE = ('GPS_Lat', 'GPS Latitude')
+LONGITUDE = ('GPS_Long', 'GPS Longitude')
+
+GREEN_YELLOW_RED = LinearSegmentedColormap.from_list("GreenYellowRed", ["green", "yellow", "red"])
+
+# name: (channel candidates, colormap, colour range or None for the lap's min/max, colorbar label, line width)
+MAP_KINDS = {
+    'gear': (('Gear',), colormaps['Paired'], (1, colormaps['Paired'].N + 1), 'Gear', 4),
+    'brake': (('pBrakeF', 'Brake Press'), GREEN_YELLOW_RED, None, 'Front Brake pressure', 2),
+    'speed': (('CarSpeed', 'Speed', 'GPS Speed'), colormaps['plasma'], None, 'Speed (km/h)', 3),
+    'throttle': (('rPedal', 'Throttle Pos'), colormaps['RdYlGn'], (0, 100), 'Throttle (%)', 3),
+}
+
+
+# Helper function to pick the first channel the export has
+def first_channel(export, candidates):
+    for name in candidates:
+        if name in export:
+            return name
+    return None
+
+
+# Helper function to look up the driver for a car number
+def driver_for(car, car_data):
+    for entry in car_data:
+        if entry['car'] == car:
+            return entry['driver']
+    return 'Unknown'
+
+
+def map_lap(export):
+    """The fastest complete lap of the export, or the whole export if it has no laps."""
+    try:
+        laps = LapIndex.from_export(export, min_lap=MIN_LAP_TIME)
+        return laps.view(laps.fastest(), export)
+    except ValueError:
+        return export
+
+
+def lap_segments(lat, lon):
+    """(n - 1, 2, 2) LineCollection segments of a GPS trace, longitude on x."""
+    points = np.column_stack([lon, lat]).reshape(-1, 1, 2)
+    return np.concatenate([points[:-1], points[1:]], axis=1)
+
+
+def render_map(segments, values, kind, title, basemap=None):
+    """One coloured track map as an Agg-backed Figure."""
+    _, cmap, value_range, label, width = MAP_KINDS[kind]
+    fig = Figure(figsize=FIGSIZE, dpi=DPI)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    if basemap is not None:
+        basemap.draw(ax)
+
+    low, high = value_range if value_range else (np.nanmin(values), np.nanmax(values))
+    lc = LineCollection(segments, norm=Normalize(low, high), cmap=cmap)
+    lc.set_array(values[:-1])
+    lc.set_linewidth(width)
+    ax.add_collection(lc)
+    ax.autoscale_view()
+    ax.set_aspect('equal', adjustable='datalim')
+    ax.tick_params(labelleft=False, left=False, labelbottom=False, bottom=False)
+    fig.suptitle(title)
+    fig.colorbar(lc, ax=ax, label=label)
+    return fig
+
+
+def render_file(file_path, out_dir, kinds=tuple(MAP_KINDS), formats=('png',), car_data=()):
+    """Renders every requested map of one export, returns the files written (None without GPS)."""
+    export = load_export(file_path)
+    if first_channel(export, LATITUDE) is None or first_channel(export, LONGITUDE) is None:
+        return None
+    lap = map_lap(export)
+    lat_name, lon_name = first_channel(lap, LATITUDE), first_channel(lap, LONGITUDE)
+
+    lat = np.asarray(lap[lat_name], dtype=np.float64)
+    lon = np.asarray(lap[lon_name], dtype=np.float64)
+    valid = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon) & (lat != 0) & (lon != 0))
+    # One sample per MAP_STEP of track; segments and basemap are shared by every channel map
+    keep = valid[distance_indices(cumulative_distance(lat[valid], lon[valid]), MAP_STEP)]
+    lat, lon = lat[keep], lon[keep]
+    segments = lap_segments(lat, lon)
+    basemap = load_basemap(lat, lon)
+
+    info = parse_export_filename(file_path)
+    driver = export.metadata.get('racer') or driver_for(info['car'], car_data)
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for kind in kinds:
+        channel = first_channel(lap, MAP_KINDS[kind][0])
+        if channel is None:
+            continue
+        values = np.asarray(lap[channel], dtype=np.float64)[keep]
+        fig = render_map(segments, values, kind, f"Fastest Lap {kind} Visualization\n {driver} - {stem}", basemap)
+        for fmt in formats:
+            path = os.path.join(out_dir, f"{stem}-{kind}.{fmt}")
+            fig.savefig(path, format=fmt)
+            written.append(path)
+    return written
+
+
+# Helper function to map every export to its output folder, mirroring the subfolders of a source folder
+def export_out_dirs(sources, out_dir):
+    out_dirs = {}
+    for source in sources:
+        for path in find_exports([source], recursive=True):
+            sub = os.path.relpath(os.path.dirname(path), source) if os.path.isdir(source) else os.curdir
+            out_dirs.setdefault(path, os.path.normpath(os.path.join(out_dir, sub)))
+    return dict(sorted(out_dirs.items()))
+
+
+def render_event(sources, out_dir, kinds=tuple(MAP_KINDS), formats=('png',), workers=None, car_file=CAR_FILE):
+    """Renders the maps of every export in the sources and their subfolders across a process pool.
+
+    Returns {file: [written paths]} for the rendered files and
+    {file: error message} for the ones that failed. Exports without GPS
+    channels are left out of both.
+    """
+    out_dirs = export_out_dirs(sources, out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    car_data = []
+    if car_file and os.path.exists(car_file):
+        with open(car_file, 'r') as f:
+            car_data = json.load(f)
+
+    results, errors, no_gps = {}, {}, []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {path: pool.submit(render_file, path, path_out, tuple(kinds), tuple(formats), car_data)
+                   for path, path_out in out_dirs.items()}
+        for path, future in futures.items():
+            try:
+                written = future.result()
+            except Exception as e:
+                errors[path] = f"{type(e).__name__}: {e}"
+                continue
+            if written is None:
+                no_gps.append(path)
+            else:
+                results[path] = written
+    if no_gps:
+        print(f"{len(no_gps)} exports without GPS channels skipped")
+    return results, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render coloured track maps for every export in a folder.")
+    parser.add_argument('sources', nargs='+', help="folders (with their subfolders), globs or export files")
+    parser.add_argument('--out', default='track_maps', help="output folder")
+    parser.add_argument('--maps', nargs='+', default=list(MAP_KINDS), choices=list(MAP_KINDS))
+    parser.add_argument('--formats', nargs='+', default=['png'], choices=['png', 'svg'])
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    results, errors = render_event(args.sources, args.out, args.maps, args.formats, args.workers)
+    for path, written in results.items():
+        print(f"{path}: {len(written)} maps")
+    for path, error in errors.items():
+        print(f"{path}: FAILED {error}")
+    return 1 if errors or not results else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
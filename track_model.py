@@ -0,0 +1,302 @@
+## Track model
+#
+# Compiled per-circuit model built once from a reference lap and persisted
+# as an .npz next to the session cache:
+#   - centerline in local East/North metres (geometry.to_enu), resampled every metre
+#   - distance lookup table along the centerline (0 m = entry into SF)
+#   - sector boxes and the distance where each sector starts
+#   - speed-trap / brake-zone gates (boxes plus distance ranges)
+#   - a raster spatial index: every cell of a grid over the circuit holds
+#     the nearest centerline point, so mapping a GPS sample to track
+#     distance is an O(1) lookup plus a local projection, and the sector
+#     is a searchsorted on the sector start distances
+#
+# Circuits are described in circuits.json, several can live side by side.
+
+import json
+import os
+import numpy as np
+import geometry
+import sector_timing
+import session_cache
+
+CIRCUITS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'circuits.json')
+MODEL_VERSION = 2
+
+CENTERLINE_STEP = 1.0    # metres between centerline points
+GRID_CELL = 4.0          # metres per spatial index cell
+GRID_MARGIN = 60.0       # metres of index around the centerline bounding box
+OFF_TRACK = 50.0         # lateral offset (m) beyond which a sample is off track
+
+
+def load_circuits(json_file=CIRCUITS_FILE):
+    """Loads circuit definitions keyed by circuit code."""
+    with open(json_file, 'r') as f:
+        circuits = json.load(f)
+    base = os.path.dirname(os.path.abspath(json_file))
+    for circuit in circuits.values():
+        for key in ('sectors', 'reference'):
+            if circuit.get(key):
+                circuit[key] = os.path.join(base, circuit[key])
+    return circuits
+
+
+def box_bounds(box):
+    """(lat_min, lat_max, long_min, long_max) of a GPS_Lat1/GPS_Long1/GPS_Lat2/GPS_Long2 box."""
+    lat1, lat2 = float(box['GPS_Lat1']), float(box['GPS_Lat2'])
+    long1, long2 = float(box['GPS_Long1']), float(box['GPS_Long2'])
+    return min(lat1, lat2), max(lat1, lat2), min(long1, long2), max(long1, long2)
+
+
+def in_box(lat, lon, bounds):
+    """Vectorised point-in-box test."""
+    lat_min, lat_max, long_min, long_max = bounds
+    return (lat >= lat_min) & (lat <= lat_max) & (lon >= long_min) & (lon <= long_max)
+
+
+def _reference_lap(export):
+    """GPS trace of the longest complete logger lap in a reference export."""
+    lat = np.asarray(export['GPS_Lat'], dtype=np.float64)
+    lon = np.asarray(export['GPS_Long'], dtype=np.float64)
+    if 'Logger_Lap' in export:
+        laps = export['Logger_Lap']
+        values, counts = np.unique(laps, return_counts=True)
+        keep = laps == values[counts.argmax()]
+        lat, lon = lat[keep], lon[keep]
+    valid = (lat != 0) & (lon != 0) & np.isfinite(lat) & np.isfinite(lon)
+    lat, lon = lat[valid], lon[valid]
+    # Drop held GPS fixes
+    changed = np.ones(len(lat), dtype=bool)
+    changed[1:] = (np.diff(lat) != 0) | (np.diff(lon) != 0)
+    return lat[changed], lon[changed]
+
+
+def _resample_closed(x, y, step):
+    """Resamples a closed trace to constant spacing along its length."""
+    x = np.append(x, x[0])
+    y = np.append(y, y[0])
+    s = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))))
+    grid = np.arange(0.0, s[-1], step)
+    return np.interp(grid, s, x), np.interp(grid, s, y), s[-1]
+
+
+def _nearest_raster(cx, cy, x0, y0, shape, cell):
+    """Index of the nearest centerline point for the centre of every grid cell."""
+    ny, nx = shape
+    gx = x0 + (np.arange(nx) + 0.5) * cell
+    gy = y0 + (np.arange(ny) + 0.5) * cell
+    raster = np.empty(shape, dtype=np.int32)
+    rows_per_chunk = max(1, (1 << 22) // (nx * len(cx)) or 1)
+    for r in range(0, ny, rows_per_chunk):
+        yy = gy[r:r + rows_per_chunk, None, None]
+        d2 = (gx[None, :, None] - cx) ** 2 + (yy - cy) ** 2
+        raster[r:r + rows_per_chunk] = d2.argmin(axis=2)
+    return raster
+
+
+class TrackModel:
+    """Compiled circuit: centerline, distance table, sectors, gates and spatial index."""
+
+    def __init__(self, arrays, info):
+        self.arrays = arrays
+        self.info = info
+        self.origin = tuple(arrays['origin'])
+        self.x = arrays['x']
+        self.y = arrays['y']
+        self.distance = arrays['distance']
+        self.lap_length = float(arrays['lap_length'])
+        self.sector_starts = arrays['sector_starts']
+        self.sector_order = arrays['sector_order']
+
+    @property
+    def key(self):
+        return self.info['key']
+
+    @property
+    def sector_names(self):
+        return self.info['sector_names']
+
+    @property
+    def gates(self):
+        return self.info['gates']
+
+    @property
+    def centerline_latlon(self):
+        return geometry.from_enu(self.x, self.y, self.origin)
+
+    def to_xy(self, lat, lon):
+        """GPS to local East/North metres around the circuit origin."""
+        return geometry.to_enu(lat, lon, self.origin)
+
+    def nearest_index(self, x, y):
+        """Nearest centerline point for local coordinates, via the raster index."""
+        x0, y0, cell = self.arrays['grid_origin']
+        raster = self.arrays['grid']
+        col = np.clip(((x - x0) / cell).astype(np.int64), 0, raster.shape[1] - 1)
+        row = np.clip(((y - y0) / cell).astype(np.int64), 0, raster.shape[0] - 1)
+        return raster[row, col]
+
+    def track_distance(self, lat, lon):
+        """Distance along the centerline and lateral offset (m) for GPS samples.
+
+        The raster gives the centerline point nearest to the sample's cell,
+        which can be up to a cell diagonal off the one nearest to the sample;
+        the sample is projected onto every segment within that reach of it
+        for sub-metre distance.
+        """
+        x, y = self.to_xy(lat, lon)
+        n = len(self.x)
+        i = self.nearest_index(x, y)
+        reach = int(np.ceil(self.arrays['grid_origin'][2] * np.sqrt(2) / (self.lap_length / n)))
+
+        best_s = np.zeros(len(x))
+        best_d2 = np.full(len(x), np.inf)
+        for k in range(-reach, reach):
+            a = (i + k) % n
+            b = (i + k + 1) % n
+            ax, ay = self.x[a], self.y[a]
+            dx, dy = self.x[b] - ax, self.y[b] - ay
+            seg2 = dx * dx + dy * dy
+            t = np.clip(((x - ax) * dx + (y - ay) * dy) / np.where(seg2 > 0, seg2, 1.0), 0.0, 1.0)
+            px, py = ax + t * dx, ay + t * dy
+            d2 = (x - px) ** 2 + (y - py) ** 2
+            better = d2 < best_d2
+            best_d2 = np.where(better, d2, best_d2)
+            best_s = np.where(better, self.distance[a] + t * np.sqrt(seg2), best_s)
+        return np.mod(best_s, self.lap_length), np.sqrt(best_d2)
+
+    def sector_at_distance(self, distance):
+        """Index into sector_names of the sector covering each track distance."""
+        slot = np.searchsorted(self.sector_starts, distance, side='right') - 1
+        return self.sector_order[slot % len(self.sector_order)]
+
+    def sector_at(self, lat, lon):
+        """Sector index for GPS samples, -1 when the sample is off track."""
+        distance, offset = self.track_distance(lat, lon)
+        return np.where(offset <= OFF_TRACK, self.sector_at_distance(distance), -1)
+
+    def gate_range(self, name):
+        """(start, end) track distance of a named gate, NaN if it is not on the centerline."""
+        ranges = self.arrays['gate_ranges']
+        return tuple(ranges[self.info['gate_names'].index(name)])
+
+    def gate_mask(self, name, lat, lon):
+        """Samples inside a named gate box (speed_trap, brake_zone, ...)."""
+        return in_box(lat, lon, box_bounds(self.gates[name]))
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, info=json.dumps(self.info), **self.arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files if name != 'info'}
+            info = json.loads(str(data['info']))
+        return cls(arrays, info)
+
+
+def build_track_model(key, circuit, reference_file=None):
+    """Compiles a TrackModel for one circuit from a reference lap."""
+    reference_file = reference_file or circuit.get('reference')
+    if not reference_file:
+        raise ValueError(f"Circuit {key} has no reference lap to build a centerline from")
+
+    lat, lon = _reference_lap(session_cache.load_export(reference_file))
+    origin = (float(lat.mean()), float(lon.mean()))
+    x, y, lap_length = _resample_closed(*geometry.to_enu(lat, lon, origin), CENTERLINE_STEP)
+    c_lat, c_lon = geometry.from_enu(x, y, origin)
+
+    sectors = sector_timing.load_sectors(circuit['sectors']) if circuit.get('sectors') else []
+    sector_names = [s['Sector'] for s in sectors]
+    labels = sector_timing.classify_samples(c_lat, c_lon, sectors) if sectors else np.full(len(x), -1)
+
+    # Put 0 m at the entry into SF so distances line up with sector laps
+    if 'SF' in sector_names and (labels == sector_names.index('SF')).any():
+        sf = sector_names.index('SF')
+        entries = np.flatnonzero((labels == sf) & (np.roll(labels, 1) != sf))
+        shift = entries[0] if len(entries) else np.flatnonzero(labels == sf)[0]
+        x, y, labels = np.roll(x, -shift), np.roll(y, -shift), np.roll(labels, -shift)
+        c_lat, c_lon = geometry.from_enu(x, y, origin)
+    distance = np.arange(len(x)) * CENTERLINE_STEP
+
+    # Sector start distances: forward fill the box labels around the loop
+    if sectors and (labels >= 0).any():
+        last = np.flatnonzero(labels >= 0)[-1]
+        filled = np.concatenate((labels[last:], labels))
+        idx = np.maximum.accumulate(np.where(filled >= 0, np.arange(len(filled)), 0))
+        state = filled[idx][len(labels) - last:]
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(state)) + 1))
+        sector_starts, sector_order = distance[starts], state[starts]
+    else:
+        sector_starts, sector_order = np.zeros(1), np.full(1, -1)
+
+    gate_names = sorted(circuit.get('gates', {}))
+    gate_ranges = np.full((len(gate_names), 2), np.nan)
+    for g, name in enumerate(gate_names):
+        hit = np.flatnonzero(in_box(c_lat, c_lon, box_bounds(circuit['gates'][name])))
+        if len(hit):
+            gate_ranges[g] = distance[hit[0]], distance[hit[-1]]
+
+    x0 = x.min() - GRID_MARGIN
+    y0 = y.min() - GRID_MARGIN
+    shape = (int(np.ceil((y.max() + GRID_MARGIN - y0) / GRID_CELL)),
+             int(np.ceil((x.max() + GRID_MARGIN - x0) / GRID_CELL)))
+    grid = _nearest_raster(x, y, x0, y0, shape, GRID_CELL)
+
+    arrays = {
+        'origin': np.array(origin),
+        'x': x, 'y': y,
+        'distance': distance,
+        'lap_length': np.array(lap_length),
+        'sector_starts': sector_starts,
+        'sector_order': sector_order,
+        'gate_ranges': gate_ranges,
+        'grid_origin': np.array([x0, y0, GRID_CELL]),
+        'grid': grid,
+    }
+    info = {
+        'key': key,
+        'name': circuit.get('name', key),
+        'sector_names': sector_names,
+        'gates': circuit.get('gates', {}),
+        'gate_names': gate_names,
+        'reference': os.path.abspath(reference_file),
+    }
+    return TrackModel(arrays, info)
+
+
+def model_path(key, reference_file):
+    source_hash = session_cache.content_hash(reference_file)
+    return os.path.join(session_cache.cache_dir(), f"circuit-{key}-{source_hash}-v{MODEL_VERSION}.npz")
+
+
+def load_track_model(key, reference_file=None, circuits=None):
+    """Returns the compiled model for a circuit, building and persisting it on first use."""
+    circuits = circuits or load_circuits()
+    circuit = circuits[key]
+    reference_file = reference_file or circuit.get('reference')
+    if not reference_file:
+        raise ValueError(f"Circuit {key} has no reference lap to build a centerline from")
+
+    path = model_path(key, reference_file)
+    if os.path.exists(path):
+        return TrackModel.load(path)
+
+    model = build_track_model(key, circuit, reference_file)
+    os.makedirs(session_cache.cache_dir(), exist_ok=True)
+    model.save(path)
+    return model
+
+
+def circuit_gate(key, name, circuits=None):
+    """Bounds of a named gate box for a circuit, no centerline needed."""
+    circuits = circuits or load_circuits()
+    return box_bounds(circuits[key]['gates'][name])
+
+
+def circuit_gates(key, circuits=None):
+    """Bounds of every gate box of a circuit, keyed by gate name."""
+    circuits = circuits or load_circuits()
+    return {name: box_bounds(box) for name, box in circuits[key]['gates'].items()}